@@ -0,0 +1,105 @@
+"""Medir el tiempo de arranque de la interfaz: primer pintado y motor listo.
+
+Uso:
+    python benchmarks/bench_arranque.py --repeticiones 5
+    python benchmarks/bench_arranque.py --guardar-referencia benchmarks/arranque.json
+    python benchmarks/bench_arranque.py --referencia benchmarks/arranque.json --tolerancia 0.2
+
+Cada repetición arranca un proceso nuevo (con la plataforma Qt "offscreen" por
+defecto) y mide, desde el inicio del proceso, cuándo se pinta la ventana por
+primera vez y cuándo termina la precarga del motor por defecto. Con
+--referencia, sale con código 1 si la mediana empeora más que la tolerancia.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+CODIGO_HIJO = r"""
+import json, os, sys, time
+inicio = time.perf_counter()
+sys.path.insert(0, os.environ["RAIZ_REMOVER_FONDO"])
+os.chdir(os.environ["RAIZ_REMOVER_FONDO"])
+import interfaz_grafica
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication
+importado = time.perf_counter() - inicio
+tiempos = {"importacion": importado}
+app = QApplication(sys.argv)
+ventana = interfaz_grafica.BackgroundRemoverGUI()
+
+def al_pintar():
+    tiempos["primer_pintado"] = time.perf_counter() - inicio
+    ventana.iniciar_precarga()
+
+def al_estar_listo(ok):
+    tiempos["motor_listo"] = time.perf_counter() - inicio
+    tiempos["motor_ok"] = ok
+    app.quit()
+
+ventana.primer_pintado.connect(al_pintar)
+ventana.motor_listo.connect(al_estar_listo)
+ventana.show()
+QTimer.singleShot(int(float(os.environ.get("LIMITE_ARRANQUE", "120")) * 1000), app.quit)
+app.exec()
+print(json.dumps(tiempos))
+"""
+
+METRICAS = ("importacion", "primer_pintado", "motor_listo")
+
+
+def medir_una_vez(plataforma):
+    entorno = dict(os.environ, RAIZ_REMOVER_FONDO=str(RAIZ))
+    if plataforma:
+        entorno["QT_QPA_PLATFORM"] = plataforma
+    salida = subprocess.run([sys.executable, "-c", CODIGO_HIJO], env=entorno,
+                            capture_output=True, text=True, check=True)
+    # La última línea es el JSON; antes puede haber mensajes de los motores
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--plataforma", default="offscreen",
+                        help="Plataforma Qt (vacío para usar la del sistema)")
+    parser.add_argument("--referencia", help="JSON con medianas de referencia")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Empeoramiento relativo permitido frente a la referencia")
+    parser.add_argument("--guardar-referencia", help="Guardar las medianas en este JSON")
+    args = parser.parse_args(argv)
+
+    medidas = [medir_una_vez(args.plataforma) for _ in range(args.repeticiones)]
+    medianas = {}
+    for metrica in METRICAS:
+        valores = [m[metrica] for m in medidas if metrica in m]
+        if valores:
+            medianas[metrica] = statistics.median(valores)
+            print(f"{metrica:<15} mediana {medianas[metrica]:.3f} s  (min {min(valores):.3f}, max {max(valores):.3f})")
+    if not all(m.get("motor_ok") for m in medidas):
+        print("Aviso: el motor por defecto no pudo cargarse en alguna repetición")
+
+    if args.guardar_referencia:
+        with open(args.guardar_referencia, "w", encoding="utf-8") as f:
+            json.dump(medianas, f, indent=2)
+
+    if args.referencia:
+        with open(args.referencia, "r", encoding="utf-8") as f:
+            referencia = json.load(f)
+        regresiones = [
+            metrica for metrica, valor in medianas.items()
+            if metrica in referencia and valor > referencia[metrica] * (1 + args.tolerancia)
+        ]
+        for metrica in regresiones:
+            print(f"REGRESIÓN en {metrica}: {medianas[metrica]:.3f} s frente a {referencia[metrica]:.3f} s")
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
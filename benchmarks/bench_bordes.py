@@ -0,0 +1,125 @@
+"""Refinado del contorno en banda estrecha: coste y calidad por motor y tamaño.
+
+Uso:
+    python benchmarks/bench_bordes.py --megapixeles 0.3 2 8 --salida bordes.json
+    python benchmarks/bench_bordes.py --motores opencv --bandas 4 6 10 --completo
+
+Para cada motor disponible y cada imagen sintética se obtiene la máscara del
+motor y se mide refinado.refinar_borde con cada semiancho de banda: tiempo,
+bloques procesados y fracción de la imagen en la banda incierta. La calidad se
+compara con el alfa real del sujeto (la máscara dibujada con el mismo
+desenfoque que la imagen): IoU, error medio del alfa en toda la imagen y
+error medio dentro de la banda, antes y después del refinado. Con --completo
+se mide además el mismo filtro guiado aplicado a la imagen entera, para ver
+que el coste del refinado sigue a la longitud del borde y no al área.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+from benchmarks.sinteticas import comparar, imagen_sintetica  # noqa: E402
+from refinado import (BANDA_BORDE, bloques_borde, filtro_guiado_color, refinar_borde,  # noqa: E402
+                      trimapa)
+
+MOTORES = ("rembg", "mediapipe", "opencv")
+
+
+def calidad(referencia, mask, banda):
+    """IoU, error medio del alfa y error medio dentro de la banda incierta"""
+    iou, error = comparar(referencia, mask)
+    diferencia = np.abs(referencia.astype(np.int16) - mask.astype(np.int16))
+    return {"iou": iou, "error_alfa": error,
+            "error_banda": float(diferencia[banda].mean()) if banda.any() else 0.0}
+
+
+def medir(motor, image, referencia, bandas, completo):
+    inicio = time.perf_counter()
+    try:
+        mask = motor.segmentar(image)
+    except Exception as e:
+        return {"error": str(e)}
+    resultado = {"segmentar_s": time.perf_counter() - inicio, "variantes": []}
+
+    for banda in bandas:
+        incierta = trimapa(mask, banda) == 128
+        inicio = time.perf_counter()
+        refinada = refinar_borde(mask, image, banda=banda)
+        resultado["variantes"].append({
+            "banda": banda,
+            "segundos": time.perf_counter() - inicio,
+            "bloques": len(bloques_borde(mask, banda)),
+            "fraccion_banda": float(incierta.mean()),
+            "antes": calidad(referencia, mask, incierta),
+            "despues": calidad(referencia, refinada, incierta),
+        })
+
+    if completo:
+        incierta = trimapa(mask, bandas[0]) == 128
+        inicio = time.perf_counter()
+        rgb = np.asarray(image.convert('RGB'))
+        entera = (filtro_guiado_color(rgb, mask.astype(np.float32) / 255.0) * 255.0 + 0.5).astype(np.uint8)
+        resultado["imagen_completa"] = {"segundos": time.perf_counter() - inicio,
+                                        "calidad": calidad(referencia, entera, incierta)}
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixeles", type=float, nargs="+", default=[0.3, 2.0, 8.0])
+    parser.add_argument("--motores", nargs="+", choices=MOTORES, default=list(MOTORES))
+    parser.add_argument("--bandas", type=int, nargs="+", default=[BANDA_BORDE],
+                        help="Semianchos de banda (px) a probar")
+    parser.add_argument("--completo", action="store_true",
+                        help="Medir también el filtro guiado sobre la imagen entera")
+    parser.add_argument("--salida", default=None, help="Guardar los resultados en este JSON")
+    args = parser.parse_args(argv)
+
+    from motores import obtener_selector
+
+    selector = obtener_selector()
+    resultados = []
+    print(f"{'MP':>5} {'motor':<10} {'banda':>5} {'ms':>8} {'bloques':>7} {'%banda':>7} "
+          f"{'IoU':>13} {'err':>13} {'err banda':>13}")
+    for megapixeles in args.megapixeles:
+        image, dibujada = imagen_sintetica(megapixeles)
+        # El alfa real del borde: la imagen sintética lleva un desenfoque de 1 px
+        referencia = cv2.GaussianBlur(dibujada, (0, 0), 1)
+        for nombre in args.motores:
+            motor = selector.motores[nombre]
+            datos = medir(motor, image, referencia, args.bandas, args.completo) if motor.disponible() \
+                else {"error": "no disponible"}
+            datos.update({"megapixeles": megapixeles, "motor": nombre})
+            resultados.append(datos)
+            if "error" in datos:
+                print(f"{megapixeles:>5.1f} {nombre:<10} error: {datos['error']}")
+                continue
+            for variante in datos["variantes"]:
+                antes, despues = variante["antes"], variante["despues"]
+                print(f"{megapixeles:>5.1f} {nombre:<10} {variante['banda']:>5} "
+                      f"{variante['segundos'] * 1000:>8.1f} {variante['bloques']:>7} "
+                      f"{variante['fraccion_banda'] * 100:>6.2f}% "
+                      f"{antes['iou']:.3f}→{despues['iou']:.3f} "
+                      f"{antes['error_alfa']:>5.2f}→{despues['error_alfa']:<5.2f} "
+                      f"{antes['error_banda']:>5.1f}→{despues['error_banda']:<5.1f}")
+            if "imagen_completa" in datos:
+                entera = datos["imagen_completa"]
+                print(f"{megapixeles:>5.1f} {nombre:<10} {'todo':>5} {entera['segundos'] * 1000:>8.1f} "
+                      f"{'':>7} {'':>7} {entera['calidad']['iou']:>13.3f} "
+                      f"{entera['calidad']['error_alfa']:>13.2f} {entera['calidad']['error_banda']:>13.1f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"cpu": os.cpu_count(), "resultados": resultados}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
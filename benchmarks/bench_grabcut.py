@@ -0,0 +1,53 @@
+"""Compromiso latencia/calidad de GrabCut: resolución completa frente al camino rápido.
+
+Uso:
+    python benchmarks/bench_grabcut.py --megapixeles 0.3 2 --lados 320 640 1024 --iteraciones 1 3 5
+
+Para cada imagen sintética mide GrabCut a resolución completa (5 iteraciones,
+el comportamiento clásico) y el camino rápido con cada combinación de lado de
+inferencia e iteraciones. La calidad se da como IoU y error medio del alfa
+frente a la máscara real del sujeto dibujado. --sin-completa omite la
+referencia a resolución completa, que puede tardar minutos en imágenes grandes.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.sinteticas import comparar, imagen_sintetica  # noqa: E402
+from motores import mascara_opencv, mascara_opencv_rapida  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixeles", type=float, nargs="+", default=[0.3, 2.0])
+    parser.add_argument("--lados", type=int, nargs="+", default=[320, 640, 1024])
+    parser.add_argument("--iteraciones", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--sin-completa", action="store_true")
+    args = parser.parse_args(argv)
+
+    print(f"{'MP':>5} {'modo':<22} {'segundos':>9} {'IoU':>6} {'err':>6}")
+    for megapixeles in args.megapixeles:
+        image, real = imagen_sintetica(megapixeles)
+        casos = []
+        if not args.sin_completa:
+            casos.append(("completa, 5 it", lambda: mascara_opencv(image, 5, lado=None)))
+        for lado in args.lados:
+            if lado >= max(image.size):
+                continue
+            for iteraciones in args.iteraciones:
+                casos.append((f"rápida {lado} px, {iteraciones} it",
+                              lambda lado=lado, it=iteraciones: mascara_opencv_rapida(image, it, lado)))
+
+        for nombre, funcion in casos:
+            inicio = time.perf_counter()
+            mask = funcion()
+            segundos = time.perf_counter() - inicio
+            iou, error = comparar(real, mask)
+            print(f"{megapixeles:>5.1f} {nombre:<22} {segundos:>9.3f} {iou:>6.3f} {error:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
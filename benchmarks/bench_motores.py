@@ -0,0 +1,258 @@
+"""Benchmark de todos los motores por tamaño de imagen, en CPU y sin red.
+
+Uso:
+    python benchmarks/bench_motores.py --megapixeles 0.3 2 12 48 --salida resultados.json
+    python benchmarks/bench_motores.py --guardar-referencia benchmarks/motores.json
+    python benchmarks/bench_motores.py --referencia benchmarks/motores.json --tolerancia 0.2
+
+Para cada motor, tamaño y variante (con y sin alfa de origen) se arranca un
+proceso nuevo que llama a procesar_imagen (sin caché) con un Cronometro, así
+que las etapas son las de instrumentacion.ETAPAS y los tiempos se comparan
+directamente con los del registro de tiempos (REMOVER_FONDO_TIEMPOS) y el
+historial. La primera pasada da la latencia en frío (incluye importar el
+motor y cargar el modelo) y las siguientes la latencia en caliente. De cada
+etapa se anota el tiempo y el pico de RSS del proceso al terminarla.
+
+Con --procesos se mide además el rendimiento (img/s) de procesar_lote con
+distinto número de procesos. Los resultados se escriben en JSON y, con
+--referencia, el script sale con código 1 si alguna métrica empeora más que
+la tolerancia. La referencia depende de la máquina y no se incluye en el
+repositorio: se crea una vez con --guardar-referencia en la máquina donde se
+vayan a comparar los resultados (la segunda línea de Uso) y se vuelve a crear
+cuando un cambio mejora los tiempos a propósito. rembg necesita el modelo ya
+descargado en su carpeta de modelos (U2NET_HOME); si no está, el motor se
+anota con el error.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+MOTORES = ("rembg", "mediapipe", "opencv")
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso (ru_maxrss va en KiB en Linux y en bytes en macOS)"""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 2**20 if sys.platform == "darwin" else pico / 2**10
+
+
+def pasada(ruta, motor, modelo, lado):
+    """Ejecutar una vez procesar_imagen; devuelve {etapa: (segundos, rss_mb)}"""
+    from instrumentacion import Cronometro
+    from remover_fondo import procesar_imagen
+
+    rss = {}
+    anterior = []
+
+    def al_cambiar(etapa):
+        # ru_maxrss es el pico desde el arranque: al empezar una etapa, el de la anterior
+        if anterior:
+            rss[anterior[-1]] = rss_pico_mb()
+        anterior.append(etapa)
+
+    # Sin historial: las pasadas del benchmark no deben mover las estimaciones del usuario
+    cronometro = Cronometro(al_cambiar=al_cambiar, variante=motor)
+    with tempfile.TemporaryDirectory() as directorio:
+        resultado = procesar_imagen(ruta, Path(directorio) / "salida.png", modelo, lado_inferencia=lado,
+                                    usar_cache=False, politica=motor, cronometro=cronometro)
+    if anterior:
+        rss[anterior[-1]] = rss_pico_mb()
+    return {etapa: (segundos, rss[etapa]) for etapa, segundos in resultado["etapas"].items()}
+
+
+def medir_en_hijo(ruta, nombre_motor, modelo, lado, repeticiones):
+    """Código del proceso hijo: una pasada en frío y varias en caliente"""
+    from instrumentacion import ETAPAS
+    from motores import obtener_selector
+
+    if not obtener_selector().motores[nombre_motor].disponible():
+        return {"error": "no disponible"}
+    base = rss_pico_mb()
+    inicio = time.perf_counter()
+    try:
+        fria = pasada(ruta, nombre_motor, modelo, lado)
+    except Exception as e:
+        return {"error": str(e)}
+    resultado = {
+        "frio_s": time.perf_counter() - inicio,
+        "rss_base_mb": base,
+        "etapas_frio": {nombre: {"segundos": s, "rss_pico_mb": r} for nombre, (s, r) in fria.items()},
+    }
+    calientes = [pasada(ruta, nombre_motor, modelo, lado) for _ in range(repeticiones)]
+    if calientes:
+        resultado["caliente_s"] = statistics.median(sum(s for s, _ in p.values()) for p in calientes)
+        resultado["etapas"] = {
+            nombre: {
+                "segundos": statistics.median(p[nombre][0] for p in calientes),
+                "rss_pico_mb": max(p[nombre][1] for p in calientes),
+            }
+            for nombre in ETAPAS if nombre in calientes[0]
+        }
+    resultado["rss_pico_mb"] = rss_pico_mb()
+    return resultado
+
+
+def medir_motor(ruta, motor, modelo, lado, repeticiones):
+    """Medir en un proceso nuevo para que la latencia en frío y el RSS sean reales"""
+    orden = [sys.executable, __file__, "--hijo", str(ruta), motor, modelo, str(lado), str(repeticiones)]
+    salida = subprocess.run(orden, capture_output=True, text=True)
+    lineas = salida.stdout.strip().splitlines()
+    if salida.returncode != 0 or not lineas:
+        return {"error": (salida.stderr.strip().splitlines() or ["sin salida"])[-1]}
+    # La última línea es el JSON; antes puede haber mensajes de los motores
+    return json.loads(lineas[-1])
+
+
+def medir_rendimiento(directorio, motor, modelo, lado, procesos):
+    """img/s de procesar_lote sobre las imágenes del directorio"""
+    from lote import procesar_lote
+
+    with tempfile.TemporaryDirectory() as salida:
+        resumen = procesar_lote(directorio, salida, procesos=procesos, reanudar=False,
+                                modelo=modelo, lado_inferencia=lado, usar_cache=False,
+                                politica=motor)
+    return {"imagenes_por_segundo": resumen["imagenes_por_segundo"],
+            "errores": resumen["errores"]}
+
+
+def guardar_sintetica(directorio, megapixeles, con_alfa, semilla=0):
+    """JPEG para las imágenes sin alfa y PNG para las que lo tienen, como en la práctica"""
+    from benchmarks.sinteticas import imagen_sintetica
+
+    image, _ = imagen_sintetica(megapixeles, semilla, con_alfa)
+    sufijo = "png" if con_alfa else "jpg"
+    ruta = Path(directorio) / f"sintetica_{megapixeles:g}mp_{semilla}.{sufijo}"
+    image.save(ruta, quality=95)
+    return ruta
+
+
+def aplanar(resultados):
+    """Métricas comparables con la referencia: {"motor/MP/variante/métrica": valor}"""
+    planas = {}
+    for fila in resultados["latencia"]:
+        prefijo = f"{fila['motor']}/{fila['megapixeles']:g}/{'alfa' if fila['con_alfa'] else 'rgb'}"
+        for metrica in ("frio_s", "caliente_s", "rss_pico_mb"):
+            if metrica in fila:
+                planas[f"{prefijo}/{metrica}"] = fila[metrica]
+        for etapa, datos in fila.get("etapas", {}).items():
+            planas[f"{prefijo}/{etapa}_s"] = datos["segundos"]
+    for fila in resultados["rendimiento"]:
+        # Menos img/s es peor: se guarda como segundos por imagen
+        if fila.get("imagenes_por_segundo"):
+            planas[f"{fila['motor']}/lote/{fila['procesos']}p/s_por_img"] = 1 / fila["imagenes_por_segundo"]
+    return planas
+
+
+def regresiones(actuales, referencia, tolerancia):
+    return [
+        (clave, valor, referencia[clave]) for clave, valor in sorted(actuales.items())
+        if clave in referencia and valor > referencia[clave] * (1 + tolerancia)
+    ]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "--hijo":
+        ruta, motor, modelo, lado, repeticiones = argv[1:6]
+        print(json.dumps(medir_en_hijo(ruta, motor, modelo, int(lado), int(repeticiones))))
+        return 0
+
+    from sesiones import MODELO_POR_DEFECTO
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixeles", type=float, nargs="+", default=[0.3, 2.0, 12.0, 48.0])
+    parser.add_argument("--motores", nargs="+", default=list(MOTORES), choices=MOTORES)
+    parser.add_argument("--alfa", choices=["no", "si", "ambos"], default="ambos",
+                        help="Variantes con alfa de origen (PNG RGBA) y sin él (JPEG)")
+    parser.add_argument("--modelo", default=MODELO_POR_DEFECTO)
+    parser.add_argument("--lado", type=int, default=1024, help="Lado mayor de inferencia")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Pasadas en caliente por medida")
+    parser.add_argument("--procesos", type=int, nargs="*", default=[1, 2, 4],
+                        help="Número de procesos para medir el rendimiento del lote (vacío para omitirlo)")
+    parser.add_argument("--imagenes-lote", type=int, default=8)
+    parser.add_argument("--megapixeles-lote", type=float, default=2.0)
+    parser.add_argument("--salida", help="Escribir los resultados en este JSON")
+    parser.add_argument("--referencia", help="JSON de resultados con el que comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25,
+                        help="Empeoramiento relativo permitido frente a la referencia")
+    parser.add_argument("--guardar-referencia", help="Guardar los resultados como nueva referencia")
+    args = parser.parse_args(argv)
+
+    variantes = {"no": [False], "si": [True], "ambos": [False, True]}[args.alfa]
+    resultados = {
+        "maquina": {"python": platform.python_version(), "sistema": platform.platform(),
+                    "cpus": os.cpu_count()},
+        "parametros": {"modelo": args.modelo, "lado": args.lado, "repeticiones": args.repeticiones},
+        "latencia": [],
+        "rendimiento": [],
+    }
+
+    with tempfile.TemporaryDirectory() as directorio:
+        print(f"{'motor':<10} {'MP':>5} {'alfa':>4} {'frío s':>8} {'caliente s':>11} {'RSS MiB':>8}  etapas (s)")
+        for megapixeles in args.megapixeles:
+            for con_alfa in variantes:
+                ruta = guardar_sintetica(directorio, megapixeles, con_alfa)
+                for motor in args.motores:
+                    fila = {"motor": motor, "megapixeles": megapixeles, "con_alfa": con_alfa}
+                    fila.update(medir_motor(ruta, motor, args.modelo, args.lado, args.repeticiones))
+                    resultados["latencia"].append(fila)
+                    if "error" in fila:
+                        print(f"{motor:<10} {megapixeles:>5g} {'sí' if con_alfa else 'no':>4} {fila['error']}")
+                        continue
+                    etapas = " ".join(f"{nombre[:5]} {datos['segundos']:.3f}"
+                                      for nombre, datos in fila.get("etapas", fila["etapas_frio"]).items())
+                    print(f"{motor:<10} {megapixeles:>5g} {'sí' if con_alfa else 'no':>4} "
+                          f"{fila['frio_s']:>8.3f} {fila.get('caliente_s', float('nan')):>11.3f} "
+                          f"{fila['rss_pico_mb']:>8.0f}  {etapas}")
+                os.remove(ruta)
+
+        if args.procesos:
+            lote = Path(directorio) / "lote"
+            lote.mkdir()
+            for semilla in range(args.imagenes_lote):
+                guardar_sintetica(lote, args.megapixeles_lote, False, semilla)
+            print(f"\nRendimiento del lote ({args.imagenes_lote} imágenes de {args.megapixeles_lote:g} MP)")
+            fallidos = {fila["motor"] for fila in resultados["latencia"] if "error" in fila}
+            for motor in args.motores:
+                if motor in fallidos:
+                    continue
+                for procesos in args.procesos:
+                    fila = {"motor": motor, "procesos": procesos}
+                    fila.update(medir_rendimiento(lote, motor, args.modelo, args.lado, procesos))
+                    resultados["rendimiento"].append(fila)
+                    print(f"{motor:<10} {procesos:>2} procesos: {fila['imagenes_por_segundo']:.2f} img/s")
+
+    resultados["metricas"] = aplanar(resultados)
+    for ruta_json in (args.salida, args.guardar_referencia):
+        if ruta_json:
+            with open(ruta_json, "w", encoding="utf-8") as f:
+                json.dump(resultados, f, indent=2, ensure_ascii=False)
+
+    if args.referencia:
+        try:
+            with open(args.referencia, "r", encoding="utf-8") as f:
+                referencia = json.load(f)["metricas"]
+        except FileNotFoundError:
+            print(f"No existe la referencia {args.referencia}; créala en esta máquina con "
+                  f"--guardar-referencia {args.referencia}")
+            return 2
+        encontradas = regresiones(resultados["metricas"], referencia, args.tolerancia)
+        for clave, valor, previo in encontradas:
+            print(f"REGRESIÓN en {clave}: {valor:.3f} frente a {previo:.3f}")
+        return 1 if encontradas else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
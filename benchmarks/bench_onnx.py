@@ -0,0 +1,120 @@
+"""Comparar ajustes de onnxruntime y la variante INT8 frente a FP32 en CPU.
+
+Uso:
+    python benchmarks/bench_onnx.py --modelo u2netp --hilos 1 2 4 --salida onnx.json
+    python benchmarks/bench_onnx.py --imagenes fotos/*.jpg --optimizacion basica todas --cache
+
+Para cada variante (precisión FP32 o INT8, hilos intra-operación y nivel de
+optimización) se crea un registro de sesiones nuevo con esos AjustesOnnx y se
+mide el tiempo de carga del modelo y la latencia de inferencia (mediana y
+media tras una pasada de calentamiento). Las máscaras de cada variante se
+comparan con las de la primera variante FP32 (IoU y error medio del alfa), de
+modo que el coste en calidad de INT8 queda junto a su ganancia en velocidad.
+Sin --imagenes se usan imágenes sintéticas. El modelo debe estar ya descargado
+y la cuantización necesita el paquete onnx; si una variante falla, se anota el
+error.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.sinteticas import comparar, imagen_sintetica  # noqa: E402
+from sesiones import NIVELES_OPTIMIZACION, AjustesOnnx, RegistroSesiones  # noqa: E402
+
+
+def medir_variante(ajustes, modelo, imagenes, repeticiones):
+    """Carga, latencias y máscaras de una variante con un registro propio"""
+    registro = RegistroSesiones(max_sesiones=1, ajustes=ajustes)
+    inicio = time.perf_counter()
+    try:
+        registro.obtener(modelo)
+    except Exception as e:
+        return {"error": str(e)}, None
+    resultado = {"carga_s": time.perf_counter() - inicio}
+
+    masks = [registro.inferir(image, modelo, only_mask=True) for image in imagenes]
+    latencias = []
+    for _ in range(repeticiones):
+        for image in imagenes:
+            inicio = time.perf_counter()
+            registro.inferir(image, modelo, only_mask=True)
+            latencias.append(time.perf_counter() - inicio)
+    resultado.update({
+        "latencia_p50_s": statistics.median(latencias),
+        "latencia_media_s": statistics.fmean(latencias),
+        "imagenes_por_segundo": len(latencias) / sum(latencias),
+    })
+    return resultado, [_como_array(mask) for mask in masks]
+
+
+def _como_array(mask):
+    import numpy as np
+
+    return np.asarray(mask.convert('L') if hasattr(mask, "convert") else mask)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modelo", default="u2netp", help="Modelo de la familia U2-Net")
+    parser.add_argument("--imagenes", nargs="*", default=None, help="Imágenes reales a usar")
+    parser.add_argument("--megapixeles", type=float, default=1.0)
+    parser.add_argument("--sinteticas", type=int, default=3, help="Imágenes sintéticas si no hay --imagenes")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--hilos", type=int, nargs="+", default=[0],
+                        help="Hilos intra-operación a probar (0: automático)")
+    parser.add_argument("--optimizacion", nargs="+", choices=NIVELES_OPTIMIZACION, default=["todas"])
+    parser.add_argument("--cache", action="store_true", help="Medir también con el modelo optimizado en caché")
+    parser.add_argument("--sin-int8", action="store_true", help="Medir solo FP32")
+    parser.add_argument("--salida", default=None, help="Guardar los resultados en este JSON")
+    args = parser.parse_args(argv)
+
+    from PIL import Image
+
+    if args.imagenes:
+        imagenes = [Image.open(ruta).convert('RGB') for ruta in args.imagenes]
+    else:
+        imagenes = [imagen_sintetica(args.megapixeles, semilla)[0] for semilla in range(args.sinteticas)]
+
+    precisiones = [False] if args.sin_int8 else [False, True]
+    variantes = [
+        AjustesOnnx(hilos_intra=hilos, optimizacion=nivel, cache_optimizado=args.cache, int8=int8)
+        for int8 in precisiones for nivel in args.optimizacion for hilos in args.hilos
+    ]
+
+    referencia = None
+    resultados = []
+    for ajustes in variantes:
+        datos, masks = medir_variante(ajustes, args.modelo, imagenes, args.repeticiones)
+        datos.update({"precision": "int8" if ajustes.int8 else "fp32", "hilos": ajustes.hilos_intra,
+                      "optimizacion": ajustes.optimizacion, "cache": ajustes.cache_optimizado})
+        if masks is not None:
+            if referencia is None:
+                referencia = masks
+            metricas = [comparar(ref, mask) for ref, mask in zip(referencia, masks)]
+            datos["iou_vs_fp32"] = min(iou for iou, _ in metricas)
+            datos["error_alfa_vs_fp32"] = statistics.fmean(error for _, error in metricas)
+        resultados.append(datos)
+
+        nombre = f"{datos['precision']} hilos={datos['hilos'] or 'auto'} opt={datos['optimizacion']}"
+        if "error" in datos:
+            print(f"{nombre:<40} error: {datos['error']}")
+        else:
+            print(f"{nombre:<40} carga {datos['carga_s']:6.2f} s  p50 {datos['latencia_p50_s']:6.3f} s  "
+                  f"{datos['imagenes_por_segundo']:5.2f} img/s  IoU {datos['iou_vs_fp32']:.4f}  "
+                  f"error {datos['error_alfa_vs_fp32']:.2f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"modelo": args.modelo, "cpu": os.cpu_count(), "imagenes": len(imagenes),
+                       "variantes": resultados}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Comparar la segmentación a resolución completa con la de grueso a fino.
+
+Uso:
+    python benchmarks/bench_resolucion.py --megapixeles 0.3 2 12 --lado 1024
+
+Genera imágenes sintéticas (no necesita red ni GPU) y, para cada motor
+disponible, mide la latencia y el pico de memoria asignada de ambos caminos,
+así como el IoU y el error medio del alfa frente a la máscara completa.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.sinteticas import comparar, imagen_sintetica  # noqa: E402
+from motores import mascara_mediapipe, mascara_opencv, mascara_rembg  # noqa: E402
+from refinado import escalar_mascara_guiada, reducir_para_inferencia  # noqa: E402
+
+MOTORES = {
+    "rembg": mascara_rembg,
+    "mediapipe": mascara_mediapipe,
+    # GrabCut a resolución completa: el camino rápido propio se mide en bench_grabcut.py
+    "opencv": lambda image: mascara_opencv(image, lado=None),
+}
+
+
+def medir(funcion):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, segundos, pico / 2**20
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixeles", type=float, nargs="+", default=[0.3, 2.0])
+    parser.add_argument("--lado", type=int, default=1024, help="Lado mayor de inferencia")
+    parser.add_argument("--motores", nargs="+", default=list(MOTORES), choices=list(MOTORES))
+    args = parser.parse_args(argv)
+
+    print(f"{'motor':<10} {'MP':>6} {'completa s':>11} {'MiB':>7} {'reducida s':>11} {'MiB':>7} {'IoU':>6} {'err':>6}")
+    for megapixeles in args.megapixeles:
+        image, _ = imagen_sintetica(megapixeles)
+        for nombre in args.motores:
+            motor = MOTORES[nombre]
+            try:
+                completa, t_completa, m_completa = medir(lambda: motor(image))
+            except Exception as e:
+                print(f"{nombre:<10} {megapixeles:>6.1f} no disponible: {e}")
+                continue
+
+            def grueso_a_fino():
+                reducida = reducir_para_inferencia(image, args.lado)
+                return escalar_mascara_guiada(motor(reducida), image)
+
+            fina, t_fina, m_fina = medir(grueso_a_fino)
+            iou, error = comparar(completa, fina)
+            print(f"{nombre:<10} {megapixeles:>6.1f} {t_completa:>11.3f} {m_completa:>7.1f} "
+                  f"{t_fina:>11.3f} {m_fina:>7.1f} {iou:>6.3f} {error:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
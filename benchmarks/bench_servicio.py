@@ -0,0 +1,93 @@
+"""Medir el servicio HTTP local con varios clientes concurrentes.
+
+Uso:
+    python benchmarks/bench_servicio.py --peticiones 32 --clientes 8 --max-lote 4
+    python benchmarks/bench_servicio.py --socket /tmp/remover_fondo.sock --motor opencv
+
+Si no se indica --puerto-existente, arranca el servicio en este mismo proceso
+(en un puerto libre de localhost o en el socket Unix indicado) y le envía
+imágenes sintéticas desde varios hilos. Informa de la latencia vista por el
+cliente, del rendimiento, de las peticiones rechazadas por la cola (503) y de
+las métricas del propio servicio, incluido el tamaño medio de lote.
+"""
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.sinteticas import imagen_sintetica  # noqa: E402
+from servicio import (ServicioInferencia, conectar, crear_servidor,  # noqa: E402
+                      eliminar_fondo_remoto, percentil)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peticiones", type=int, default=32)
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--megapixeles", type=float, default=0.3)
+    parser.add_argument("--motor", default="secuencial")
+    parser.add_argument("--lado", type=int, default=None)
+    parser.add_argument("--max-cola", type=int, default=32)
+    parser.add_argument("--max-lote", type=int, default=4)
+    parser.add_argument("--espera-lote", type=float, default=0.01)
+    parser.add_argument("--socket", default=None, help="Usar un socket Unix en lugar de TCP")
+    parser.add_argument("--puerto-existente", type=int, default=None,
+                        help="Medir un servicio ya arrancado en este puerto")
+    args = parser.parse_args(argv)
+
+    servidor = None
+    puerto = args.puerto_existente
+    if puerto is None:
+        servicio = ServicioInferencia(politica=args.motor, max_cola=args.max_cola,
+                                      max_lote=args.max_lote, espera_lote=args.espera_lote)
+        servidor = crear_servidor(servicio, puerto=0, ruta_socket=args.socket)
+        puerto = 0 if args.socket else servidor.server_port
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    buffer = io.BytesIO()
+    imagen_sintetica(args.megapixeles)[0].save(buffer, format="JPEG", quality=90)
+    datos = buffer.getvalue()
+    locales = threading.local()
+
+    def una_peticion(_):
+        if not hasattr(locales, "conexion"):
+            locales.conexion = conectar(puerto=puerto, ruta_socket=args.socket)
+        inicio = time.perf_counter()
+        estado, _, cabeceras = eliminar_fondo_remoto(datos, locales.conexion, motor=args.motor, lado=args.lado)
+        return estado, time.perf_counter() - inicio, cabeceras.get("X-Motor")
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clientes) as pool:
+        resultados = list(pool.map(una_peticion, range(args.peticiones)))
+    segundos = time.perf_counter() - inicio
+
+    correctas = [latencia for estado, latencia, _ in resultados if estado == 200]
+    rechazadas = sum(1 for estado, _, _ in resultados if estado == 503)
+    print(f"{len(correctas)} correctas, {rechazadas} rechazadas (503), "
+          f"{len(resultados) - len(correctas) - rechazadas} con error en {segundos:.2f} s "
+          f"({len(correctas) / segundos:.2f} img/s)")
+    print(f"Latencia cliente: p50 {percentil(correctas, 0.5):.3f} s, p95 {percentil(correctas, 0.95):.3f} s")
+    motores = {}
+    for _, _, motor in resultados:
+        motores[motor] = motores.get(motor, 0) + 1
+    print("Motores: " + ", ".join(f"{motor} {n}" for motor, n in motores.items()))
+
+    conexion = conectar(puerto=puerto, ruta_socket=args.socket)
+    conexion.request("GET", "/metricas")
+    metricas = json.loads(conexion.getresponse().read())
+    metricas.pop("sesiones", None)
+    print(json.dumps(metricas, indent=2, ensure_ascii=False))
+
+    if servidor is not None:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
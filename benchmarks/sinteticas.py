@@ -0,0 +1,37 @@
+"""Imágenes sintéticas con máscara de referencia para los benchmarks (sin red ni GPU)"""
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+
+def imagen_sintetica(megapixeles, semilla=0, con_alfa=False):
+    """Sujeto (elipse y rectángulo) sobre un fondo en degradado con ruido.
+
+    Devuelve (imagen, máscara) donde la máscara uint8 marca el sujeto dibujado.
+    Con con_alfa la imagen es RGBA con un alfa de origen opaco.
+    """
+    ancho = int((megapixeles * 1e6 * 4 / 3) ** 0.5)
+    alto = int(ancho * 3 / 4)
+    rng = np.random.default_rng(semilla)
+    fondo = np.linspace(40, 200, ancho, dtype=np.float32)[None, :, None]
+    fondo = np.broadcast_to(fondo, (alto, ancho, 3)).copy()
+    fondo += rng.normal(0, 8, (alto, ancho, 3)).astype(np.float32)
+    image = Image.fromarray(np.clip(fondo, 0, 255).astype(np.uint8))
+    mask = Image.new('L', (ancho, alto), 0)
+    for capa, (color, valor) in ((ImageDraw.Draw(image), ((220, 90, 40), (30, 160, 90))),
+                                 (ImageDraw.Draw(mask), (255, 255))):
+        capa.ellipse((ancho * 0.3, alto * 0.15, ancho * 0.7, alto * 0.9), fill=color)
+        capa.rectangle((ancho * 0.45, alto * 0.05, ancho * 0.55, alto * 0.3), fill=valor)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    if con_alfa:
+        image.putalpha(255)
+    return image, np.asarray(mask)
+
+
+def comparar(mask_referencia, mask):
+    """IoU de las máscaras binarizadas y error absoluto medio del alfa (0-255)"""
+    ref = mask_referencia >= 128
+    otra = mask >= 128
+    union = np.logical_or(ref, otra).sum()
+    iou = np.logical_and(ref, otra).sum() / union if union else 1.0
+    error = np.abs(mask_referencia.astype(np.int16) - mask.astype(np.int16)).mean()
+    return float(iou), float(error)
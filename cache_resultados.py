@@ -0,0 +1,210 @@
+"""Caché en disco de máscaras alfa direccionada por contenido.
+
+La clave combina un hash de los píxeles de origen con el motor, el modelo y los
+parámetros de segmentación. Se guarda la máscara (PNG de un canal) y no la
+imagen compuesta, así que un cambio de fondo o de formato de salida reutiliza
+la misma entrada. Las entradas se desalojan por LRU cuando la caché supera su
+tamaño máximo.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+TAMANO_MAX_POR_DEFECTO_MB = 1024
+FILAS_POR_BLOQUE_HASH = 256
+# Escrituras entre dos recuentos completos del directorio (otros procesos también escriben en él)
+ESCRITURAS_POR_RECUENTO = 256
+# Al podar tras una escritura se baja hasta esta fracción del máximo, para no podar en cada una
+FRACCION_TRAS_PODAR = 0.9
+
+
+def directorio_por_defecto():
+    """Carpeta de la caché (REMOVER_FONDO_CACHE o ~/.cache/remover_fondo)"""
+    if os.environ.get("REMOVER_FONDO_CACHE"):
+        return Path(os.environ["REMOVER_FONDO_CACHE"])
+    return Path.home() / ".cache" / "remover_fondo"
+
+
+def hash_pixeles(image):
+    """Hash de los píxeles decodificados, por bloques de filas para no copiar la imagen entera"""
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{image.mode}:{image.width}x{image.height}".encode())
+    for y in range(0, image.height, FILAS_POR_BLOQUE_HASH):
+        h.update(image.crop((0, y, image.width, min(image.height, y + FILAS_POR_BLOQUE_HASH))).tobytes())
+    return h.hexdigest()
+
+
+def _tamano(ruta):
+    try:
+        return ruta.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class CacheResultados:
+    """Máscaras alfa en disco con desalojo LRU por tamaño y contadores de aciertos"""
+
+    def __init__(self, directorio=None, max_mb=TAMANO_MAX_POR_DEFECTO_MB):
+        self.directorio = Path(directorio) if directorio else directorio_por_defecto()
+        self.max_bytes = int(max_mb * 2**20)
+        self.aciertos = 0
+        self.fallos = 0
+        self._candado = threading.Lock()
+        self._contadores_guardados = (0, 0)
+        # Tamaño total estimado (None hasta el primer recuento) y escrituras desde ese recuento
+        self._bytes = None
+        self._escrituras = 0
+
+    def clave(self, image, **parametros):
+        """Clave de la entrada: píxeles de origen más motor, modelo y parámetros"""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(hash_pixeles(image).encode())
+        h.update(json.dumps(parametros, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def _ruta(self, clave):
+        return self.directorio / clave[:2] / f"{clave}.png"
+
+    def obtener(self, clave):
+        """Devolver (máscara, motor) si la entrada existe, o None"""
+        ruta = self._ruta(clave)
+        try:
+            with Image.open(ruta) as mask:
+                mask.load()
+                motor = mask.info.get("motor", "")
+                datos = np.asarray(mask)
+            # Tocar el archivo para que el LRU lo considere recién usado
+            os.utime(ruta)
+        except (FileNotFoundError, OSError):
+            with self._candado:
+                self.fallos += 1
+            return None
+        with self._candado:
+            self.aciertos += 1
+        return datos, motor
+
+    def guardar(self, clave, mask, motor):
+        """Guardar una máscara uint8 y podar si se supera el tamaño máximo.
+
+        El tamaño total se lleva como un contador en memoria: el directorio
+        solo se recorre al podar o cada ESCRITURAS_POR_RECUENTO escrituras.
+        """
+        from remover_fondo import guardar_atomico
+
+        ruta = self._ruta(clave)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        info = PngImagePlugin.PngInfo()
+        info.add_text("motor", motor)
+        anterior = _tamano(ruta)
+        # Compresión rápida: la caché prima la latencia sobre el tamaño
+        guardar_atomico(Image.fromarray(mask), ruta, pnginfo=info, compress_level=1)
+        with self._candado:
+            self._escrituras += 1
+            if self._bytes is not None:
+                self._bytes += _tamano(ruta) - anterior
+            podar = (self._bytes is None or self._bytes > self.max_bytes
+                     or self._escrituras >= ESCRITURAS_POR_RECUENTO)
+        if podar:
+            self.podar(int(self.max_bytes * FRACCION_TRAS_PODAR))
+
+    def _entradas(self):
+        if not self.directorio.exists():
+            return []
+        entradas = []
+        for ruta in self.directorio.glob("*/*.png"):
+            try:
+                estado = ruta.stat()
+            except FileNotFoundError:
+                continue
+            entradas.append((estado.st_mtime, estado.st_size, ruta))
+        return entradas
+
+    def podar(self, max_bytes=None):
+        """Borrar las entradas menos usadas hasta quedar por debajo del límite"""
+        limite = self.max_bytes if max_bytes is None else max_bytes
+        entradas = sorted(self._entradas())
+        total = sum(tamano for _, tamano, _ in entradas)
+        borradas = 0
+        liberados = 0
+        for _, tamano, ruta in entradas:
+            if total <= limite:
+                break
+            try:
+                ruta.unlink()
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            liberados += tamano
+            borradas += 1
+        with self._candado:
+            self._bytes = total
+            self._escrituras = 0
+        return borradas, liberados
+
+    def vaciar(self):
+        """Borrar todas las entradas"""
+        return self.podar(0)
+
+    def _ruta_contadores(self):
+        return self.directorio / "contadores.json"
+
+    def leer_contadores(self):
+        try:
+            with open(self._ruta_contadores(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"aciertos": 0, "fallos": 0}
+
+    def guardar_contadores(self):
+        """Sumar los contadores de este proceso a los acumulados en disco"""
+        with self._candado:
+            aciertos, fallos = self.aciertos, self.fallos
+            previos_a, previos_f = self._contadores_guardados
+            self._contadores_guardados = (aciertos, fallos)
+        if aciertos == previos_a and fallos == previos_f:
+            return
+        contadores = self.leer_contadores()
+        contadores["aciertos"] += aciertos - previos_a
+        contadores["fallos"] += fallos - previos_f
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        temporal = self._ruta_contadores().with_suffix(f".{os.getpid()}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(contadores, f)
+        os.replace(temporal, self._ruta_contadores())
+
+    def info(self):
+        """Resumen de la caché: entradas, tamaño y aciertos acumulados"""
+        entradas = self._entradas()
+        contadores = self.leer_contadores()
+        contadores["aciertos"] += self.aciertos - self._contadores_guardados[0]
+        contadores["fallos"] += self.fallos - self._contadores_guardados[1]
+        consultas = contadores["aciertos"] + contadores["fallos"]
+        return {
+            "directorio": str(self.directorio),
+            "entradas": len(entradas),
+            "bytes": sum(tamano for _, tamano, _ in entradas),
+            "max_bytes": self.max_bytes,
+            "aciertos": contadores["aciertos"],
+            "fallos": contadores["fallos"],
+            "tasa_aciertos": contadores["aciertos"] / consultas if consultas else 0.0,
+        }
+
+
+_cache = None
+_candado_cache = threading.Lock()
+
+
+def obtener_cache():
+    """Caché de resultados compartida por todo el proceso"""
+    global _cache
+    with _candado_cache:
+        if _cache is None:
+            _cache = CacheResultados()
+            atexit.register(_cache.guardar_contadores)
+        return _cache
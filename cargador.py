@@ -0,0 +1,133 @@
+"""Carga diferida de los motores pesados (rembg, MediaPipe) y precarga en segundo plano.
+
+Los módulos de los motores solo se importan cuando se necesitan por primera vez
+o cuando se precargan explícitamente, de modo que la ventana puede mostrarse
+antes de pagar el coste de importar rembg o MediaPipe.
+
+Nota: en Windows, onnxruntime debe importarse antes que PyQt6 para evitar el
+conflicto de DLLs descrito en el CHANGELOG 1.1.0. Por eso interfaz_grafica.py
+sigue importando onnxruntime en primer lugar; aquí solo se difiere rembg.
+
+OpenCV y numpy no se difieren: los usa todo el camino de procesado
+(decodificación, refinado, composición), no solo el motor GrabCut, y se
+importan al arrancar con el resto de módulos.
+"""
+import importlib
+import os
+import threading
+import time
+
+# rembg importa pymatting, que compila funciones paralelas de numba al importarse.
+# Si la capa TBB se inicializa desde un hilo secundario, el proceso se cuelga al
+# salir; "workqueue" no tiene ese problema y rembg no usa ese código por defecto.
+os.environ.setdefault("NUMBA_THREADING_LAYER", "workqueue")
+
+PENDIENTE = "pendiente"
+CARGANDO = "cargando"
+LISTO = "listo"
+ERROR = "error"
+
+# Módulos que se importan bajo demanda para cada motor, en orden de importación
+MODULOS_MOTOR = {
+    "rembg": ("onnxruntime", "rembg"),
+    "mediapipe": ("mediapipe",),
+}
+
+MOTOR_POR_DEFECTO = "rembg"
+
+
+class CargadorMotores:
+    """Importa los módulos de cada motor una sola vez y lleva su estado de carga"""
+
+    def __init__(self):
+        self._candado = threading.Lock()
+        self._candados_motor = {nombre: threading.Lock() for nombre in MODULOS_MOTOR}
+        self._estados = {nombre: PENDIENTE for nombre in MODULOS_MOTOR}
+        self._errores = {}
+        self._tiempos = {}
+        self._no_disponibles = set()
+
+    def estado(self, motor):
+        with self._candado:
+            return self._estados[motor]
+
+    def error(self, motor):
+        with self._candado:
+            return self._errores.get(motor)
+
+    def tiempo_carga(self, motor):
+        """Segundos que tardó en cargarse el motor (None si aún no está listo)"""
+        with self._candado:
+            return self._tiempos.get(motor)
+
+    def _cambiar_estado(self, motor, estado, error=None):
+        with self._candado:
+            self._estados[motor] = estado
+            if error is not None:
+                self._errores[motor] = error
+
+    def modulo(self, nombre):
+        """Importar un módulo bajo demanda (queda en sys.modules tras la primera vez)"""
+        return importlib.import_module(nombre)
+
+    def cargar(self, motor, modelo=None):
+        """Importar los módulos del motor y, para rembg, precalentar su modelo"""
+        with self._candados_motor[motor]:
+            if self.estado(motor) == LISTO:
+                return True
+            self._cambiar_estado(motor, CARGANDO)
+            inicio = time.perf_counter()
+            try:
+                for nombre in MODULOS_MOTOR[motor]:
+                    self.modulo(nombre)
+                if motor == "rembg":
+                    from sesiones import MODELO_POR_DEFECTO, obtener_registro
+
+                    obtener_registro().precalentar(modelo or MODELO_POR_DEFECTO, en_segundo_plano=False)
+                    if not obtener_registro().cargado(modelo or MODELO_POR_DEFECTO):
+                        raise RuntimeError("No se pudo cargar el modelo de rembg")
+            except Exception as e:
+                self._cambiar_estado(motor, ERROR, str(e))
+                return False
+            with self._candado:
+                self._tiempos[motor] = time.perf_counter() - inicio
+            self._cambiar_estado(motor, LISTO)
+            return True
+
+    def disponible(self, motor):
+        """Indicar si los módulos del motor se pueden importar (los importa si hace falta)"""
+        if motor in self._no_disponibles:
+            return False
+        try:
+            for nombre in MODULOS_MOTOR[motor]:
+                self.modulo(nombre)
+            return True
+        except ImportError:
+            # No volver a buscar en disco un módulo que no está instalado
+            self._no_disponibles.add(motor)
+            return False
+
+    def precargar(self, motor=MOTOR_POR_DEFECTO, modelo=None, al_terminar=None):
+        """Cargar el motor en un hilo en segundo plano; al_terminar(motor, ok) al acabar"""
+
+        def _precargar():
+            ok = self.cargar(motor, modelo)
+            if al_terminar:
+                al_terminar(motor, ok)
+
+        hilo = threading.Thread(target=_precargar, name=f"precarga-{motor}", daemon=True)
+        hilo.start()
+        return hilo
+
+
+_cargador = None
+_candado_cargador = threading.Lock()
+
+
+def obtener_cargador():
+    """Cargador de motores compartido por todo el proceso"""
+    global _cargador
+    with _candado_cargador:
+        if _cargador is None:
+            _cargador = CargadorMotores()
+        return _cargador
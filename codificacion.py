@@ -0,0 +1,196 @@
+"""Etapa de codificación y escritura de resultados.
+
+Centraliza las opciones de guardado por formato (nivel de compresión PNG sin
+optimize, WebP sin pérdida, calidad JPEG, solo máscara en PNG o RLE, posición
+del recorte en los metadatos) y ofrece un
+codificador en segundo plano con cola acotada: mientras un hilo comprime y
+escribe la imagen anterior, el hilo principal ya segmenta la siguiente. zlib y
+libwebp liberan el GIL, así que el solapamiento es real.
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Formatos de salida: composición RGBA, WebP sin pérdida, JPEG (sobre un fondo opaco)
+# o solo la máscara alfa (PNG de un canal)
+FORMATO_PNG = "png"
+FORMATO_WEBP = "webp"
+FORMATO_JPEG = "jpeg"
+FORMATO_MASCARA = "mascara"
+FORMATO_RLE = "rle"
+FORMATOS = (FORMATO_PNG, FORMATO_WEBP, FORMATO_JPEG, FORMATO_MASCARA, FORMATO_RLE)
+FORMATOS_MASCARA = (FORMATO_MASCARA, FORMATO_RLE)
+SUFIJOS = {FORMATO_PNG: "_sf.png", FORMATO_WEBP: "_sf.webp", FORMATO_JPEG: "_sf.jpg",
+           FORMATO_MASCARA: "_mascara.png", FORMATO_RLE: "_mascara.rle"}
+
+# Máscara RLE: cabecera (firma, ancho, alto, x, y, ancho y alto del lienzo original,
+# número de tramos) y después los valores (uint8) y las longitudes (uint16 LE) de los tramos
+FIRMA_RLE = b"RFRLE1\0\0"
+CABECERA_RLE = struct.Struct("<8s6II")
+MAX_TRAMO_RLE = 0xFFFF
+# Clave del texto PNG con la posición del recorte y el tamaño del lienzo original
+CLAVE_RECORTE = "remover_fondo:recorte"
+
+# Nivel de zlib por defecto (el mismo que usa Pillow); 1 es el más rápido
+NIVEL_PNG = 6
+# Esfuerzo de libwebp sin pérdida: 0 rápido, 6 más compacto
+METODO_WEBP = 4
+# Imágenes esperando al codificador antes de bloquear a quien las envía
+MAX_PENDIENTES = 2
+
+
+def opciones_guardado(ruta, calidad=95, nivel_png=NIVEL_PNG, metodo_webp=METODO_WEBP, recorte=None):
+    """Opciones de Image.save según la extensión de destino.
+
+    En PNG la calidad no tiene efecto: lo que cuenta es el nivel de zlib, y
+    optimize se desactiva porque multiplica el tiempo por pocas ganancias.
+    recorte (ver composicion.caja_recorte) se guarda en PNG como texto JSON
+    (clave CLAVE_RECORTE) y en RLE en la cabecera.
+    """
+    nivel_png = NIVEL_PNG if nivel_png is None else nivel_png
+    metodo_webp = METODO_WEBP if metodo_webp is None else metodo_webp
+    extension = Path(ruta).suffix.lower()
+    if extension == ".rle":
+        return {"recorte": recorte} if recorte else {}
+    if extension == ".png":
+        opciones = {"compress_level": nivel_png, "optimize": False}
+        if recorte:
+            from PIL.PngImagePlugin import PngInfo
+
+            info = PngInfo()
+            info.add_text(CLAVE_RECORTE, json.dumps(recorte))
+            opciones["pnginfo"] = info
+        return opciones
+    if extension == ".webp":
+        return {"lossless": True, "method": metodo_webp, "quality": 100}
+    if extension in (".jpg", ".jpeg"):
+        return {"quality": calidad}
+    return {}
+
+
+def tramos_rle(mask):
+    """(valores uint8, longitudes uint16) de los tramos de la máscara recorrida por filas"""
+    plana = np.ascontiguousarray(mask, dtype=np.uint8).ravel()
+    if not plana.size:
+        return np.empty(0, np.uint8), np.empty(0, np.uint16)
+    inicios = np.concatenate(([0], np.flatnonzero(plana[1:] != plana[:-1]) + 1))
+    longitudes = np.diff(np.append(inicios, plana.size))
+    # Los tramos de más de 65535 píxeles se parten en varios del mismo valor
+    piezas = (longitudes + MAX_TRAMO_RLE - 1) // MAX_TRAMO_RLE
+    valores = np.repeat(plana[inicios], piezas)
+    partidas = np.full(int(piezas.sum()), MAX_TRAMO_RLE, np.uint16)
+    partidas[np.cumsum(piezas) - 1] = longitudes - (piezas - 1) * MAX_TRAMO_RLE
+    return valores, partidas
+
+
+def escribir_rle(mask, ruta_destino, recorte=None):
+    """Guardar la máscara en formato RLE, de forma atómica"""
+    from remover_fondo import ruta_temporal
+
+    alto, ancho = mask.shape[:2]
+    recorte = recorte or {"x": 0, "y": 0, "ancho_original": ancho, "alto_original": alto}
+    valores, longitudes = tramos_rle(mask)
+    destino = Path(ruta_destino)
+    temporal = ruta_temporal(destino)
+    try:
+        with open(temporal, "wb") as f:
+            f.write(CABECERA_RLE.pack(FIRMA_RLE, ancho, alto, recorte["x"], recorte["y"],
+                                      recorte["ancho_original"], recorte["alto_original"], len(valores)))
+            f.write(valores.tobytes())
+            f.write(longitudes.astype("<u2").tobytes())
+        os.replace(temporal, destino)
+    finally:
+        try:
+            temporal.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def leer_rle(ruta):
+    """Máscara (array alto x ancho) y recorte de un archivo RLE"""
+    with open(ruta, "rb") as f:
+        datos = f.read()
+    firma, ancho, alto, x, y, ancho_original, alto_original, n = CABECERA_RLE.unpack_from(datos)
+    if firma != FIRMA_RLE:
+        raise ValueError(f"{ruta} no es una máscara RLE de remover_fondo")
+    inicio = CABECERA_RLE.size
+    valores = np.frombuffer(datos, np.uint8, n, inicio)
+    longitudes = np.frombuffer(datos, "<u2", n, inicio + n)
+    mask = np.repeat(valores, longitudes).reshape(alto, ancho)
+    return mask, {"x": x, "y": y, "ancho_original": ancho_original, "alto_original": alto_original}
+
+
+def codificar(image, ruta_destino, opciones):
+    """Guardar de forma atómica y devolver (segundos, bytes escritos)"""
+    from remover_fondo import guardar_atomico
+
+    inicio = time.perf_counter()
+    if Path(ruta_destino).suffix.lower() == ".rle":
+        escribir_rle(np.asarray(image), ruta_destino, opciones.get("recorte"))
+    else:
+        guardar_atomico(image, ruta_destino, **opciones)
+    return time.perf_counter() - inicio, os.path.getsize(ruta_destino)
+
+
+def anotar_codificacion(datos, segundos, tamano):
+    """Añadir al resultado el tiempo, los bytes y el ahorro estimado del recorte.
+
+    El ahorro se estima escalando los bytes escritos al área del lienzo
+    completo: aproximado, porque lo transparente comprime algo mejor.
+    """
+    datos.update({"bytes": tamano, "segundos_codificacion": segundos})
+    recorte = datos.get("recorte")
+    if recorte:
+        area = recorte["ancho"] * recorte["alto"]
+        area_original = recorte["ancho_original"] * recorte["alto_original"]
+        datos["bytes_ahorrados"] = round(tamano * (area_original / max(area, 1) - 1))
+    return datos
+
+
+class CodificadorEnSegundoPlano:
+    """Hilo que codifica y escribe los resultados en orden de llegada.
+
+    enviar() bloquea cuando ya hay max_pendientes imágenes esperando, de modo
+    que la inferencia no acumula resultados en memoria si el disco o zlib van
+    más lentos. al_terminar(datos) recibe el resultado con "bytes" y
+    "segundos_codificacion", o con "estado": "error".
+    """
+
+    def __init__(self, al_terminar, max_pendientes=MAX_PENDIENTES):
+        self.al_terminar = al_terminar
+        self._cola = queue.Queue(maxsize=max(1, max_pendientes))
+        # Quien lo usa debe esperar a los resultados (o llamar a cerrar) antes de salir
+        self._hilo = threading.Thread(target=self._bucle, name="codificador", daemon=True)
+        self._hilo.start()
+
+    def enviar(self, image, ruta_destino, opciones, datos):
+        self._cola.put((image, ruta_destino, opciones, datos))
+
+    def _bucle(self):
+        while True:
+            trabajo = self._cola.get()
+            if trabajo is None:
+                return
+            image, ruta_destino, opciones, datos = trabajo
+            try:
+                segundos, tamano = codificar(image, ruta_destino, opciones)
+                anotar_codificacion(datos, segundos, tamano)
+                datos.setdefault("etapas", {})["codificacion"] = segundos
+            except Exception as e:
+                datos.update({"estado": "error", "error": f"Error al guardar: {e}"})
+            del image
+            try:
+                self.al_terminar(datos)
+            except Exception as e:
+                print(f"Error notificando la codificación de {ruta_destino}: {e}")
+
+    def cerrar(self):
+        """Esperar a que se escriba todo lo pendiente"""
+        self._cola.put(None)
+        self._hilo.join()
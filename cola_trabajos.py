@@ -0,0 +1,186 @@
+"""Cola de trabajos de la interfaz: concurrencia acotada, cancelación y memoria.
+
+Cada imagen que se manda a procesar es un Trabajo en la cola. Como mucho
+max_simultaneos trabajos se ejecutan a la vez, cada uno en su QThread, y el
+resto espera en orden. Antes de arrancar un trabajo se estima la memoria que
+necesitará a partir de la cabecera de la imagen (sin decodificarla): si no
+cabe en el presupuesto junto a los que ya están en marcha, se retiene y pasan
+delante los que sí caben. Un trabajo solo nunca se retiene, así que una imagen
+enorme acaba ejecutándose cuando no queda nada más en marcha.
+
+La cancelación es cooperativa: un trabajo pendiente se descarta al momento y
+uno en marcha se detiene al empezar la siguiente etapa (ver TrabajoCancelado),
+sin dejar archivos a medias porque la escritura es atómica.
+"""
+import itertools
+
+from PIL import Image
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from mosaico import BYTES_POR_PIXEL_COMPLETO
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en curso"
+HECHO = "hecho"
+ERROR = "error"
+CANCELADO = "cancelado"
+TERMINADOS = (HECHO, ERROR, CANCELADO)
+# Trabajos a la vez por defecto: la inferencia ya usa varios núcleos
+MAX_SIMULTANEOS = 1
+# Memoria estimada (MiB) que pueden sumar los trabajos en marcha
+MEMORIA_COLA_MB = 2048
+
+
+class TrabajoCancelado(Exception):
+    """Se lanza entre etapas cuando el usuario cancela un trabajo en marcha"""
+
+
+def memoria_estimada(ruta, presupuesto_mb=None):
+    """MiB que ocupará procesar la imagen, leyendo solo su cabecera.
+
+    Con presupuesto_mb, las imágenes mayores se procesan por franjas (ver
+    mosaico.necesita_franjas) y no pasan de ese presupuesto.
+    """
+    try:
+        with Image.open(ruta) as image:
+            ancho, alto = image.size
+    except OSError:
+        # Si no se puede leer, el propio trabajo informará del error
+        return 0.0
+    estimada = ancho * alto * BYTES_POR_PIXEL_COMPLETO / 2**20
+    return min(estimada, presupuesto_mb) if presupuesto_mb else estimada
+
+
+class Trabajo:
+    """Una imagen en la cola con sus opciones, su estado y su resultado"""
+
+    def __init__(self, id, origen, destino, opciones, memoria_mb):
+        self.id = id
+        self.origen = origen
+        self.destino = destino
+        self.opciones = opciones
+        self.memoria_mb = memoria_mb
+        self.estado = PENDIENTE
+        # Pendiente pero sin sitio en el presupuesto de memoria
+        self.retenido = False
+        self.cancelando = False
+        self.worker = None
+        self.resultado = None
+        self.error = None
+
+
+class ColaTrabajos(QObject):
+    """Cola FIFO de trabajos con límite de concurrencia y de memoria.
+
+    crear_worker(trabajo) devuelve el QThread que lo procesa, con las señales
+    finished, error(str) y cancelled y el método cancelar(). cambiado(id) se
+    emite con cada cambio de estado y vacia cuando ya no queda nada pendiente
+    ni en marcha.
+    """
+    cambiado = pyqtSignal(int)
+    iniciado = pyqtSignal(int)
+    vacia = pyqtSignal()
+
+    def __init__(self, crear_worker, max_simultaneos=MAX_SIMULTANEOS, memoria_mb=MEMORIA_COLA_MB,
+                 presupuesto_imagen_mb=None, parent=None):
+        super().__init__(parent)
+        self.crear_worker = crear_worker
+        self.max_simultaneos = max(1, max_simultaneos)
+        self.memoria_mb = memoria_mb
+        self.presupuesto_imagen_mb = presupuesto_imagen_mb
+        # Por orden de llegada (los dict conservan el orden de inserción)
+        self.trabajos = {}
+        self._ids = itertools.count(1)
+
+    def configurar(self, max_simultaneos=None, memoria_mb=None):
+        """Cambiar los límites; si ahora caben más trabajos, arrancan al momento"""
+        if max_simultaneos is not None:
+            self.max_simultaneos = max(1, max_simultaneos)
+        if memoria_mb is not None:
+            self.memoria_mb = memoria_mb
+        self._lanzar()
+
+    def agregar(self, origen, destino, opciones):
+        """Encolar una imagen; devuelve None si ya está pendiente o en marcha con ese destino"""
+        for trabajo in self.trabajos.values():
+            if trabajo.estado in (PENDIENTE, EN_CURSO) and (trabajo.origen, trabajo.destino) == (origen, destino):
+                return None
+        trabajo = Trabajo(next(self._ids), origen, destino, opciones,
+                          memoria_estimada(origen, self.presupuesto_imagen_mb))
+        self.trabajos[trabajo.id] = trabajo
+        self.cambiado.emit(trabajo.id)
+        self._lanzar()
+        return trabajo
+
+    def en_estado(self, *estados):
+        return [trabajo for trabajo in self.trabajos.values() if trabajo.estado in estados]
+
+    def memoria_en_uso(self):
+        return sum(trabajo.memoria_mb for trabajo in self.en_estado(EN_CURSO))
+
+    def _lanzar(self):
+        en_curso = len(self.en_estado(EN_CURSO))
+        usada = self.memoria_en_uso()
+        for trabajo in self.en_estado(PENDIENTE):
+            if en_curso >= self.max_simultaneos:
+                break
+            cabe = en_curso == 0 or usada + trabajo.memoria_mb <= self.memoria_mb
+            if trabajo.retenido == cabe:
+                trabajo.retenido = not cabe
+                self.cambiado.emit(trabajo.id)
+            if cabe:
+                self._iniciar(trabajo)
+                en_curso += 1
+                usada += trabajo.memoria_mb
+
+    def _iniciar(self, trabajo):
+        worker = self.crear_worker(trabajo)
+        trabajo.worker = worker
+        trabajo.estado = EN_CURSO
+        worker.finished.connect(lambda: self._terminar(trabajo, HECHO))
+        worker.error.connect(lambda error: self._terminar(trabajo, ERROR, error))
+        worker.cancelled.connect(lambda: self._terminar(trabajo, CANCELADO))
+        self.iniciado.emit(trabajo.id)
+        self.cambiado.emit(trabajo.id)
+        worker.start()
+
+    def _terminar(self, trabajo, estado, error=None):
+        trabajo.estado = estado
+        trabajo.error = error
+        trabajo.resultado = trabajo.worker.resultado
+        self.cambiado.emit(trabajo.id)
+        self._lanzar()
+        self._comprobar_vacia()
+
+    def _comprobar_vacia(self):
+        if not self.en_estado(PENDIENTE, EN_CURSO):
+            self.vacia.emit()
+
+    def cancelar(self, id):
+        """Descartar un trabajo pendiente o pedir a uno en marcha que pare en la próxima etapa"""
+        trabajo = self.trabajos.get(id)
+        if trabajo is None or trabajo.estado in TERMINADOS:
+            return
+        if trabajo.estado == PENDIENTE:
+            trabajo.estado = CANCELADO
+            self.cambiado.emit(id)
+            self._comprobar_vacia()
+        elif not trabajo.cancelando:
+            trabajo.cancelando = True
+            trabajo.worker.cancelar()
+            self.cambiado.emit(id)
+
+    def cancelar_todo(self):
+        # Primero los pendientes, para que no arranquen al terminar los que están en marcha
+        for trabajo in self.en_estado(PENDIENTE) + self.en_estado(EN_CURSO):
+            self.cancelar(trabajo.id)
+
+    def quitar_terminados(self):
+        """Olvidar los trabajos terminados; devuelve sus ids"""
+        quitados = [trabajo for trabajo in self.en_estado(*TERMINADOS)]
+        for trabajo in quitados:
+            if trabajo.worker is not None:
+                # La señal de fin sale justo antes de que acabe run(): esperar al hilo
+                trabajo.worker.wait()
+            del self.trabajos[trabajo.id]
+        return [trabajo.id for trabajo in quitados]
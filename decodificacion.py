@@ -0,0 +1,103 @@
+"""Etapa de decodificación de las imágenes de origen.
+
+Centraliza lo que pasa entre el archivo y la imagen con la que trabajan los
+motores: la orientación EXIF se aplica (las fotos del móvil llegan giradas y
+se segmentaban de lado), los JPEG se decodifican con draft directamente a la
+escala necesaria cuando la salida no tiene que ser a resolución completa, y
+el modo se normaliza una sola vez a RGB o, si el origen tiene transparencia,
+a RGBA, sin convertir lo que ya está en esos modos. El alfa de origen se
+conserva y se combina con la máscara en lugar de descartarse.
+
+decodificar() devuelve además el tiempo y los bytes reservados para los
+píxeles (la imagen decodificada más cada copia que haya hecho falta).
+"""
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Modos con los que ya trabajan motores y composición sin convertir
+MODOS_DIRECTOS = ("RGB", "RGBA")
+ETIQUETA_ORIENTACION = 0x0112
+
+
+def bytes_de(image):
+    """Bytes que ocupan los píxeles de una imagen PIL"""
+    return image.width * image.height * len(image.getbands())
+
+
+def memoria_decodificacion(image):
+    """(bytes que ocupará la imagen decodificada, pico durante la decodificación) sin decodificarla.
+
+    image es una imagen PIL aún sin cargar. Se cuenta el modo final (RGB o
+    RGBA, más el alfa de origen como array), el giro EXIF, que copia la imagen
+    en su modo original, y la conversión de modo, que convive con el original.
+    """
+    pixeles = image.width * image.height
+    original = len(image.getbands())
+    convierte = image.mode not in MODOS_DIRECTOS
+    final = 4 if image.mode == 'RGBA' or (convierte and image.has_transparency_data) else 3
+    pico = original * (2 if image.getexif().get(ETIQUETA_ORIENTACION, 1) in range(2, 9) else 1)
+    if convierte:
+        pico = max(pico, original + final)
+    residentes = final + (1 if final == 4 else 0)
+    return pixeles * residentes, pixeles * max(pico, residentes)
+
+
+def decodificar(origen, lado_maximo=None):
+    """Decodificar una imagen lista para segmentar y componer.
+
+    origen es una ruta, un archivo abierto o una imagen PIL aún sin cargar
+    (Image.open es perezoso). Con lado_maximo la imagen se limita a ese lado
+    mayor: en JPEG, draft decodifica ya reducida (escalado DCT 1/2, 1/4 o 1/8)
+    y solo queda un ajuste final. Devuelve (imagen RGB o RGBA, datos) con
+    segundos, bytes, orientacion EXIF, modo_original y reduccion_draft.
+    """
+    inicio = time.perf_counter()
+    image = origen if isinstance(origen, Image.Image) else Image.open(origen)
+    datos = {"modo_original": image.mode, "reduccion_draft": 1}
+
+    if lado_maximo and image.format == "JPEG" and max(image.size) > lado_maximo:
+        escala = lado_maximo / max(image.size)
+        ancho_original = image.width
+        # draft elige la mayor reducción que no baje del tamaño pedido
+        image.draft('RGB', (max(1, round(image.width * escala)), max(1, round(image.height * escala))))
+        datos["reduccion_draft"] = ancho_original // image.width
+    image.load()
+    asignados = bytes_de(image)
+
+    orientacion = image.getexif().get(ETIQUETA_ORIENTACION, 1)
+    if orientacion in range(2, 9):
+        # Se gira antes de convertir: en modos de menos canales la copia es menor
+        image = ImageOps.exif_transpose(image)
+        asignados += bytes_de(image)
+    if image.mode not in MODOS_DIRECTOS:
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        asignados += bytes_de(image)
+    if lado_maximo and max(image.size) > lado_maximo:
+        from refinado import reducir_para_inferencia
+
+        image = reducir_para_inferencia(image, lado_maximo)
+        asignados += bytes_de(image)
+
+    datos.update({"segundos": time.perf_counter() - inicio, "bytes": asignados,
+                  "orientacion": orientacion})
+    return image, datos
+
+
+def alfa_de_origen(image):
+    """Canal alfa del origen como array, o None si no tiene o es opaco del todo"""
+    if image.mode != 'RGBA':
+        return None
+    alfa = np.asarray(image.getchannel('A'))
+    if cv2.minMaxLoc(alfa)[0] == 255:
+        return None
+    return alfa
+
+
+def combinar_alfa(mask, alfa):
+    """Máscara limitada por el alfa de origen (producto normalizado, redondeado)"""
+    if alfa is None:
+        return mask
+    return cv2.multiply(np.ascontiguousarray(mask, dtype=np.uint8), alfa, scale=1 / 255)
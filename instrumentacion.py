@@ -0,0 +1,213 @@
+"""Tiempos por etapa de cada trabajo, estimación de progreso y gancho de perfilado.
+
+Cada trabajo lleva un Cronometro que mide las etapas del camino de
+procesar_imagen (decodificación, caché, inferencia, refinado, composición y
+codificación). Al terminar, los tiempos actualizan un historial de segundos por
+megapíxel de cada etapa que sirve para estimar el progreso y el tiempo restante
+del siguiente trabajo, y se pueden añadir a un registro JSON lines.
+"""
+import cProfile
+import contextlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+ETAPAS = ("decodificacion", "cache", "inferencia", "refinado", "borde", "composicion", "codificacion")
+
+# Coste inicial (s/MP) de cada etapa mientras no haya historial
+COSTE_INICIAL = {
+    "decodificacion": 0.05,
+    "cache": 0.02,
+    "inferencia": 1.0,
+    "refinado": 0.1,
+    "borde": 0.03,
+    "composicion": 0.02,
+    "codificacion": 0.3,
+}
+# Parte de la etapa en curso que se da por hecha como máximo mientras no termine
+TOPE_ETAPA = 0.95
+
+
+def ruta_historial():
+    """Historial junto a la caché de resultados (REMOVER_FONDO_CACHE o ~/.cache/remover_fondo)"""
+    from cache_resultados import directorio_por_defecto
+
+    return directorio_por_defecto() / "etapas.json"
+
+
+class HistorialEtapas:
+    """Media móvil (EWMA) de segundos por megapíxel de cada etapa, guardada en disco"""
+
+    def __init__(self, ruta=None, alfa=0.3):
+        self.ruta = Path(ruta) if ruta else ruta_historial()
+        self.alfa = alfa
+        self._candado = threading.Lock()
+        self._costes = dict(COSTE_INICIAL)
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                self._costes.update(json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def coste(self, etapa, variante=None):
+        """Segundos por MP de la etapa; la variante (p. ej. el motor) tiene prioridad si se conoce"""
+        with self._candado:
+            if variante and f"{etapa}/{variante}" in self._costes:
+                return self._costes[f"{etapa}/{variante}"]
+            return self._costes.get(etapa, 0.0)
+
+    def actualizar(self, tiempos, megapixeles, variante=None):
+        """Incorporar los tiempos de un trabajo y guardar el historial"""
+        megapixeles = max(megapixeles, 0.01)
+        with self._candado:
+            for etapa, segundos in tiempos.items():
+                por_mp = segundos / megapixeles
+                claves = [etapa, f"{etapa}/{variante}"] if variante else [etapa]
+                for clave in claves:
+                    previo = self._costes.get(clave, por_mp)
+                    self._costes[clave] = previo + self.alfa * (por_mp - previo)
+            costes = dict(self._costes)
+        try:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            temporal = self.ruta.with_suffix(f".{os.getpid()}.tmp")
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(costes, f)
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            print(f"No se pudo guardar el historial de etapas: {e}")
+
+
+class Cronometro:
+    """Tiempos de las etapas de un trabajo y progreso estimado a partir del historial.
+
+    variante separa el historial por motor o política, porque la inferencia de
+    OpenCV cuesta mucho más que la de MediaPipe. al_cambiar(etapa) se llama al
+    empezar cada etapa. progreso() y restante() se pueden consultar desde otro
+    hilo (por ejemplo, un temporizador de Qt).
+    """
+
+    def __init__(self, megapixeles=0.0, historial=None, al_cambiar=None, variante=None):
+        self.megapixeles = megapixeles
+        self.historial = historial
+        self.al_cambiar = al_cambiar
+        self.variante = variante
+        self.tiempos = {}
+        self.etapa_actual = None
+        self._inicio_etapa = 0.0
+        self._inicio = time.perf_counter()
+        self._candado = threading.Lock()
+
+    def _estimado(self, etapa):
+        if self.historial:
+            coste = self.historial.coste(etapa, self.variante)
+        else:
+            coste = COSTE_INICIAL.get(etapa, 0.0)
+        return coste * max(self.megapixeles, 0.01)
+
+    @contextlib.contextmanager
+    def etapa(self, nombre):
+        """Medir un bloque; si la etapa se repite (franjas), los tiempos se suman"""
+        with self._candado:
+            anterior = self.etapa_actual
+            self.etapa_actual = nombre
+            self._inicio_etapa = time.perf_counter()
+        if self.al_cambiar and nombre != anterior:
+            self.al_cambiar(nombre)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._candado:
+                self.tiempos[nombre] = self.tiempos.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def _estado(self):
+        """(estimados por etapa en orden, posición de la actual, segundos en la actual)"""
+        with self._candado:
+            actual, inicio_etapa = self.etapa_actual, self._inicio_etapa
+        orden = ETAPAS if actual is None or actual in ETAPAS else ETAPAS + (actual,)
+        estimados = [self._estimado(etapa) for etapa in orden]
+        if actual is None:
+            return estimados, 0, 0.0
+        return estimados, orden.index(actual), time.perf_counter() - inicio_etapa
+
+    def progreso(self):
+        """Fracción estimada (0-1): etapas hechas o saltadas más la parte de la actual"""
+        estimados, posicion, transcurrido = self._estado()
+        if self.etapa_actual is None:
+            return 0.0
+        total = sum(estimados) or 1.0
+        hecho = sum(estimados[:posicion])
+        if estimados[posicion]:
+            hecho += estimados[posicion] * min(transcurrido / estimados[posicion], TOPE_ETAPA)
+        return min(hecho / total, 1.0)
+
+    def restante(self):
+        """Segundos restantes estimados, o None si la etapa actual ya supera su estimación"""
+        estimados, posicion, transcurrido = self._estado()
+        pendiente_actual = estimados[posicion] - transcurrido
+        if pendiente_actual < 0:
+            return None
+        return pendiente_actual + sum(estimados[posicion + 1:])
+
+    def terminar(self, **datos):
+        """Cerrar el trabajo: actualizar el historial y devolver el registro del trabajo"""
+        registro = {
+            "megapixeles": round(self.megapixeles, 3),
+            "total": time.perf_counter() - self._inicio,
+            "etapas": dict(self.tiempos),
+        }
+        registro.update(datos)
+        if self.historial:
+            self.historial.actualizar(self.tiempos, self.megapixeles, self.variante)
+        ruta = os.environ.get("REMOVER_FONDO_TIEMPOS")
+        if ruta:
+            escribir_registro(ruta, registro)
+        return registro
+
+
+_candado_registro = threading.Lock()
+
+
+def escribir_registro(ruta, registro):
+    """Añadir una línea JSON al registro de tiempos"""
+    with _candado_registro, open(ruta, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+@contextlib.contextmanager
+def perfilar(perfil):
+    """Perfilar un bloque.
+
+    perfil puede ser una ruta (se usa cProfile y se guardan las estadísticas en
+    ese archivo, legible con pstats o snakeviz) o un objeto de contexto de otro
+    perfilador, por ejemplo pyinstrument.Profiler(), que se usa tal cual.
+    """
+    if not perfil:
+        yield
+        return
+    if hasattr(perfil, "__enter__"):
+        with perfil:
+            yield
+        return
+    perfilador = cProfile.Profile()
+    perfilador.enable()
+    try:
+        yield
+    finally:
+        perfilador.disable()
+        perfilador.dump_stats(str(perfil))
+
+
+_historial = None
+_candado_historial = threading.Lock()
+
+
+def obtener_historial():
+    """Historial de etapas compartido por todo el proceso"""
+    global _historial
+    with _candado_historial:
+        if _historial is None:
+            _historial = HistorialEtapas()
+        return _historial
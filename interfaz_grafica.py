@@ -1,22 +1,84 @@
 import sys
 import os
+# onnxruntime debe cargarse antes que PyQt6 (conflicto de DLLs en Windows, ver CHANGELOG 1.1.0).
+# rembg y MediaPipe, mucho más pesados, se cargan después a través de cargador.py
 import onnxruntime
-from rembg import remove
 from pathlib import Path
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox, 
                              QFileDialog, QGroupBox, QProgressBar, QComboBox,
-                             QSlider, QCheckBox)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-from PyQt6.QtGui import QPixmap, QFont, QImage, QIcon
-from PIL import Image
-import cv2
-import numpy as np
-try:
-    import mediapipe as mp
-    HAS_MEDIAPIPE = True
-except ImportError:
-    HAS_MEDIAPIPE = False
+                             QSlider, QCheckBox, QSpinBox, QListWidget, QListWidgetItem,
+                             QAbstractItemView)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QFont, QIcon
+from cargador import MOTOR_POR_DEFECTO, obtener_cargador
+from cola_trabajos import (CANCELADO, EN_CURSO, ERROR, HECHO, MAX_SIMULTANEOS, MEMORIA_COLA_MB,
+                           TERMINADOS, ColaTrabajos, TrabajoCancelado)
+from instrumentacion import Cronometro, obtener_historial
+from remover_fondo import EXTENSIONES_IMAGEN, procesar_imagen
+from sesiones import AjustesOnnx, obtener_registro
+from vista_previa import CacheMiniaturas, CargaVistaPreviaWorker, PreviewResultadoWorker
+
+# Opciones del combo de resolución: (texto, lado mayor en píxeles o None para completa)
+RESOLUCIONES_INFERENCIA = [
+    ("Completa (más lenta)", None),
+    ("2048 px", 2048),
+    ("1024 px (recomendada)", 1024),
+    ("512 px (más rápida)", 512),
+]
+# Opciones del combo de motor: (texto, política de motores.SelectorMotores)
+POLITICAS_MOTOR = [
+    ("Automático (rembg → MediaPipe → OpenCV)", "secuencial"),
+    ("El más rápido disponible", "rapido"),
+    ("Según la imagen (retratos → MediaPipe)", "heuristica"),
+    ("Solo rembg", "rembg"),
+    ("Solo MediaPipe", "mediapipe"),
+    ("Solo OpenCV (GrabCut)", "opencv"),
+]
+# Opciones del combo de formato: (texto, fondo de composicion.componer, extensión de salida,
+# solo la máscara junto al original sin tocar)
+FORMATOS_SALIDA = [
+    ("PNG (con transparencia)", None, ".png", False),
+    ("PNG (fondo blanco)", (255, 255, 255), ".png", False),
+    ("PNG (fondo negro)", (0, 0, 0), ".png", False),
+    ("PNG (fondo desenfocado)", "desenfoque", ".png", False),
+    ("JPEG", (255, 255, 255), ".jpg", False),
+    ("Solo máscara (PNG de 8 bits)", None, ".png", True),
+    ("Solo máscara (RLE compacto)", None, ".rle", True),
+]
+# Casillas del refinado de contorno: (texto, motor, activado por defecto como en motores.py)
+MOTORES_BORDE = [
+    ("rembg", "rembg", False),
+    ("MediaPipe", "mediapipe", True),
+    ("OpenCV", "opencv", True),
+]
+MARGEN_RECORTE_PX = 16
+# Opciones de los combos de onnxruntime: (texto, valor de sesiones.AjustesOnnx)
+OPTIMIZACIONES_ONNX = [
+    ("Todas (recomendada)", "todas"),
+    ("Extendidas", "extendida"),
+    ("Básicas", "basica"),
+    ("Ninguna", "ninguna"),
+]
+MODOS_ONNX = [
+    ("Secuencial", "secuencial"),
+    ("Paralelo", "paralelo"),
+]
+# Por encima de este consumo estimado (MiB) la imagen se procesa y guarda por franjas
+PRESUPUESTO_MEMORIA_MB = 1024
+# Intervalo (ms) con el que se actualiza la barra de progreso estimada
+INTERVALO_PROGRESO_MS = 100
+# Texto de cada etapa de instrumentacion.ETAPAS en la interfaz
+NOMBRES_ETAPA = {
+    "decodificacion": "Cargando imagen",
+    "cache": "Consultando la caché",
+    "inferencia": "Segmentando",
+    "refinado": "Refinando bordes",
+    "borde": "Ajustando el contorno",
+    "composicion": "Componiendo",
+    "codificacion": "Guardando imagen",
+}
+ICONOS_ESTADO = {"pendiente": "🕒", EN_CURSO: "⏳", HECHO: "✅", ERROR: "❌", CANCELADO: "🚫"}
 
 class RemoveBackgroundWorker(QThread):
     """Worker thread para procesar imágenes sin bloquear la interfaz"""
@@ -24,144 +86,111 @@ class RemoveBackgroundWorker(QThread):
     error = pyqtSignal(str)
     progress = pyqtSignal(str)
     progress_value = pyqtSignal(int)
-
-    def __init__(self, input_path, output_path, quality=95):
+    # Nombre de la etapa que empieza y, al terminar, segundos por etapa
+    etapa = pyqtSignal(str)
+    tiempos = pyqtSignal(dict)
+    cancelled = pyqtSignal()
+
+    def __init__(self, input_path, output_path, quality=95, lado_inferencia=None, mascara_previa=None,
+                 politica=None, perfil=None, fondo=None, descontaminar=False, solo_mascara=False,
+                 recortar=False, margen=None):
         super().__init__()
         self.input_path = input_path
         self.output_path = output_path
         self.quality = quality
+        self.lado_inferencia = lado_inferencia
+        self.mascara_previa = mascara_previa
+        self.politica = politica
+        self.perfil = perfil
+        self.fondo = fondo
+        self.descontaminar = descontaminar
+        self.solo_mascara = solo_mascara
+        self.recortar = recortar
+        self.margen = margen
+        self.resultado = None
+        self.cancelado = False
+        # La interfaz consulta el progreso estimado del cronómetro con un temporizador
+        self.cronometro = Cronometro(historial=obtener_historial(), al_cambiar=self.al_cambiar_etapa,
+                                     variante=politica)
+
+    def cancelar(self):
+        self.cancelado = True
+
+    def al_cambiar_etapa(self, etapa):
+        # La cancelación se atiende entre etapas, sin cortar una inferencia a medias
+        if self.cancelado:
+            raise TrabajoCancelado()
+        self.etapa.emit(etapa)
 
     def run(self):
         try:
-            self.progress.emit("Cargando imagen")
-            image = Image.open(self.input_path)
-            
-            self.progress.emit("Procesando imagen (esto puede tardar)")
-            # Señal especial para barra indeterminada
-            self.progress_value.emit(-1)
-            
-            # Intentar usar rembg como primera opción (mejor calidad general)
-            output = None
-            try:
-                # from rembg import remove  <-- Eliminado, ya es global
-                self.progress.emit("Usando AI Avanzada (rembg)")
-                # Convertir a RGB si tiene alpha para evitar errores en rembg
-                if image.mode == 'RGBA':
-                    image = image.convert('RGB')
-                output = remove(image)
-            except Exception as e:
-                print(f"Error rembg: {e}")
-                
-                # Intentar usar MediaPipe como segunda opción (excelente para personas/selfies)
-                try:
-                    self.progress.emit("Usando AI de Google (MediaPipe)")
-                    output = self.remove_background_mediapipe(image)
-                except Exception as e2:
-                    print(f"Error mediapipe: {e2}")
-                    # Fallback a OpenCV
-                    self.progress.emit(f"Usando método clásico (OpenCV)")
-                    output = self.remove_background_opencv(image)
-            
-            self.progress.emit("Guardando imagen")
-            self.progress_value.emit(-1)
-            output.save(self.output_path, quality=self.quality)
-            
+            if self.cancelado:
+                raise TrabajoCancelado()
+            self.progress_value.emit(0)
+            resultado = procesar_imagen(self.input_path, self.output_path,
+                                        calidad=self.quality, progreso=self.progress.emit,
+                                        lado_inferencia=self.lado_inferencia,
+                                        presupuesto_memoria=PRESUPUESTO_MEMORIA_MB,
+                                        mascara_previa=self.mascara_previa,
+                                        politica=self.politica,
+                                        cronometro=self.cronometro,
+                                        perfil=self.perfil,
+                                        fondo=self.fondo,
+                                        descontaminar=self.descontaminar,
+                                        solo_mascara=self.solo_mascara,
+                                        recortar=self.recortar,
+                                        margen=self.margen)
+            self.resultado = resultado
+
+            self.tiempos.emit(resultado["etapas"])
             self.progress.emit("¡Completado!")
             self.finished.emit()
+        except TrabajoCancelado:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
 
-    def remove_background_mediapipe(self, image):
-        """Método alternativo de alta calidad para personas usando MediaPipe"""
-        if not HAS_MEDIAPIPE:
-            raise ImportError("MediaPipe no está instalado")
-            
-        mp_selfie_segmentation = mp.solutions.selfie_segmentation
-        
-        # Convertir PIL a Numpy y asegurar RGB
-        image_np = np.array(image.convert('RGB'))
-        
-        # Crear instancia de segmentación (model_selection=1 para paisaje/cuerpo completo, 0 para general)
-        with mp_selfie_segmentation.SelfieSegmentation(model_selection=1) as selfie_segmentation:
-            # Procesar imagen
-            results = selfie_segmentation.process(image_np)
-            
-            # Obtener máscara de segmentación
-            mask = results.segmentation_mask
-            
-            # Aplicar umbral suave para mejorar bordes (matting)
-            # La máscara viene en rango [0, 1] float
-            mask = np.stack((mask,) * 3, axis=-1)
-            
-            # Crear imagen RGBA de salida
-            image_rgba = cv2.cvtColor(image_np, cv2.COLOR_RGB2RGBA)
-            
-            # Asignar canal alfa basado en la máscara
-            # Usar la máscara original (float) * 255 para mantener suavidad en bordes
-            alpha = (results.segmentation_mask * 255).astype(np.uint8)
-            image_rgba[:, :, 3] = alpha
-            
-            return Image.fromarray(image_rgba)
-
-    def remove_background_opencv(self, image):
-        """Método alternativo utilizando OpenCV y GrabCut mejorado"""
-        try:
-            # Convertir PIL Image a formato OpenCV
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            
-            # Añadir padding (borde) a la imagen para evitar 'recortes' en los bordes
-            # esto permite que GrabCut no asuma automáticamente que los bordes de la imagen son fondo
-            pad = 20
-            cv_image_padded = cv2.copyMakeBorder(cv_image, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
-            
-            # Crear máscaras para GrabCut con el tamaño del padding
-            mask = np.zeros(cv_image_padded.shape[:2], np.uint8)
-            bgdModel = np.zeros((1, 65), np.float64)
-            fgdModel = np.zeros((1, 65), np.float64)
-            
-            # Definir rectángulo que abarca TODA la imagen original dentro del padding
-            # El rectángulo es (x, y, w, h)
-            height, width = cv_image.shape[:2]
-            rect = (pad, pad, width, height)
-            
-            # Ejecutar GrabCut
-            cv2.grabCut(cv_image_padded, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
-            
-            # Recuperar la máscara correspondiente a la imagen original (quitando padding)
-            mask_padded = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
-            mask2 = mask_padded[pad:pad+height, pad:pad+width]
-            
-            # Aplicar dilatación y erosión para suavizar bordes
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-            mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, kernel, iterations=2)
-            
-            # Aplicar Gaussian Blur para suavizado de bordes
-            mask2 = cv2.GaussianBlur(mask2, (5, 5), 0)
-            
-            # Normalizar máscara a rango 0-255
-            mask2 = np.uint8(mask2 * 255)
-            
-            # Convertir imagen original a RGBA (usando la original cv_image)
-            cv_image_rgba = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGBA)
-            
-            # Aplicar máscara al canal alfa
-            cv_image_rgba[:, :, 3] = mask2
-            
-            # Crear imagen de salida
-            output = Image.fromarray(cv_image_rgba)
-            
-            return output
-            
-        except Exception as e:
-            print(f"Error en remove_background_opencv: {e}")
-            # Si falla todo, devolver imagen original con alpha
-            image_rgba = image.convert('RGBA')
-            return image_rgba
+class PrecargaWorker(QThread):
+    """Carga el motor por defecto en segundo plano tras mostrar la ventana"""
+    listo = pyqtSignal(str, float)
+    fallo = pyqtSignal(str, str)
+
+    def __init__(self, motor=MOTOR_POR_DEFECTO):
+        super().__init__()
+        self.motor = motor
+
+    def run(self):
+        cargador = obtener_cargador()
+        if cargador.cargar(self.motor):
+            self.listo.emit(self.motor, cargador.tiempo_carga(self.motor))
+        else:
+            self.fallo.emit(self.motor, cargador.error(self.motor) or "")
 
 class BackgroundRemoverGUI(QMainWindow):
+    primer_pintado = pyqtSignal()
+    motor_listo = pyqtSignal(bool)
+
     def __init__(self):
         super().__init__()
         self.worker = None
+        self.precarga = None
+        self._pintado = False
+        self.cache_miniaturas = CacheMiniaturas()
+        self.workers_preview = set()
+        self.preview_resultado = None
+        self.trabajo_preview = 0
+        # (ruta, máscara de baja resolución, motor) de la última vista previa del resultado
+        self.mascara_previa = None
+        self.timer_progreso = QTimer(self)
+        self.timer_progreso.setInterval(INTERVALO_PROGRESO_MS)
+        self.timer_progreso.timeout.connect(self.update_progress_estimate)
+        self.cola = ColaTrabajos(self.create_worker, presupuesto_imagen_mb=PRESUPUESTO_MEMORIA_MB, parent=self)
+        self.cola.cambiado.connect(self.update_job_item)
+        self.cola.iniciado.connect(self.on_job_started)
+        self.cola.vacia.connect(self.on_queue_empty)
+        # id del trabajo -> elemento de la lista, y trabajos encolados desde que la cola quedó vacía
+        self.items_trabajo = {}
+        self.ronda = []
         self.init_ui()
 
     def init_ui(self):
@@ -169,8 +198,10 @@ class BackgroundRemoverGUI(QMainWindow):
         self.setWindowIcon(QIcon("favicon.ico"))
         
         # Configurar ventana: fixed, no maximizar, sin redimensión
-        self.setFixedSize(900, 700)
+        self.setFixedSize(900, 910)
         self.setWindowFlags(self.windowFlags() & ~Qt.WindowType.WindowMaximizeButtonHint)
+        # Soltar una o varias imágenes (o carpetas) sobre la ventana
+        self.setAcceptDrops(True)
         
         # Centrar ventana en pantalla
         screen_geometry = QApplication.primaryScreen().availableGeometry()
@@ -194,7 +225,13 @@ class BackgroundRemoverGUI(QMainWindow):
         # Título
         title = QLabel("🎨 Eliminador de fondo")
         title.setFont(QFont("Arial", 16, QFont.Weight.Bold))
-        main_layout.addWidget(title)
+        layout_titulo = QHBoxLayout()
+        layout_titulo.addWidget(title)
+        layout_titulo.addStretch()
+        # Indicador de estado del motor (se actualiza al terminar la precarga)
+        self.label_motor = QLabel("⏳ Cargando motor de IA...")
+        layout_titulo.addWidget(self.label_motor)
+        main_layout.addLayout(layout_titulo)
 
         # ===== GRUPO: ARCHIVO DE ORIGEN =====
         group_origen = QGroupBox("📁 Imagen de origen")
@@ -252,15 +289,96 @@ class BackgroundRemoverGUI(QMainWindow):
         layout_formato = QHBoxLayout()
         layout_formato.addWidget(QLabel("Formato de salida:"))
         self.combo_formato = QComboBox()
-        self.combo_formato.addItems(["PNG (con transparencia)", "PNG (fondo blanco)", "PNG (fondo negro)", "JPEG"])
+        for texto, _, _, _ in FORMATOS_SALIDA:
+            self.combo_formato.addItem(texto)
+        self.combo_formato.currentIndexChanged.connect(self.update_output_extension)
         layout_formato.addWidget(self.combo_formato)
         layout_formato.addStretch()
         layout_opciones.addLayout(layout_formato)
         
+        # Resolución de inferencia (segmentar reducida y refinar a tamaño completo)
+        layout_resolucion = QHBoxLayout()
+        layout_resolucion.addWidget(QLabel("Resolución de inferencia:"))
+        self.combo_resolucion = QComboBox()
+        for texto, lado in RESOLUCIONES_INFERENCIA:
+            self.combo_resolucion.addItem(texto, lado)
+        layout_resolucion.addWidget(self.combo_resolucion)
+        layout_resolucion.addStretch()
+        layout_opciones.addLayout(layout_resolucion)
+        
+        # Motor de segmentación o política de selección
+        layout_motor = QHBoxLayout()
+        layout_motor.addWidget(QLabel("Motor:"))
+        self.combo_motor = QComboBox()
+        for texto, politica in POLITICAS_MOTOR:
+            self.combo_motor.addItem(texto, politica)
+        # La máscara de la vista previa deja de valer si se cambia de motor
+        self.combo_motor.currentIndexChanged.connect(self.invalidate_preview_mask)
+        layout_motor.addWidget(self.combo_motor)
+        layout_motor.addStretch()
+        layout_opciones.addLayout(layout_motor)
+
+        # Motores cuya máscara se ajusta en la banda del contorno
+        layout_borde = QHBoxLayout()
+        layout_borde.addWidget(QLabel("Ajustar el contorno con:"))
+        self.checks_borde = {}
+        for texto, motor, activado in MOTORES_BORDE:
+            check = QCheckBox(texto)
+            check.setChecked(activado)
+            check.toggled.connect(self.apply_edge_settings)
+            layout_borde.addWidget(check)
+            self.checks_borde[motor] = check
+        layout_borde.addStretch()
+        layout_opciones.addLayout(layout_borde)
+
+        # Ajustes de onnxruntime: se aplican al cargar de nuevo el modelo
+        layout_onnx = QHBoxLayout()
+        layout_onnx.addWidget(QLabel("Hilos ONNX:"))
+        self.spin_hilos_onnx = QSpinBox()
+        self.spin_hilos_onnx.setRange(0, os.cpu_count() or 1)
+        self.spin_hilos_onnx.setSpecialValueText("Auto")
+        layout_onnx.addWidget(self.spin_hilos_onnx)
+        layout_onnx.addWidget(QLabel("Optimización:"))
+        self.combo_optimizacion = QComboBox()
+        for texto, nivel in OPTIMIZACIONES_ONNX:
+            self.combo_optimizacion.addItem(texto, nivel)
+        layout_onnx.addWidget(self.combo_optimizacion)
+        layout_onnx.addWidget(QLabel("Ejecución:"))
+        self.combo_modo_onnx = QComboBox()
+        for texto, modo in MODOS_ONNX:
+            self.combo_modo_onnx.addItem(texto, modo)
+        layout_onnx.addWidget(self.combo_modo_onnx)
+        layout_onnx.addStretch()
+        layout_opciones.addLayout(layout_onnx)
+        layout_onnx_modelo = QHBoxLayout()
+        self.check_int8 = QCheckBox("Modelo cuantizado INT8 (más rápido, U2-Net)")
+        self.check_cache_onnx = QCheckBox("Guardar el modelo optimizado")
+        layout_onnx_modelo.addWidget(self.check_int8)
+        layout_onnx_modelo.addWidget(self.check_cache_onnx)
+        layout_onnx_modelo.addStretch()
+        layout_opciones.addLayout(layout_onnx_modelo)
+        self.spin_hilos_onnx.valueChanged.connect(self.apply_onnx_settings)
+        self.combo_optimizacion.currentIndexChanged.connect(self.apply_onnx_settings)
+        self.combo_modo_onnx.currentIndexChanged.connect(self.apply_onnx_settings)
+        self.check_int8.toggled.connect(self.apply_onnx_settings)
+        self.check_cache_onnx.toggled.connect(self.apply_onnx_settings)
+        
         # Opciones adicionales
         self.check_backup = QCheckBox("Hacer copia de seguridad del original")
         self.check_backup.setChecked(True)
         layout_opciones.addWidget(self.check_backup)
+        self.check_descontaminar = QCheckBox("Limpiar el halo del fondo original en los bordes")
+        layout_opciones.addWidget(self.check_descontaminar)
+        layout_recorte = QHBoxLayout()
+        self.check_recortar = QCheckBox("Recortar al sujeto con un margen de")
+        self.spin_margen = QSpinBox()
+        self.spin_margen.setRange(0, 1000)
+        self.spin_margen.setValue(MARGEN_RECORTE_PX)
+        self.spin_margen.setSuffix(" px")
+        layout_recorte.addWidget(self.check_recortar)
+        layout_recorte.addWidget(self.spin_margen)
+        layout_recorte.addStretch()
+        layout_opciones.addLayout(layout_recorte)
         
         group_opciones.setLayout(layout_opciones)
         main_layout.addWidget(group_opciones)
@@ -289,6 +407,45 @@ class BackgroundRemoverGUI(QMainWindow):
         group_destino.setLayout(layout_destino)
         main_layout.addWidget(group_destino)
 
+        # ===== GRUPO: COLA DE TRABAJOS =====
+        group_cola = QGroupBox("📋 Cola de trabajos")
+        group_cola.setFont(QFont("Arial", 10, QFont.Weight.Bold))
+        layout_cola = QVBoxLayout()
+        self.lista_trabajos = QListWidget()
+        self.lista_trabajos.setMaximumHeight(110)
+        self.lista_trabajos.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout_cola.addWidget(self.lista_trabajos)
+        layout_cola_h = QHBoxLayout()
+        layout_cola_h.addWidget(QLabel("Simultáneos:"))
+        self.spin_simultaneos = QSpinBox()
+        self.spin_simultaneos.setRange(1, max(1, os.cpu_count() or 1))
+        self.spin_simultaneos.setValue(MAX_SIMULTANEOS)
+        self.spin_simultaneos.valueChanged.connect(
+            lambda valor: self.cola.configurar(max_simultaneos=valor))
+        layout_cola_h.addWidget(self.spin_simultaneos)
+        layout_cola_h.addWidget(QLabel("Memoria:"))
+        self.spin_memoria_cola = QSpinBox()
+        self.spin_memoria_cola.setRange(256, 65536)
+        self.spin_memoria_cola.setSingleStep(256)
+        self.spin_memoria_cola.setValue(MEMORIA_COLA_MB)
+        self.spin_memoria_cola.setSuffix(" MiB")
+        self.spin_memoria_cola.valueChanged.connect(
+            lambda valor: self.cola.configurar(memoria_mb=valor))
+        layout_cola_h.addWidget(self.spin_memoria_cola)
+        layout_cola_h.addStretch()
+        button_cancelar = QPushButton("🚫 Cancelar")
+        button_cancelar.clicked.connect(self.cancel_selected_jobs)
+        button_cancelar_todo = QPushButton("🚫 Cancelar todo")
+        button_cancelar_todo.clicked.connect(self.cola.cancelar_todo)
+        button_quitar = QPushButton("🧹 Quitar terminados")
+        button_quitar.clicked.connect(self.remove_finished_jobs)
+        layout_cola_h.addWidget(button_cancelar)
+        layout_cola_h.addWidget(button_cancelar_todo)
+        layout_cola_h.addWidget(button_quitar)
+        layout_cola.addLayout(layout_cola_h)
+        group_cola.setLayout(layout_cola)
+        main_layout.addWidget(group_cola)
+
         # ===== BARRA DE PROGRESO =====
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
@@ -307,6 +464,13 @@ class BackgroundRemoverGUI(QMainWindow):
         button_procesar.setFont(QFont("Arial", 11, QFont.Weight.Bold))
         button_procesar.clicked.connect(self.remove_background)
         
+        button_previsualizar = QPushButton("👁️ Previsualizar")
+        button_previsualizar.setObjectName("btnSecondary")
+        button_previsualizar.setMinimumHeight(40)
+        button_previsualizar.setMaximumWidth(160)
+        button_previsualizar.setFont(QFont("Arial", 11, QFont.Weight.Bold))
+        button_previsualizar.clicked.connect(self.preview_result)
+        
         button_limpiar = QPushButton("🔄 Limpiar")
         button_limpiar.setObjectName("btnSecondary")
         button_limpiar.setMinimumHeight(40)
@@ -323,6 +487,7 @@ class BackgroundRemoverGUI(QMainWindow):
         
         layout_botones.addStretch()
         layout_botones.addWidget(button_procesar)
+        layout_botones.addWidget(button_previsualizar)
         layout_botones.addWidget(button_limpiar)
         layout_botones.addWidget(button_abrir_carpeta)
         layout_botones.addStretch()
@@ -331,57 +496,189 @@ class BackgroundRemoverGUI(QMainWindow):
 
         central_widget.setLayout(main_layout)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._pintado:
+            self._pintado = True
+            self.primer_pintado.emit()
+
+    def iniciar_precarga(self):
+        """Precargar el motor por defecto sin bloquear la ventana ya visible"""
+        if self.precarga is not None:
+            return
+        self.precarga = PrecargaWorker()
+        self.precarga.listo.connect(self.on_motor_listo)
+        self.precarga.fallo.connect(self.on_motor_fallo)
+        self.precarga.start()
+
+    def on_motor_listo(self, motor, segundos):
+        self.label_motor.setText(f"🟢 Motor listo ({motor}, {segundos:.1f} s)")
+        self.label_motor.setToolTip(obtener_registro().resumen())
+        self.motor_listo.emit(True)
+
+    def on_motor_fallo(self, motor, error):
+        self.label_motor.setText(f"⚠️ {motor} no disponible: se usará un método alternativo")
+        self.label_motor.setToolTip(error)
+        self.motor_listo.emit(False)
+
+    def apply_onnx_settings(self):
+        """Reconfigurar onnxruntime; el modelo se recarga en la siguiente inferencia"""
+        obtener_registro().configurar(AjustesOnnx(
+            hilos_intra=self.spin_hilos_onnx.value(),
+            modo=self.combo_modo_onnx.currentData(),
+            optimizacion=self.combo_optimizacion.currentData(),
+            cache_optimizado=self.check_cache_onnx.isChecked(),
+            int8=self.check_int8.isChecked(),
+        ))
+        # Con INT8 la máscara puede cambiar: la de la vista previa ya no vale
+        self.invalidate_preview_mask()
+        self.label_motor.setText("⏳ Ajustes de ONNX cambiados: el modelo se recargará")
+
+    def apply_edge_settings(self):
+        """Elegir qué motores pasan por el refinado del contorno (se aplica al siguiente trabajo)"""
+        from motores import obtener_selector
+
+        obtener_selector().configurar_bordes(
+            [motor for motor, check in self.checks_borde.items() if check.isChecked()])
+
     def select_image(self):
-        file_path, _ = QFileDialog.getOpenFileName(
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
-            "Selecciona la imagen de origen",
+            "Selecciona una o varias imágenes de origen",
             "",
             "Archivos de imagen (*.jpg *.jpeg *.png *.bmp *.gif);;Todos los archivos (*)"
         )
+        if len(file_paths) > 1:
+            self.enqueue_files(file_paths)
+        elif file_paths:
+            self.set_source(file_paths[0])
+
+    def set_source(self, file_path):
+        """Seleccionar una sola imagen de origen y sugerir el destino"""
         if file_path:
             self.entry_origen.setText(file_path)
+            self.cancel_preview_result()
+            self.mascara_previa = None
             self.update_preview(file_path)
             # Sugerir nombre de salida
-            input_name = Path(file_path).stem
-            output_path = str(Path(file_path).parent / f"{input_name}_sf.png")
-            self.entry_destino.setText(output_path)
+            self.entry_destino.setText(self.default_output_path(file_path))
+
+    def default_output_path(self, file_path):
+        extension = FORMATOS_SALIDA[self.combo_formato.currentIndex()][2]
+        return str(Path(file_path).parent / f"{Path(file_path).stem}_sf{extension}")
+
+    @staticmethod
+    def image_paths(paths):
+        """Imágenes de una lista de archivos y carpetas (estas, con sus subcarpetas)"""
+        from lote import listar_imagenes
+
+        imagenes = []
+        for ruta in map(Path, paths):
+            if ruta.is_dir():
+                imagenes.extend(str(imagen) for imagen in listar_imagenes(ruta))
+            elif ruta.suffix.lower() in EXTENSIONES_IMAGEN:
+                imagenes.append(str(ruta))
+        return imagenes
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        rutas = self.image_paths(url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile())
+        if len(rutas) == 1:
+            self.set_source(rutas[0])
+        elif rutas:
+            self.enqueue_files(rutas)
+        event.acceptProposedAction()
+
+    def enqueue_files(self, file_paths):
+        """Encolar varias imágenes con las opciones actuales, cada una junto a su original"""
+        encolados = sum(1 for ruta in file_paths
+                        if self.enqueue(ruta, self.default_output_path(ruta)) is not None)
+        self.progress_label.setText(f"📋 {encolados} imágenes añadidas a la cola")
 
     def update_preview(self, image_path):
+        """Mostrar la miniatura: al instante si está en caché, si no, decodificarla en segundo plano"""
         try:
-            img = Image.open(image_path)
-            
-            # Convertir a RGBA siempre para consistencia
-            img = img.convert('RGBA')
-            
-            # Convertir a bytes para QImage
-            data = img.tobytes("raw", "RGBA")
-            q_image = QImage(data, img.width, img.height, QImage.Format.Format_RGBA8888)
-            pixmap = QPixmap.fromImage(q_image)
-            
-            # Definir dimensiones máximas seguras (un poco menos que el contenedor para margen)
-            # Contenedor: 850x250
-            # Margen seguro: 820x230
-            max_w = 820
-            max_h = 230
-            
-            # Escalar usando Qt (alta calidad y mantiene aspecto)
-            scaled_pixmap = pixmap.scaled(
-                max_w, max_h,
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            self.preview_origen.setPixmap(scaled_pixmap)
-        except Exception as e:
-            print(f"Error al cargar preview: {e}")
-            self.preview_origen.setText(f"❌ Error: {str(e)[:30]}")
+            q_image = self.cache_miniaturas.obtener(CacheMiniaturas.clave(image_path))
+        except OSError as e:
+            self.on_preview_error(image_path, str(e))
+            return
+        if q_image is not None:
+            self.on_preview_lista(image_path, q_image)
+            return
+
+        self.preview_origen.setText("⏳ Cargando preview...")
+        worker = CargaVistaPreviaWorker(image_path, self.cache_miniaturas)
+        worker.lista.connect(self.on_preview_lista)
+        worker.error.connect(self.on_preview_error)
+        worker.finished.connect(lambda: self.workers_preview.discard(worker))
+        # Mantener referencia hasta que termine (puede haber varios si se cambia rápido de archivo)
+        self.workers_preview.add(worker)
+        worker.start()
+
+    def on_preview_lista(self, image_path, q_image):
+        # Ignorar resultados de archivos que ya no están seleccionados
+        if image_path != self.entry_origen.text():
+            return
+        self.preview_origen.setPixmap(QPixmap.fromImage(q_image))
+
+    def on_preview_error(self, image_path, error):
+        if image_path != self.entry_origen.text():
+            return
+        print(f"Error al cargar preview: {error}")
+        self.preview_origen.setText(f"❌ Error: {error[:30]}")
+
+    def preview_result(self):
+        """Previsualizar el recorte a baja resolución sin guardar nada"""
+        ruta_origen = self.entry_origen.text()
+        if not ruta_origen or not os.path.exists(ruta_origen):
+            QMessageBox.warning(self, "Advertencia", "Selecciona primero una imagen de origen.")
+            return
+
+        self.cancel_preview_result()
+        self.trabajo_preview += 1
+        self.progress_label.setText("⏳ Calculando vista previa del resultado...")
+        worker = PreviewResultadoWorker(self.trabajo_preview, ruta_origen,
+                                        politica=self.combo_motor.currentData())
+        worker.lista.connect(self.on_preview_result_lista)
+        worker.error.connect(self.on_preview_result_error)
+        worker.finished.connect(lambda: self.workers_preview.discard(worker))
+        self.workers_preview.add(worker)
+        self.preview_resultado = worker
+        worker.start()
+
+    def invalidate_preview_mask(self):
+        self.cancel_preview_result()
+        self.mascara_previa = None
+
+    def cancel_preview_result(self):
+        if self.preview_resultado is not None:
+            self.preview_resultado.cancelar()
+            self.preview_resultado = None
+
+    def on_preview_result_lista(self, trabajo, q_image, mask, motor):
+        if trabajo != self.trabajo_preview:
+            return
+        self.preview_resultado = None
+        # Guardar la máscara para reutilizarla al procesar a resolución completa
+        self.mascara_previa = (self.entry_origen.text(), mask, motor)
+        self.preview_origen.setPixmap(QPixmap.fromImage(q_image))
+        self.progress_label.setText(f"👁️ Vista previa del resultado ({motor})")
+
+    def on_preview_result_error(self, trabajo, error):
+        if trabajo != self.trabajo_preview:
+            return
+        self.preview_resultado = None
+        self.progress_label.setText(f"❌ Error en la vista previa: {error}")
 
     def save_image(self):
         file_path, _ = QFileDialog.getSaveFileName(
             self,
             "Guardar imagen sin fondo",
             "",
-            "Imagen PNG (*.png);;Imagen JPEG (*.jpg);;Todos los archivos (*)"
+            "Imagen PNG (*.png);;Imagen WebP sin pérdida (*.webp);;Imagen JPEG (*.jpg);;Todos los archivos (*)"
         )
         if file_path:
             self.entry_destino.setText(file_path)
@@ -401,36 +698,130 @@ class BackgroundRemoverGUI(QMainWindow):
             return
 
         try:
-            # Hacer backup si está activado
-            if self.check_backup.isChecked() and os.path.exists(ruta_destino):
-                backup_path = str(Path(ruta_destino).with_stem(Path(ruta_destino).stem + "_backup"))
-                if not os.path.exists(backup_path):
-                    import shutil
-                    shutil.copy(ruta_destino, backup_path)
-
-            # Procesar en thread separado
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setVisible(True)
-            self.progress_bar.setValue(0)
-            self.progress_bar.setRange(0, 0) # Indeterminado al inicio
-            
-            calidad = self.slider_calidad.value()
-            self.worker = RemoveBackgroundWorker(ruta_origen, ruta_destino, calidad)
-            self.worker.finished.connect(self.on_process_finished)
-            self.worker.error.connect(self.on_process_error)
-            self.worker.progress.connect(self.update_status_text)
-            self.worker.progress_value.connect(self.update_progress_value)
-            self.worker.start()
-
+            mascara_previa = None
+            if self.mascara_previa and self.mascara_previa[0] == ruta_origen:
+                mascara_previa = self.mascara_previa[1:]
+            if self.enqueue(ruta_origen, ruta_destino, mascara_previa) is None:
+                self.progress_label.setText("⏳ Esta imagen ya está en la cola")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Ha ocurrido un error: {e}")
 
-    def on_process_finished(self):
+    def enqueue(self, ruta_origen, ruta_destino, mascara_previa=None):
+        """Añadir un trabajo a la cola con las opciones actuales de la ventana"""
+        # Hacer backup si está activado
+        if self.check_backup.isChecked() and os.path.exists(ruta_destino):
+            backup_path = str(Path(ruta_destino).with_stem(Path(ruta_destino).stem + "_backup"))
+            if not os.path.exists(backup_path):
+                import shutil
+                shutil.copy(ruta_destino, backup_path)
+
+        _, fondo, _, solo_mascara = FORMATOS_SALIDA[self.combo_formato.currentIndex()]
+        opciones = {
+            "quality": self.slider_calidad.value(),
+            "lado_inferencia": self.combo_resolucion.currentData(),
+            "mascara_previa": mascara_previa,
+            "politica": self.combo_motor.currentData(),
+            # REMOVER_FONDO_PERFIL=archivo.prof perfila cada trabajo con cProfile
+            "perfil": os.environ.get("REMOVER_FONDO_PERFIL"),
+            "fondo": fondo,
+            "descontaminar": self.check_descontaminar.isChecked(),
+            "solo_mascara": solo_mascara,
+            "recortar": self.check_recortar.isChecked(),
+            "margen": self.spin_margen.value(),
+        }
+        trabajo = self.cola.agregar(ruta_origen, ruta_destino, opciones)
+        if trabajo is not None:
+            self.ronda.append(trabajo.id)
+            self.progress_bar.setVisible(True)
+            self.progress_bar.setRange(0, 100)
+            self.progress_bar.setValue(0)
+            self.timer_progreso.start()
+        return trabajo
+
+    def create_worker(self, trabajo):
+        """Worker de un trabajo de la cola (la cola conecta el fin, el error y la cancelación)"""
+        worker = RemoveBackgroundWorker(trabajo.origen, trabajo.destino, **trabajo.opciones)
+        worker.tiempos.connect(self.on_stage_times)
+        return worker
+
+    def on_job_started(self, id):
+        # La etiqueta y la estimación de tiempo siguen al último trabajo que ha arrancado
+        self.worker = self.cola.trabajos[id].worker
+        self.worker.etapa.connect(self.update_stage)
+        self.worker.progress.connect(self.update_status_text)
+
+    def update_job_item(self, id):
+        """Crear o actualizar la línea del trabajo en la lista"""
+        trabajo = self.cola.trabajos.get(id)
+        if trabajo is None:
+            return
+        item = self.items_trabajo.get(id)
+        if item is None:
+            item = QListWidgetItem()
+            item.setData(Qt.ItemDataRole.UserRole, id)
+            self.lista_trabajos.addItem(item)
+            self.items_trabajo[id] = item
+        detalle = trabajo.estado
+        if trabajo.estado == "pendiente" and trabajo.retenido:
+            detalle = f"esperando memoria (≈{trabajo.memoria_mb:.0f} MiB)"
+        elif trabajo.estado == EN_CURSO:
+            etapa = trabajo.worker.cronometro.etapa_actual
+            detalle = "cancelando..." if trabajo.cancelando else NOMBRES_ETAPA.get(etapa, "En marcha")
+            detalle += f" {int(trabajo.worker.cronometro.progreso() * 100)}%"
+        elif trabajo.estado == HECHO and trabajo.resultado:
+            detalle = f"{trabajo.resultado['segundos']:.1f} s con {trabajo.resultado['motor']}"
+        elif trabajo.estado == ERROR:
+            detalle = trabajo.error
+        item.setText(f"{ICONOS_ESTADO[trabajo.estado]} {Path(trabajo.origen).name} → "
+                     f"{Path(trabajo.destino).name}  ·  {detalle}")
+        item.setToolTip(trabajo.error or trabajo.destino)
+
+    def cancel_selected_jobs(self):
+        for item in self.lista_trabajos.selectedItems():
+            self.cola.cancelar(item.data(Qt.ItemDataRole.UserRole))
+
+    def remove_finished_jobs(self):
+        for id in self.cola.quitar_terminados():
+            item = self.items_trabajo.pop(id)
+            self.lista_trabajos.takeItem(self.lista_trabajos.row(item))
+
+    def on_queue_empty(self):
+        """Resumen al vaciarse la cola: el mensaje de siempre si solo había una imagen"""
+        self.timer_progreso.stop()
+        trabajos = [self.cola.trabajos[id] for id in self.ronda if id in self.cola.trabajos]
+        self.ronda = []
+        self.worker = None
+        hechos = [trabajo for trabajo in trabajos if trabajo.estado == HECHO]
+        errores = [trabajo for trabajo in trabajos if trabajo.estado == ERROR]
+        cancelados = len(trabajos) - len(hechos) - len(errores)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFormat("%p%")
+        if len(trabajos) == 1 and errores:
+            self.on_process_error(errores[0].error)
+        elif len(trabajos) == 1 and hechos:
+            self.on_process_finished(hechos[0])
+        elif trabajos:
+            self.progress_bar.setValue(100)
+            self.progress_label.setText(f"✅ {len(hechos)} procesadas, {len(errores)} con error, "
+                                        f"{cancelados} canceladas")
+        else:
+            self.progress_bar.setVisible(False)
+            self.progress_label.setText("🚫 Cancelado")
+
+    def on_process_finished(self, trabajo):
         self.progress_bar.setRange(0, 100)
         self.progress_bar.setValue(100)
+        self.progress_bar.setFormat("%p%")
         self.progress_label.setText("✅ ¡Imagen procesada correctamente!")
+        detalle = ""
+        resultado = trabajo.resultado
+        if resultado and resultado.get("recorte"):
+            recorte = resultado["recorte"]
+            detalle = (f"\n\nRecortada a {recorte['ancho']}x{recorte['alto']} px "
+                       f"(≈{resultado['bytes_ahorrados'] / 1024:.0f} KiB ahorrados)")
         QMessageBox.information(self, "Éxito", 
-            "La imagen ha sido procesada correctamente.\n\nArchivo guardado en:\n" + self.entry_destino.text())
+            "La imagen ha sido procesada correctamente.\n\nArchivo guardado en:\n" + trabajo.destino
+            + detalle)
 
     def on_process_error(self, error):
         self.progress_bar.setVisible(False)
@@ -440,14 +831,54 @@ class BackgroundRemoverGUI(QMainWindow):
     def update_status_text(self, message):
         self.progress_label.setText(f"⏳ {message}")
 
-    def update_progress_value(self, value):
-        if value == -1:
-            self.progress_bar.setRange(0, 0) # Indeterminado
+    def update_stage(self, etapa):
+        self.progress_label.setText(f"⏳ {NOMBRES_ETAPA.get(etapa, etapa)}...")
+
+    def update_progress_estimate(self):
+        """Avanzar la barra con el progreso de la cola y refrescar los trabajos en marcha.
+
+        Cada trabajo terminado cuenta entero y los que están en marcha aportan
+        su progreso estimado por el historial de cada etapa.
+        """
+        trabajos = [self.cola.trabajos[id] for id in self.ronda if id in self.cola.trabajos]
+        if not trabajos:
+            return
+        hecho = 0.0
+        for trabajo in trabajos:
+            if trabajo.estado in TERMINADOS:
+                hecho += 1
+            elif trabajo.estado == EN_CURSO:
+                hecho += trabajo.worker.cronometro.progreso()
+                self.update_job_item(trabajo.id)
+        # Con franjas las etapas se alternan: la barra nunca retrocede
+        valor = max(self.progress_bar.value(), int(hecho / len(trabajos) * 100))
+        self.progress_bar.setValue(valor)
+        restante = self.worker.cronometro.restante() if self.worker is not None else None
+        if len(trabajos) > 1:
+            self.progress_bar.setFormat(f"%p% · {int(sum(t.estado in TERMINADOS for t in trabajos))}"
+                                        f"/{len(trabajos)} imágenes")
         else:
-            self.progress_bar.setRange(0, 100)
-            self.progress_bar.setValue(value)
+            self.progress_bar.setFormat("%p%" if restante is None else f"%p% · ≈{restante:.0f} s restantes")
+
+    def on_stage_times(self, tiempos):
+        detalle = "\n".join(f"{NOMBRES_ETAPA.get(etapa, etapa)}: {segundos:.2f} s"
+                             for etapa, segundos in tiempos.items())
+        self.progress_label.setToolTip(detalle + "\n\n" + obtener_registro().resumen())
+
+    def update_output_extension(self):
+        """Ajustar la extensión del destino al formato elegido.
+
+        La máscara queda en la caché de resultados, así que volver a procesar
+        con otro fondo solo repite la composición, no la inferencia.
+        """
+        ruta_destino = self.entry_destino.text()
+        if ruta_destino:
+            extension = FORMATOS_SALIDA[self.combo_formato.currentIndex()][2]
+            self.entry_destino.setText(str(Path(ruta_destino).with_suffix(extension)))
 
     def clear_fields(self):
+        self.cancel_preview_result()
+        self.mascara_previa = None
         self.entry_origen.clear()
         self.entry_destino.clear()
         self.preview_origen.setText("📷 Preview aquí")
@@ -538,5 +969,7 @@ class BackgroundRemoverGUI(QMainWindow):
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = BackgroundRemoverGUI()
+    # Mostrar la ventana primero y cargar el motor en cuanto se haya pintado
+    window.primer_pintado.connect(window.iniciar_precarga)
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,298 @@
+"""Procesamiento por lotes de carpetas completas con un pool de procesos.
+
+Cada proceso del pool mantiene su propia sesión de rembg precalentada, el
+número de imágenes en vuelo está acotado y un diario en la carpeta de salida
+permite reanudar el lote tras una caída sin repetir lo ya hecho.
+
+Con la canalización activada, cada proceso codifica y escribe sus resultados
+en un hilo aparte mientras segmenta la imagen siguiente. Los resultados de la
+codificación vuelven al proceso principal por una cola y una imagen solo se
+anota en el diario cuando su archivo ya está escrito.
+"""
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from remover_fondo import EXTENSIONES_IMAGEN, procesar_imagen
+from cache_resultados import obtener_cache
+from codificacion import FORMATO_PNG, FORMATOS_MASCARA, SUFIJOS, CodificadorEnSegundoPlano
+from sesiones import MODELO_POR_DEFECTO, AjustesOnnx, obtener_registro
+
+NOMBRE_DIARIO = ".remover_fondo_lote.jsonl"
+# Segundos sin noticias del codificador, con la inferencia ya terminada, antes de darlo por perdido
+ESPERA_MAX_CODIFICACION = 600
+
+_codificador = None
+
+
+def listar_imagenes(dir_entrada):
+    """Imágenes de la carpeta (y subcarpetas) en orden estable"""
+    base = Path(dir_entrada)
+    return sorted(
+        ruta for ruta in base.rglob("*")
+        if ruta.is_file() and ruta.suffix.lower() in EXTENSIONES_IMAGEN
+    )
+
+
+def ruta_salida_para(ruta, dir_entrada, dir_salida, formato=FORMATO_PNG):
+    """Misma estructura de carpetas que la entrada, con el sufijo del formato (_sf.png por defecto)"""
+    relativa = ruta.relative_to(dir_entrada)
+    return Path(dir_salida) / relativa.parent / f"{relativa.stem}{SUFIJOS[formato]}"
+
+
+def leer_diario(ruta_diario):
+    """Conjunto de orígenes ya completados en una ejecución anterior"""
+    completados = set()
+    if not ruta_diario.exists():
+        return completados
+    with open(ruta_diario, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                entrada = json.loads(linea)
+            except ValueError:
+                # Última línea truncada por una caída: se ignora
+                continue
+            if entrada.get("estado") == "ok":
+                completados.add(entrada["origen"])
+    return completados
+
+
+def _inicializar_proceso(modelo, hilos, limite_motor, grabcut, cola_codificados, ajustes_onnx,
+                         refinar_borde, politica):
+    """Inicializador de cada proceso: limitar hilos, configurar motores y precalentar el modelo"""
+    global _codificador
+    from motores import POLITICA_SECUENCIAL, obtener_selector
+
+    if cola_codificados is not None:
+        _codificador = CodificadorEnSegundoPlano(cola_codificados.put)
+
+    # Sin hilos explícitos ni OMP_NUM_THREADS cada sesión usaría todos los núcleos:
+    # se fija el reparto en la sesión para que N procesos no saturen la CPU N veces
+    ajustes_onnx = ajustes_onnx or AjustesOnnx()
+    if "OMP_NUM_THREADS" not in os.environ:
+        ajustes_onnx = ajustes_onnx.con_hilos(hilos)
+    obtener_registro().configurar(ajustes_onnx)
+    selector = obtener_selector()
+    if limite_motor:
+        selector.limites = {nombre: limite_motor for nombre in selector.motores}
+    if grabcut:
+        selector.motores["opencv"].iteraciones, selector.motores["opencv"].lado = grabcut
+    if refinar_borde is not None:
+        selector.configurar_bordes(refinar_borde)
+    # Con un motor fijo que no es rembg, cargar (o descargar) el modelo no sirve de nada
+    politica = politica or POLITICA_SECUENCIAL
+    if politica == "rembg" or politica not in selector.motores:
+        obtener_registro().precalentar(modelo, en_segundo_plano=False)
+
+
+def _procesar_en_proceso(ruta_origen, ruta_destino, modelo, calidad, lado_inferencia,
+                         presupuesto_memoria, usar_cache, politica, opciones_salida):
+    try:
+        Path(ruta_destino).parent.mkdir(parents=True, exist_ok=True)
+        resultado = procesar_imagen(ruta_origen, ruta_destino, modelo, calidad,
+                                    lado_inferencia=lado_inferencia,
+                                    presupuesto_memoria=presupuesto_memoria,
+                                    usar_cache=usar_cache,
+                                    politica=politica,
+                                    codificador=_codificador,
+                                    **opciones_salida)
+        resultado["estado"] = "ok"
+    except Exception as e:
+        resultado = {"origen": str(ruta_origen), "destino": str(ruta_destino),
+                     "estado": "error", "error": str(e)}
+    if usar_cache:
+        # Los procesos del pool no ejecutan atexit: volcar los contadores aquí
+        obtener_cache().guardar_contadores()
+    return resultado
+
+
+def procesar_lote(dir_entrada, dir_salida, procesos=None, max_en_vuelo=None,
+                  ordenado=False, reanudar=True, modelo=MODELO_POR_DEFECTO,
+                  calidad=95, lado_inferencia=None, presupuesto_memoria=None,
+                  usar_cache=True, politica=None, limite_motor=None, grabcut=None,
+                  formato=FORMATO_PNG, nivel_png=None, metodo_webp=None, canalizar=True,
+                  fondo=None, descontaminar=False, recortar=False, margen=None, al_terminar=None,
+                  ajustes_onnx=None, lado_salida=None, refinar_borde=None):
+    """Procesar una carpeta completa y devolver un resumen con imágenes por segundo.
+
+    grabcut es una tupla opcional (iteraciones, lado) para el motor OpenCV.
+    formato es "png", "webp" (sin pérdida), "jpeg", "mascara" (solo el alfa,
+    PNG de un canal) o "rle" (solo el alfa, por tramos). fondo, descontaminar,
+    recortar, margen y lado_salida se pasan a procesar_imagen. ajustes_onnx (sesiones.AjustesOnnx)
+    configura las sesiones de cada proceso y refinar_borde, si se indica, los motores
+    cuya máscara pasa por el refinado del contorno. Con canalizar, la codificación de cada resultado se solapa con
+    la inferencia del siguiente dentro de cada proceso.
+    """
+    dir_entrada = Path(dir_entrada)
+    dir_salida = Path(dir_salida)
+    dir_salida.mkdir(parents=True, exist_ok=True)
+
+    procesos = procesos or os.cpu_count() or 1
+    max_en_vuelo = max_en_vuelo or procesos * 2
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+
+    ruta_diario = dir_salida / NOMBRE_DIARIO
+    completados = leer_diario(ruta_diario) if reanudar else set()
+
+    pendientes = []
+    omitidas = 0
+    for ruta in listar_imagenes(dir_entrada):
+        destino = ruta_salida_para(ruta, dir_entrada, dir_salida, formato)
+        if str(ruta) in completados and destino.exists():
+            omitidas += 1
+            continue
+        pendientes.append((ruta, destino))
+
+    resumen = {"total": len(pendientes) + omitidas, "ok": 0, "errores": 0,
+               "omitidas": omitidas, "desde_cache": 0, "segundos": 0.0,
+               "imagenes_por_segundo": 0.0, "bytes": 0, "segundos_codificacion": 0.0,
+               "bytes_ahorrados": 0, "segundos_decodificacion": 0.0, "bytes_decodificacion": 0}
+    opciones_salida = {"solo_mascara": formato in FORMATOS_MASCARA, "nivel_png": nivel_png,
+                       "metodo_webp": metodo_webp, "fondo": fondo, "descontaminar": descontaminar,
+                       "recortar": recortar, "margen": margen, "lado_salida": lado_salida}
+    cola_codificados = multiprocessing.Queue() if canalizar else None
+    if not pendientes:
+        print(f"Nada que procesar ({omitidas} ya completadas)")
+        return resumen
+
+    inicio = time.perf_counter()
+    modo = "a" if reanudar else "w"
+    with open(ruta_diario, modo, encoding="utf-8") as diario, ProcessPoolExecutor(
+        max_workers=procesos,
+        initializer=_inicializar_proceso,
+        initargs=(modelo, hilos, limite_motor, grabcut, cola_codificados, ajustes_onnx, refinar_borde,
+                  politica),
+    ) as pool:
+
+        def registrar(resultado):
+            diario.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+            diario.flush()
+            if resultado["estado"] == "ok":
+                resumen["ok"] += 1
+                resumen["desde_cache"] += bool(resultado.get("cache"))
+                resumen["bytes"] += resultado.get("bytes", 0)
+                resumen["segundos_codificacion"] += resultado.get("segundos_codificacion", 0.0)
+                resumen["bytes_ahorrados"] += resultado.get("bytes_ahorrados", 0)
+                resumen["segundos_decodificacion"] += resultado.get("segundos_decodificacion", 0.0)
+                resumen["bytes_decodificacion"] += resultado.get("bytes_decodificacion", 0)
+                motores = resumen.setdefault("motores", {})
+                motores[resultado["motor"]] = motores.get(resultado["motor"], 0) + 1
+                etapas = resumen.setdefault("etapas", {})
+                for etapa, segundos in resultado.get("etapas", {}).items():
+                    etapas[etapa] = etapas.get(etapa, 0.0) + segundos
+            else:
+                resumen["errores"] += 1
+                print(f"Error en {resultado['origen']}: {resultado['error']}")
+            if al_terminar:
+                al_terminar(resultado)
+
+        cola = iter(pendientes)
+        en_vuelo = set()
+        # Orígenes en orden de envío y resultados terminados que esperan su turno (modo ordenado)
+        orden = deque()
+        terminados = {}
+        # Inferencias cuya codificación no ha llegado y codificaciones llegadas antes que su inferencia
+        esperando = {}
+        codificados = {}
+
+        def completar(resultado):
+            if not ordenado:
+                registrar(resultado)
+                return
+            terminados[resultado["origen"]] = resultado
+            while orden and orden[0] in terminados:
+                registrar(terminados.pop(orden.popleft()))
+
+        def unir(inferencia, codificacion):
+            resultado = dict(inferencia)
+            resultado.pop("codificacion")
+            etapas = dict(resultado.get("etapas", {}))
+            etapas.update(codificacion.pop("etapas", {}))
+            resultado.update(codificacion)
+            resultado["etapas"] = etapas
+            resultado["segundos"] += codificacion.get("segundos_codificacion", 0.0)
+            return resultado
+
+        def recibir(resultado, desde_codificador):
+            origen = resultado["origen"]
+            if desde_codificador:
+                if origen in esperando:
+                    completar(unir(esperando.pop(origen), resultado))
+                else:
+                    codificados[origen] = resultado
+            elif resultado.get("codificacion") == "pendiente":
+                if origen in codificados:
+                    completar(unir(resultado, codificados.pop(origen)))
+                else:
+                    esperando[origen] = resultado
+            else:
+                completar(resultado)
+
+        def rellenar():
+            # Mantener acotado el trabajo enviado al pool
+            while len(en_vuelo) < max_en_vuelo:
+                siguiente = next(cola, None)
+                if siguiente is None:
+                    return
+                ruta, destino = siguiente
+                orden.append(str(ruta))
+                en_vuelo.add(pool.submit(_procesar_en_proceso, str(ruta), str(destino),
+                                         modelo, calidad, lado_inferencia,
+                                         presupuesto_memoria, usar_cache, politica,
+                                         opciones_salida))
+
+        rellenar()
+        ultima_noticia = time.monotonic()
+        while en_vuelo or esperando:
+            if en_vuelo:
+                hechos, _ = wait(en_vuelo, timeout=0.05 if canalizar else None,
+                                 return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    en_vuelo.remove(futuro)
+                    recibir(futuro.result(), False)
+            while cola_codificados is not None:
+                try:
+                    recibido = cola_codificados.get(timeout=0.5 if not en_vuelo else 0)
+                except queue.Empty:
+                    break
+                recibir(recibido, True)
+                ultima_noticia = time.monotonic()
+            if en_vuelo:
+                ultima_noticia = time.monotonic()
+            elif esperando and time.monotonic() - ultima_noticia > ESPERA_MAX_CODIFICACION:
+                for inferencia in list(esperando.values()):
+                    inferencia.pop("codificacion")
+                    inferencia.update({"estado": "error", "error": "El codificador no respondió"})
+                    completar(inferencia)
+                esperando.clear()
+            rellenar()
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    procesadas = resumen["ok"] + resumen["errores"]
+    resumen["imagenes_por_segundo"] = procesadas / resumen["segundos"] if resumen["segundos"] else 0.0
+
+    print(
+        f"Lote terminado: {resumen['ok']} correctas, {resumen['errores']} con error, "
+        f"{resumen['omitidas']} omitidas, {resumen['desde_cache']} desde caché "
+        f"en {resumen['segundos']:.1f} s "
+        f"({resumen['imagenes_por_segundo']:.2f} img/s)"
+    )
+    if resumen.get("motores"):
+        print("Motores usados: " + ", ".join(f"{nombre} {n}" for nombre, n in resumen["motores"].items()))
+    if resumen["bytes"]:
+        ahorro = (f" (≈{resumen['bytes_ahorrados'] / 2**20:.1f} MiB ahorrados con el recorte)"
+                  if resumen["bytes_ahorrados"] else "")
+        print(f"Escritos {resumen['bytes'] / 2**20:.1f} MiB en {resumen['segundos_codificacion']:.1f} s "
+              f"de codificación{ahorro}")
+    if resumen["bytes_decodificacion"]:
+        print(f"Decodificados {resumen['bytes_decodificacion'] / 2**20:.1f} MiB de píxeles en "
+              f"{resumen['segundos_decodificacion']:.1f} s")
+    if resumen.get("etapas"):
+        print("Tiempo por etapa: " + ", ".join(f"{etapa} {segundos:.1f} s"
+                                               for etapa, segundos in resumen["etapas"].items()))
+    return resumen
@@ -0,0 +1,238 @@
+"""Procesamiento por franjas con memoria acotada para imágenes muy grandes.
+
+La segmentación se hace una sola vez sobre una copia reducida (máscara global
+de baja resolución, que mantiene la coherencia entre franjas). Después la
+imagen se recorre por franjas horizontales: para cada una se calcula el alfa a
+resolución completa con el filtro guiado, se compone RGBA y se comprime
+directamente al PNG de salida, sin construir nunca el resultado completo en RAM.
+Con un fondo de color sólido se mezcla cada franja y se escribe un PNG RGB.
+"""
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from composicion import mezclar
+from decodificacion import alfa_de_origen, bytes_de, combinar_alfa, decodificar, memoria_decodificacion
+from motores import POLITICA_SECUENCIAL, segmentar_auto
+from refinado import aplicar_coeficientes, coeficientes_guiados, reducir_para_inferencia
+from remover_fondo import clave_mascara, misma_proporcion, ruta_temporal
+from sesiones import MODELO_POR_DEFECTO
+
+# Bytes por píxel del camino normal: decodificado, RGB, RGBA, guía y coeficientes float32
+BYTES_POR_PIXEL_COMPLETO = 24
+# Bytes por píxel de una franja RGB: recorte, array RGB, gris, dos coeficientes float32, alfa,
+# RGBA de salida y filas filtradas
+BYTES_POR_PIXEL_FRANJA = 3 + 3 + 1 + 8 + 1 + 4 + 5
+# Extra de una franja RGBA: recorte de 4 canales, su conversión a RGB y el alfa combinado
+EXTRA_FRANJA_RGBA = 1 + 3 + 1
+FILAS_MINIMAS = 16
+LADO_MASCARA_GLOBAL = 1024
+
+
+def necesita_franjas(image, presupuesto_mb):
+    """Indicar si el camino normal superaría el presupuesto de memoria"""
+    if not presupuesto_mb:
+        return False
+    return image.width * image.height * BYTES_POR_PIXEL_COMPLETO > presupuesto_mb * 2**20
+
+
+def alto_de_franja(ancho, alto, presupuesto_mb, bytes_imagen, bytes_por_pixel=BYTES_POR_PIXEL_FRANJA):
+    """Filas por franja para que los buffers de trabajo quepan en el presupuesto.
+
+    bytes_imagen es lo que ocupa la imagen decodificada (y su alfa de origen),
+    que sigue en memoria mientras se recorren las franjas. Lanza MemoryError
+    si no queda sitio ni para FILAS_MINIMAS filas.
+    """
+    disponible = presupuesto_mb * 2**20 - bytes_imagen
+    filas = disponible // (ancho * bytes_por_pixel)
+    if filas < min(FILAS_MINIMAS, alto):
+        raise MemoryError(
+            f"La imagen decodificada ocupa {bytes_imagen / 2**20:.1f} MiB y no deja sitio para las franjas "
+            f"en el presupuesto de {presupuesto_mb} MiB; aumenta el presupuesto de memoria (--memoria-max)")
+    return int(min(alto, filas))
+
+
+class EscritorPNG:
+    """Escritor de PNG RGBA (o RGB con canales=3) de 8 bits que comprime las filas según llegan"""
+
+    def __init__(self, ruta, ancho, alto, nivel_compresion=6, tamano_idat=1 << 20, canales=4):
+        self.ruta = Path(ruta)
+        self.ancho = ancho
+        self.alto = alto
+        self.canales = canales
+        self.tamano_idat = tamano_idat
+        self.filas_escritas = 0
+        self.bytes_escritos = 0
+        self._compresor = zlib.compressobj(nivel_compresion)
+        self._pendiente = bytearray()
+        self._temporal = ruta_temporal(self.ruta)
+        self._archivo = None
+
+    def __enter__(self):
+        self._archivo = open(self._temporal, "wb")
+        self._archivo.write(b"\x89PNG\r\n\x1a\n")
+        self.bytes_escritos = 8
+        # Profundidad 8, tipo de color 6 (RGBA) o 2 (RGB), compresión, filtro y entrelazado por defecto
+        tipo_color = 6 if self.canales == 4 else 2
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", self.ancho, self.alto, 8, tipo_color, 0, 0, 0))
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        try:
+            if tipo is None:
+                if self.filas_escritas != self.alto:
+                    raise ValueError(f"Se esperaban {self.alto} filas y se escribieron {self.filas_escritas}")
+                self._pendiente += self._compresor.flush()
+                self._volcar(forzar=True)
+                self._chunk(b"IEND", b"")
+            self._archivo.close()
+            if tipo is None:
+                os.replace(self._temporal, self.ruta)
+        finally:
+            try:
+                self._temporal.unlink()
+            except FileNotFoundError:
+                pass
+        return False
+
+    def _chunk(self, tipo, datos):
+        self._archivo.write(struct.pack(">I", len(datos)))
+        self._archivo.write(tipo)
+        self._archivo.write(datos)
+        self._archivo.write(struct.pack(">I", zlib.crc32(datos, zlib.crc32(tipo)) & 0xFFFFFFFF))
+        self.bytes_escritos += len(datos) + 12
+
+    def _volcar(self, forzar=False):
+        while len(self._pendiente) >= self.tamano_idat or (forzar and self._pendiente):
+            trozo = bytes(self._pendiente[:self.tamano_idat])
+            del self._pendiente[:self.tamano_idat]
+            self._chunk(b"IDAT", trozo)
+
+    def escribir_filas(self, rgba):
+        """Añadir un bloque de filas (alto x ancho x canales, uint8)"""
+        c = self.canales
+        # Filtro PNG "Sub" (tipo 1): diferencia con el píxel de la izquierda, vectorizado
+        filtrado = np.empty((rgba.shape[0], self.ancho * c + 1), np.uint8)
+        filtrado[:, 0] = 1
+        filas = rgba.reshape(rgba.shape[0], -1)
+        filtrado[:, 1:c + 1] = filas[:, :c]
+        np.subtract(filas[:, c:], filas[:, :-c], out=filtrado[:, c + 1:])
+        self._pendiente += self._compresor.compress(filtrado.data)
+        self.filas_escritas += rgba.shape[0]
+        self._volcar()
+
+
+def procesar_por_franjas(ruta_origen, ruta_destino, presupuesto_mb, modelo=MODELO_POR_DEFECTO,
+                         lado_inferencia=None, progreso=None, politica=None, cronometro=None,
+                         nivel_compresion=6, fondo=None, usar_cache=False, mascara_previa=None):
+    """Eliminar el fondo escribiendo el PNG de salida franja a franja.
+
+    La imagen de origen se decodifica una sola vez (3 B/px, o 5 con alfa); el
+    resto de buffers se limitan a una franja cuyo alto se calcula a partir de
+    presupuesto_mb. Si la decodificación sola no cabe en el presupuesto, se
+    lanza MemoryError antes de decodificar.
+    Los tiempos de las franjas se suman por etapa en cronometro. fondo es un
+    color RGB opcional sobre el que se mezcla cada franja. Con usar_cache, la
+    máscara global de baja resolución se busca y se guarda en la caché de
+    resultados con la misma clave que procesar_imagen; mascara_previa se usa
+    como en procesar_imagen. El ajuste del contorno no se aplica.
+    """
+    from instrumentacion import Cronometro
+
+    avisar = progreso or (lambda mensaje: None)
+    cronometro = cronometro or Cronometro()
+    inicio = time.perf_counter()
+
+    avisar("Cargando imagen")
+    with cronometro.etapa("decodificacion"):
+        with Image.open(ruta_origen) as cabecera:
+            _, pico = memoria_decodificacion(cabecera)
+        if pico > presupuesto_mb * 2**20:
+            raise MemoryError(
+                f"Decodificar la imagen necesita {pico / 2**20:.1f} MiB y no cabe en el presupuesto de "
+                f"{presupuesto_mb} MiB; aumenta el presupuesto de memoria (--memoria-max)")
+        image, decodificado = decodificar(ruta_origen)
+        alfa_origen = alfa_de_origen(image)
+    ancho, alto = image.size
+    bytes_imagen = bytes_de(image) + (alfa_origen.nbytes if alfa_origen is not None else 0)
+
+    politica = politica or POLITICA_SECUENCIAL
+    lado_inferencia = lado_inferencia or LADO_MASCARA_GLOBAL
+    reducida = reducir_para_inferencia(image, lado_inferencia)
+    guardado = None
+    if usar_cache:
+        from cache_resultados import obtener_cache
+
+        with cronometro.etapa("cache"):
+            cache = obtener_cache()
+            clave = clave_mascara(cache, image, modelo, politica, lado_inferencia)
+            guardado = cache.obtener(clave)
+
+    if guardado is not None:
+        avisar("Usando resultado en caché")
+        mask, motor = guardado
+    elif mascara_previa is not None and misma_proporcion(mascara_previa[0], image):
+        mask, motor = mascara_previa
+    else:
+        avisar("Procesando imagen (esto puede tardar)")
+        informe = {}
+        with cronometro.etapa("inferencia"):
+            mask, motor = segmentar_auto(reducida, modelo, progreso, politica, informe)
+        # Igual que en procesar_imagen: la máscara de un motor de respaldo no se guarda
+        if usar_cache and not informe.get("respaldo"):
+            with cronometro.etapa("cache"):
+                cache.guardar(clave, mask, motor)
+    with cronometro.etapa("refinado"):
+        # Una máscara de la caché puede venir a resolución completa del camino normal
+        if mask.shape[0] > reducida.height:
+            mask = cv2.resize(mask, reducida.size, interpolation=cv2.INTER_AREA)
+        guia_baja = reducida.convert('L')
+        if guia_baja.size != (mask.shape[1], mask.shape[0]):
+            guia_baja = guia_baja.resize((mask.shape[1], mask.shape[0]), Image.Resampling.BILINEAR)
+        a, b = coeficientes_guiados(mask, guia_baja)
+    del reducida, guia_baja, mask
+
+    filas = alto_de_franja(ancho, alto, presupuesto_mb, bytes_imagen,
+                           BYTES_POR_PIXEL_FRANJA + (EXTRA_FRANJA_RGBA if image.mode == 'RGBA' else 0))
+    avisar(f"Guardando por franjas de {filas} filas")
+    # Un único buffer para todas las franjas; la última usa una vista más corta
+    canales = 4 if fondo is None else 3
+    buffer_rgba = np.empty((filas, ancho, canales), np.uint8)
+    with EscritorPNG(ruta_destino, ancho, alto, nivel_compresion, canales=canales) as png:
+        for y0 in range(0, alto, filas):
+            y1 = min(alto, y0 + filas)
+            with cronometro.etapa("refinado"):
+                franja = image.crop((0, y0, ancho, y1))
+                rgb = np.asarray(franja if franja.mode == 'RGB' else franja.convert('RGB'))
+                gris = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+                alpha = aplicar_coeficientes(a, b, gris, y0, alto, ancho)
+                if alfa_origen is not None:
+                    alpha = combinar_alfa(alpha, alfa_origen[y0:y1])
+            with cronometro.etapa("composicion"):
+                rgba = buffer_rgba[:y1 - y0]
+                if fondo is None:
+                    rgba[:, :, :3] = rgb
+                    rgba[:, :, 3] = alpha
+                else:
+                    mezclar(rgb, alpha, fondo, salida=rgba)
+            with cronometro.etapa("codificacion"):
+                png.escribir_filas(rgba)
+
+    return {
+        "origen": str(ruta_origen),
+        "destino": str(ruta_destino),
+        "motor": motor,
+        "cache": guardado is not None,
+        "segundos": time.perf_counter() - inicio,
+        "franjas": -(-alto // filas),
+        "bytes": png.bytes_escritos,
+        "segundos_codificacion": cronometro.tiempos.get("codificacion", 0.0),
+        "segundos_decodificacion": decodificado["segundos"],
+        "bytes_decodificacion": decodificado["bytes"],
+    }
@@ -0,0 +1,568 @@
+"""Motores de eliminación de fondo sin dependencias de la interfaz gráfica"""
+import atexit
+import threading
+import time
+from PIL import Image
+import cv2
+import numpy as np
+
+from cargador import obtener_cargador
+from sesiones import MODELO_POR_DEFECTO, obtener_registro
+
+# GrabCut: iteraciones, lado mayor del camino rápido (None = resolución completa)
+# y tamaño de los bloques del pase fino en el borde
+ITERACIONES_GRABCUT = 5
+LADO_GRABCUT = 640
+BLOQUE_GRABCUT = 256
+
+
+def mascara_rembg(image, modelo=MODELO_POR_DEFECTO):
+    """Máscara alfa (uint8) de rembg usando una sesión reutilizada"""
+    # Convertir a RGB si tiene alpha para evitar errores en rembg
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    mask = obtener_registro().inferir(image, modelo, only_mask=True)
+    return np.asarray(mask, dtype=np.uint8)
+
+
+class PoolSegmentadores:
+    """Segmentadores de MediaPipe reutilizables, confinados a un hilo mientras se usan.
+
+    Construir el grafo de SelfieSegmentation cuesta más que segmentar un
+    retrato, así que cada instancia se crea una vez y se devuelve al pool al
+    terminar. Un segmentador nunca lo usan dos hilos a la vez: quien lo toma
+    lo tiene en exclusiva hasta devolverlo.
+    """
+
+    def __init__(self, model_selection=1):
+        self.model_selection = model_selection
+        self._libres = []
+        self._todos = []
+        self._candado = threading.Lock()
+
+    def _crear(self):
+        mp = obtener_cargador().modulo("mediapipe")
+        # model_selection=1 para paisaje/cuerpo completo, 0 para general
+        segmentador = mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=self.model_selection)
+        with self._candado:
+            self._todos.append(segmentador)
+        return segmentador
+
+    def procesar(self, image_np):
+        """Segmentar un array RGB uint8 y devolver la máscara float32 en [0, 1]"""
+        with self._candado:
+            segmentador = self._libres.pop() if self._libres else None
+        if segmentador is None:
+            segmentador = self._crear()
+        try:
+            return segmentador.process(image_np).segmentation_mask
+        finally:
+            with self._candado:
+                self._libres.append(segmentador)
+
+    def cerrar(self):
+        """Liberar los grafos de MediaPipe"""
+        with self._candado:
+            todos, self._todos, self._libres = self._todos, [], []
+        for segmentador in todos:
+            segmentador.close()
+
+
+_pool_mediapipe = None
+_candado_pool = threading.Lock()
+
+
+def obtener_pool_mediapipe():
+    """Pool de segmentadores de MediaPipe compartido por todo el proceso"""
+    global _pool_mediapipe
+    with _candado_pool:
+        if _pool_mediapipe is None:
+            _pool_mediapipe = PoolSegmentadores()
+            atexit.register(_pool_mediapipe.cerrar)
+        return _pool_mediapipe
+
+
+def mascara_mediapipe(image):
+    """Máscara alfa de alta calidad para personas usando MediaPipe"""
+    # MediaPipe solo se importa la primera vez que se usa este motor
+    if not obtener_cargador().disponible("mediapipe"):
+        raise ImportError("MediaPipe no está instalado")
+
+    # Sin copias extra si la imagen ya es RGB (el caso normal tras segmentar_auto)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    mask = obtener_pool_mediapipe().procesar(np.asarray(image))
+
+    # La máscara viene en rango [0, 1] float; escalar a 0-255 en una sola pasada
+    # para mantener la suavidad de los bordes (matting)
+    return cv2.convertScaleAbs(mask, alpha=255.0)
+
+
+def mascara_opencv(image, iteraciones=ITERACIONES_GRABCUT, lado=LADO_GRABCUT):
+    """Máscara alfa utilizando OpenCV y GrabCut mejorado.
+
+    Si la imagen supera lado (en píxeles), se usa el camino rápido de
+    mascara_opencv_rapida; lado=None fuerza GrabCut a resolución completa.
+    """
+    if lado and max(image.size) > lado:
+        try:
+            return mascara_opencv_rapida(image, iteraciones, lado)
+        except Exception as e:
+            print(f"Error en mascara_opencv_rapida: {e}")
+    try:
+        # Convertir PIL Image a formato OpenCV
+        cv_image = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+        
+        # Añadir padding (borde) a la imagen para evitar 'recortes' en los bordes
+        # esto permite que GrabCut no asuma automáticamente que los bordes de la imagen son fondo
+        pad = 20
+        cv_image_padded = cv2.copyMakeBorder(cv_image, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+        
+        # Crear máscaras para GrabCut con el tamaño del padding
+        mask = np.zeros(cv_image_padded.shape[:2], np.uint8)
+        bgdModel = np.zeros((1, 65), np.float64)
+        fgdModel = np.zeros((1, 65), np.float64)
+        
+        # Definir rectángulo que abarca TODA la imagen original dentro del padding
+        # El rectángulo es (x, y, w, h)
+        height, width = cv_image.shape[:2]
+        rect = (pad, pad, width, height)
+        
+        # Ejecutar GrabCut
+        cv2.grabCut(cv_image_padded, mask, rect, bgdModel, fgdModel, iteraciones, cv2.GC_INIT_WITH_RECT)
+        
+        # Recuperar la máscara correspondiente a la imagen original (quitando padding)
+        mask_padded = np.where((mask == 2) | (mask == 0), 0, 1).astype('uint8')
+        mask2 = mask_padded[pad:pad+height, pad:pad+width]
+        
+        # Aplicar dilatación y erosión para suavizar bordes
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        mask2 = cv2.morphologyEx(mask2, cv2.MORPH_CLOSE, kernel, iterations=2)
+        
+        # Aplicar Gaussian Blur para suavizado de bordes
+        mask2 = cv2.GaussianBlur(mask2, (5, 5), 0)
+        
+        # Normalizar máscara a rango 0-255
+        return np.uint8(mask2 * 255)
+        
+    except Exception as e:
+        print(f"Error en mascara_opencv: {e}")
+        # Si falla todo, conservar la imagen original completa
+        return np.full((image.height, image.width), 255, np.uint8)
+
+
+def mascara_opencv_rapida(image, iteraciones=ITERACIONES_GRABCUT, lado=LADO_GRABCUT,
+                          tamano_bloque=BLOQUE_GRABCUT):
+    """GrabCut de grueso a fino: iteraciones en baja resolución y un pase fino en el borde.
+
+    1. Las iteraciones de GrabCut se ejecutan sobre una copia con el lado mayor
+       limitado a lado.
+    2. La máscara se escala a resolución completa y se marca como incierta una
+       banda de un píxel reducido a cada lado del contorno.
+    3. Solo los bloques que contienen banda incierta reciben una iteración de
+       GrabCut a resolución completa, así que el coste depende de la longitud
+       del borde y no del área de la imagen.
+    """
+    pad = 20
+    rgb = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'))
+    alto, ancho = rgb.shape[:2]
+    escala = lado / max(alto, ancho)
+    ancho_bajo, alto_bajo = max(1, round(ancho * escala)), max(1, round(alto * escala))
+    pequena = cv2.cvtColor(cv2.resize(rgb, (ancho_bajo, alto_bajo), interpolation=cv2.INTER_AREA),
+                           cv2.COLOR_RGB2BGR)
+
+    # 1. Iteraciones en baja resolución, con el mismo padding que el camino completo
+    pequena_padded = cv2.copyMakeBorder(pequena, pad, pad, pad, pad, cv2.BORDER_REPLICATE)
+    mask = np.zeros(pequena_padded.shape[:2], np.uint8)
+    bgdModel = np.zeros((1, 65), np.float64)
+    fgdModel = np.zeros((1, 65), np.float64)
+    cv2.grabCut(pequena_padded, mask, (pad, pad, ancho_bajo, alto_bajo), bgdModel, fgdModel,
+                iteraciones, cv2.GC_INIT_WITH_RECT)
+    mask = mask[pad:pad+alto_bajo, pad:pad+ancho_bajo]
+    primer_plano = ((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD)).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    primer_plano = cv2.morphologyEx(primer_plano, cv2.MORPH_CLOSE, kernel, iterations=2)
+
+    # 2. Banda incierta en baja resolución y escalado a tamaño completo
+    kernel_banda = np.ones((3, 3), np.uint8)
+    banda = cv2.dilate(primer_plano, kernel_banda) != cv2.erode(primer_plano, kernel_banda)
+    primer_plano = cv2.resize(primer_plano * 255, (ancho, alto), interpolation=cv2.INTER_LINEAR) >= 128
+    banda = cv2.resize(banda.astype(np.uint8), (ancho, alto), interpolation=cv2.INTER_NEAREST).astype(bool)
+
+    resultado = primer_plano.astype(np.uint8) * 255
+    # 3. Una iteración a resolución completa, solo en los bloques que tocan la banda
+    for y in range(0, alto, tamano_bloque):
+        for x in range(0, ancho, tamano_bloque):
+            bloque_banda = banda[y:y+tamano_bloque, x:x+tamano_bloque]
+            if not bloque_banda.any():
+                continue
+            bloque_fg = primer_plano[y:y+tamano_bloque, x:x+tamano_bloque]
+            etiquetas = np.where(bloque_fg, cv2.GC_FGD, cv2.GC_BGD).astype(np.uint8)
+            etiquetas[bloque_banda] = np.where(bloque_fg[bloque_banda], cv2.GC_PR_FGD, cv2.GC_PR_BGD)
+            # GrabCut necesita muestras seguras de fondo y de primer plano para sus modelos
+            if not (etiquetas == cv2.GC_FGD).any() or not (etiquetas == cv2.GC_BGD).any():
+                continue
+            bloque_bgr = cv2.cvtColor(rgb[y:y+tamano_bloque, x:x+tamano_bloque], cv2.COLOR_RGB2BGR)
+            bgd_bloque = np.zeros((1, 65), np.float64)
+            fgd_bloque = np.zeros((1, 65), np.float64)
+            cv2.grabCut(bloque_bgr, etiquetas, None, bgd_bloque, fgd_bloque, 1, cv2.GC_INIT_WITH_MASK)
+            refinado = (etiquetas == cv2.GC_FGD) | (etiquetas == cv2.GC_PR_FGD)
+            resultado[y:y+tamano_bloque, x:x+tamano_bloque] = refinado.astype(np.uint8) * 255
+
+    # Suavizado de bordes (sobre 0-255 para que el desenfoque produzca valores intermedios)
+    return cv2.GaussianBlur(resultado, (5, 5), 0)
+
+
+def envolver_mascara(mask):
+    """Imagen PIL de un canal que comparte memoria con la máscara (sin copiarla)"""
+    mask = np.ascontiguousarray(mask, dtype=np.uint8)
+    return Image.frombuffer('L', (mask.shape[1], mask.shape[0]), mask, 'raw', 'L', 0, 1)
+
+
+def aplicar_mascara(image, mask, destino=None):
+    """Componer la imagen RGB con la máscara como canal alfa.
+
+    Solo se reserva el buffer RGBA de salida; si se pasa destino (una imagen
+    RGBA del mismo tamaño), se reutiliza y no se reserva nada.
+    """
+    if destino is None:
+        destino = image.convert('RGBA')
+    elif destino is not image:
+        destino.paste(image)
+    destino.putalpha(envolver_mascara(mask))
+    return destino
+
+
+class Motor:
+    """Interfaz común de los motores: segmentar una imagen RGB y devolver su máscara"""
+    nombre = ""
+    descripcion = ""
+    # Latencia inicial estimada (s/MP) mientras no haya mediciones reales
+    coste_estimado = 1.0
+    # Pasar la máscara por el refinado de borde en banda estrecha (refinado.refinar_borde)
+    refinar_borde = False
+
+    def disponible(self):
+        return True
+
+    def parametros(self):
+        """Ajustes del motor que cambian la máscara (entran en la clave de la caché)"""
+        return {}
+
+    def segmentar(self, image, modelo=None):
+        raise NotImplementedError
+
+
+class MotorRembg(Motor):
+    nombre = "rembg"
+    descripcion = "AI Avanzada (rembg)"
+    coste_estimado = 0.5
+
+    def disponible(self):
+        return obtener_cargador().disponible("rembg")
+
+    def segmentar(self, image, modelo=None):
+        return mascara_rembg(image, modelo or MODELO_POR_DEFECTO)
+
+
+class MotorMediapipe(Motor):
+    nombre = "mediapipe"
+    descripcion = "AI de Google (MediaPipe)"
+    coste_estimado = 0.05
+    # segmentation_mask es una probabilidad que no sigue los bordes de color
+    refinar_borde = True
+
+    def disponible(self):
+        return obtener_cargador().disponible("mediapipe")
+
+    def segmentar(self, image, modelo=None):
+        return mascara_mediapipe(image)
+
+
+class MotorOpencv(Motor):
+    nombre = "opencv"
+    descripcion = "método clásico (OpenCV)"
+    coste_estimado = 5.0
+    # GrabCut da un borde duro que solo suaviza el desenfoque final
+    refinar_borde = True
+
+    def __init__(self, iteraciones=ITERACIONES_GRABCUT, lado=LADO_GRABCUT):
+        self.iteraciones = iteraciones
+        self.lado = lado
+
+    def parametros(self):
+        return {"iteraciones": self.iteraciones, "lado": self.lado}
+
+    def segmentar(self, image, modelo=None):
+        return mascara_opencv(image, self.iteraciones, self.lado)
+
+
+class EstadisticasMotor:
+    """Latencia media móvil (EWMA) por megapíxel y recuento de éxitos y fallos"""
+
+    def __init__(self, coste_inicial, alfa=0.3):
+        self.alfa = alfa
+        self.segundos_por_mp = coste_inicial
+        self.medido = False
+        self.exitos = 0
+        self.fallos = 0
+        self.segundos_total = 0.0
+
+    def registrar_exito(self, segundos, megapixeles):
+        por_mp = segundos / max(megapixeles, 0.01)
+        if self.medido:
+            self.segundos_por_mp += self.alfa * (por_mp - self.segundos_por_mp)
+        else:
+            self.segundos_por_mp = por_mp
+            self.medido = True
+        self.exitos += 1
+        self.segundos_total += segundos
+
+    def registrar_fallo(self, segundos):
+        self.fallos += 1
+        self.segundos_total += segundos
+
+
+class Interruptor:
+    """Circuit breaker: tras varios fallos seguidos el motor se salta durante un tiempo.
+
+    Pasado el enfriamiento (estado semiabierto) permite() deja pasar un único
+    intento de prueba; quien lo recibe debe informar con exito() o fallo().
+    """
+
+    def __init__(self, umbral_fallos=3, enfriamiento=60.0):
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self.fallos_seguidos = 0
+        self.abierto_hasta = 0.0
+        self._candado = threading.Lock()
+
+    def permite(self):
+        with self._candado:
+            ahora = time.monotonic()
+            if ahora < self.abierto_hasta:
+                return False
+            if self.fallos_seguidos >= self.umbral_fallos:
+                # Semiabierto: el intento de prueba vuelve a cerrar el paso a los demás
+                # hasta que informe (o pase otro enfriamiento si nunca lo hace)
+                self.abierto_hasta = ahora + self.enfriamiento
+            return True
+
+    def exito(self):
+        with self._candado:
+            self.fallos_seguidos = 0
+            self.abierto_hasta = 0.0
+
+    def fallo(self):
+        with self._candado:
+            self.fallos_seguidos += 1
+            if self.fallos_seguidos >= self.umbral_fallos:
+                self.abierto_hasta = time.monotonic() + self.enfriamiento
+
+    @property
+    def abierto(self):
+        return time.monotonic() < self.abierto_hasta
+
+
+POLITICA_SECUENCIAL = "secuencial"
+POLITICA_RAPIDA = "rapido"
+POLITICA_HEURISTICA = "heuristica"
+POLITICAS = (POLITICA_SECUENCIAL, POLITICA_RAPIDA, POLITICA_HEURISTICA, "rembg", "mediapipe", "opencv")
+
+
+# CascadeClassifier no es seguro entre hilos: uno por hilo, cargado la primera vez
+_clasificadores = threading.local()
+
+
+def _clasificador_caras():
+    clasificador = getattr(_clasificadores, "caras", None)
+    if clasificador is None:
+        clasificador = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        _clasificadores.caras = clasificador
+    return clasificador
+
+
+def parece_retrato(image, lado=320):
+    """Heurística barata: hay una cara frontal que ocupa una parte apreciable de la imagen"""
+    pequena = image.convert('L')
+    pequena.thumbnail((lado, lado))
+    gris = np.asarray(pequena)
+    caras = _clasificador_caras().detectMultiScale(gris, scaleFactor=1.2, minNeighbors=5,
+                                          minSize=(gris.shape[1] // 12, gris.shape[1] // 12))
+    if len(caras) == 0:
+        return False
+    area_caras = max(w * h for (_, _, w, h) in caras)
+    return area_caras >= 0.01 * gris.size
+
+
+def _ejecutar_con_limite(funcion, limite):
+    """Ejecutar funcion() y lanzar TimeoutError si tarda más de limite segundos.
+
+    El hilo de un motor que agota el tiempo no se puede interrumpir: sigue en
+    segundo plano hasta terminar, pero su resultado se descarta.
+    """
+    if not limite:
+        return funcion()
+    resultado = {}
+
+    def objetivo():
+        try:
+            resultado["valor"] = funcion()
+        except BaseException as e:
+            resultado["error"] = e
+
+    hilo = threading.Thread(target=objetivo, name="motor-con-limite", daemon=True)
+    hilo.start()
+    hilo.join(limite)
+    if hilo.is_alive():
+        raise TimeoutError(f"El motor superó el límite de {limite:.0f} s")
+    if "error" in resultado:
+        raise resultado["error"]
+    return resultado["valor"]
+
+
+class SelectorMotores:
+    """Elige el motor según una política, con límites de tiempo y circuit breakers.
+
+    Políticas: "secuencial" (rembg → MediaPipe → OpenCV, el comportamiento
+    clásico), "rapido" (el disponible con menor latencia media por megapíxel),
+    "heuristica" (retratos a MediaPipe, el resto como "rapido") o el nombre de
+    un motor para usar solo ese.
+    """
+
+    def __init__(self, motores=None, limites=None, umbral_fallos=3, enfriamiento=60.0):
+        motores = motores or [MotorRembg(), MotorMediapipe(), MotorOpencv()]
+        self.motores = {motor.nombre: motor for motor in motores}
+        self.limites = dict(limites or {})
+        self.estadisticas = {motor.nombre: EstadisticasMotor(motor.coste_estimado) for motor in motores}
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self.interruptores = {motor.nombre: Interruptor(umbral_fallos, enfriamiento) for motor in motores}
+        self._candado = threading.Lock()
+
+    def registrar(self, motor, limite=None):
+        """Añadir (o sustituir) un motor; el orden de registro es el de la política secuencial"""
+        with self._candado:
+            self.motores[motor.nombre] = motor
+            self.estadisticas[motor.nombre] = EstadisticasMotor(motor.coste_estimado)
+            self.interruptores[motor.nombre] = Interruptor(self.umbral_fallos, self.enfriamiento)
+            if limite:
+                self.limites[motor.nombre] = limite
+
+    def configurar_bordes(self, nombres):
+        """Activar el refinado de borde solo en estos motores"""
+        with self._candado:
+            for nombre, motor in self.motores.items():
+                motor.refinar_borde = nombre in nombres
+
+    def refina_borde(self, nombre):
+        motor = self.motores.get(nombre)
+        return motor is not None and motor.refinar_borde
+
+    def motores_con_borde(self):
+        return [nombre for nombre, motor in self.motores.items() if motor.refinar_borde]
+
+    def parametros_mascara(self, politica=POLITICA_SECUENCIAL):
+        """Ajustes de los motores que la política puede elegir, para claves de caché y huellas"""
+        nombres = [politica] if politica in self.motores else list(self.motores)
+        with self._candado:
+            return {nombre: self.motores[nombre].parametros() for nombre in nombres
+                    if self.motores[nombre].parametros()}
+
+    def _por_latencia(self, nombres):
+        with self._candado:
+            return sorted(nombres, key=lambda nombre: self.estadisticas[nombre].segundos_por_mp)
+
+    def candidatos(self, image, politica=POLITICA_SECUENCIAL):
+        """Motores a intentar, en orden, para esta imagen y política"""
+        nombres = [nombre for nombre, motor in self.motores.items() if motor.disponible()]
+        if politica in self.motores:
+            return [politica]
+        if politica == POLITICA_RAPIDA:
+            return self._por_latencia(nombres)
+        if politica == POLITICA_HEURISTICA:
+            orden = self._por_latencia(nombres)
+            if "mediapipe" in orden and parece_retrato(image):
+                orden.remove("mediapipe")
+                orden.insert(0, "mediapipe")
+            return orden
+        if politica != POLITICA_SECUENCIAL:
+            raise ValueError(f"Política de motor desconocida: {politica}")
+        return nombres
+
+    def segmentar(self, image, politica=POLITICA_SECUENCIAL, modelo=None, progreso=None, informe=None):
+        """Segmentar con el primer motor que funcione; devuelve (máscara, nombre del motor).
+
+        Si se pasa un dict en informe, informe["respaldo"] indica si la máscara
+        viene de un motor de respaldo porque el primero de la política falló o
+        tenía el interruptor abierto.
+        """
+        avisar = progreso or (lambda mensaje: None)
+        megapixeles = image.width * image.height / 1e6
+        errores = []
+
+        candidatos = self.candidatos(image, politica)
+        for nombre in candidatos:
+            motor = self.motores[nombre]
+            with self._candado:
+                interruptor = self.interruptores[nombre]
+                if not interruptor.permite():
+                    errores.append(f"{nombre}: desactivado tras fallos repetidos")
+                    continue
+
+            avisar(f"Usando {motor.descripcion}")
+            inicio = time.perf_counter()
+            try:
+                mask = _ejecutar_con_limite(lambda: motor.segmentar(image, modelo), self.limites.get(nombre))
+            except Exception as e:
+                print(f"Error {nombre}: {e}")
+                errores.append(f"{nombre}: {e}")
+                with self._candado:
+                    self.estadisticas[nombre].registrar_fallo(time.perf_counter() - inicio)
+                    interruptor.fallo()
+                continue
+
+            with self._candado:
+                self.estadisticas[nombre].registrar_exito(time.perf_counter() - inicio, megapixeles)
+                interruptor.exito()
+            if informe is not None:
+                informe["respaldo"] = nombre != candidatos[0]
+            return mask, nombre
+
+        raise RuntimeError("Ningún motor pudo procesar la imagen (" + "; ".join(errores) + ")")
+
+    def resumen(self):
+        """Estadísticas por motor: latencia media, éxitos, fallos y estado del interruptor"""
+        with self._candado:
+            return {
+                nombre: {
+                    "segundos_por_mp": est.segundos_por_mp if est.medido else None,
+                    "exitos": est.exitos,
+                    "fallos": est.fallos,
+                    "segundos_total": est.segundos_total,
+                    "desactivado": self.interruptores[nombre].abierto,
+                }
+                for nombre, est in self.estadisticas.items()
+            }
+
+
+_selector = None
+_candado_selector = threading.Lock()
+
+
+def obtener_selector():
+    """Selector de motores compartido por todo el proceso"""
+    global _selector
+    with _candado_selector:
+        if _selector is None:
+            _selector = SelectorMotores()
+        return _selector
+
+
+def segmentar_auto(image, modelo=MODELO_POR_DEFECTO, progreso=None, politica=POLITICA_SECUENCIAL,
+                   informe=None):
+    """Segmentar con el selector compartido; devuelve la máscara y el motor usado"""
+    # Los motores trabajan sobre RGB; convertir una sola vez
+    if image.mode == 'RGBA':
+        image = image.convert('RGB')
+    return obtener_selector().segmentar(image, politica, modelo, progreso, informe)
@@ -0,0 +1,209 @@
+"""Segmentación de grueso a fino: inferir en baja resolución y refinar a resolución completa.
+
+Los motores de segmentación trabajan sobre una copia reducida de la imagen; la
+máscara resultante se escala con un filtro guiado rápido (He et al., 2015) que
+usa la imagen original como guía, de modo que los bordes siguen los contornos
+reales sin pagar la inferencia a resolución completa.
+
+refinar_borde() ajusta después el alfa en una banda estrecha alrededor del
+contorno (trimapa y filtro guiado en color), para los motores cuya máscara es
+dura o no sigue los bordes de color (GrabCut, MediaPipe).
+"""
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def reducir_para_inferencia(image, lado_max):
+    """Copia de la imagen con el lado mayor limitado a lado_max (o la misma si ya cabe)"""
+    if not lado_max or max(image.size) <= lado_max:
+        return image
+    escala = lado_max / max(image.size)
+    tamano = (max(1, round(image.width * escala)), max(1, round(image.height * escala)))
+    # reducing_gap reduce primero por un factor entero (mucho más rápido en imágenes grandes)
+    return image.resize(tamano, Image.Resampling.BILINEAR, reducing_gap=3.0)
+
+
+def _media(x, radio):
+    return cv2.boxFilter(x, cv2.CV_32F, (2 * radio + 1, 2 * radio + 1))
+
+
+def coeficientes_guiados(mask, guia_baja, radio=4, eps=1e-3):
+    """Coeficientes (a, b) del filtro guiado calculados a la resolución de la máscara"""
+    guia = np.asarray(guia_baja, dtype=np.float32) / 255.0
+    p = mask.astype(np.float32) / 255.0
+
+    media_i = _media(guia, radio)
+    media_p = _media(p, radio)
+    cov_ip = _media(guia * p, radio) - media_i * media_p
+    var_i = _media(guia * guia, radio) - media_i * media_i
+
+    a = cov_ip / (var_i + eps)
+    b = media_p - a * media_i
+    return _media(a, radio), _media(b, radio)
+
+
+def _filas_interpoladas(coef, y0, y1, alto):
+    """Interpolación vertical (como cv2.INTER_LINEAR) de las filas y0:y1 del tamaño final"""
+    alto_bajo = coef.shape[0]
+    escala = alto_bajo / alto
+    y = (np.arange(y0, y1, dtype=np.float32) + 0.5) * escala - 0.5
+    y = np.clip(y, 0, alto_bajo - 1)
+    arriba = np.floor(y).astype(np.int32)
+    abajo = np.minimum(arriba + 1, alto_bajo - 1)
+    peso = (y - arriba)[:, None]
+    return coef[arriba] * (1 - peso) + coef[abajo] * peso
+
+
+def aplicar_coeficientes(a, b, guia, y0, alto, ancho):
+    """Alfa uint8 para las filas y0:y0+len(guia) a partir de la guía en escala de grises.
+
+    Solo se expanden los coeficientes de esas filas, así que la memoria usada es
+    proporcional a la franja y no a la imagen completa.
+    """
+    y1 = y0 + guia.shape[0]
+    filas = y1 - y0
+    # Interpolar primero en vertical sobre pocas columnas y después en horizontal
+    franja_a = cv2.resize(_filas_interpoladas(a, y0, y1, alto), (ancho, filas),
+                          interpolation=cv2.INTER_LINEAR)
+    franja_b = cv2.resize(_filas_interpoladas(b, y0, y1, alto), (ancho, filas),
+                          interpolation=cv2.INTER_LINEAR)
+
+    # q = a * I + b, con I en [0, 255] para ahorrar una división a tamaño completo
+    np.multiply(franja_a, guia, out=franja_a)
+    np.multiply(franja_b, 255.0, out=franja_b)
+    np.add(franja_a, franja_b, out=franja_a)
+    np.clip(franja_a, 0, 255, out=franja_a)
+    return franja_a.astype(np.uint8)
+
+
+def escalar_mascara_guiada(mask, image, radio=4, eps=1e-3):
+    """Escalar una máscara de baja resolución al tamaño de la imagen guiándose por ella.
+
+    Los coeficientes lineales del filtro guiado se calculan a la resolución de la
+    máscara y solo se interpolan y aplican a resolución completa, por lo que el
+    coste a tamaño completo es de unas pocas operaciones por píxel.
+    """
+    alto, ancho = image.height, image.width
+    if mask.shape[:2] == (alto, ancho):
+        return mask
+
+    alto_bajo, ancho_bajo = mask.shape[:2]
+    gris = image.convert('L')
+    guia_baja = gris.resize((ancho_bajo, alto_bajo), Image.Resampling.BILINEAR, reducing_gap=3.0)
+    a, b = coeficientes_guiados(mask, guia_baja, radio, eps)
+    return aplicar_coeficientes(a, b, np.asarray(gris), 0, alto, ancho)
+
+
+# Semiancho (px) de la banda incierta del trimapa a cada lado del contorno
+BANDA_BORDE = 6
+# Radio y regularización del filtro guiado en color que estima el alfa en la banda
+RADIO_BORDE = 4
+EPS_BORDE = 1e-3
+BLOQUE_BORDE = 128
+
+
+def bloques_borde(mask, banda=BANDA_BORDE, tamano_bloque=BLOQUE_BORDE):
+    """Cajas (x0, y0, x1, y1) de los bloques de la máscara que contienen banda incierta.
+
+    Un bloque entra si él o su margen de banda píxeles no es uniforme. Los
+    máximos y mínimos por bloque salen de dos reducciones sobre la máscara
+    uint8; solo los bloques cercanos a uno mixto se examinan uno a uno.
+    """
+    alto, ancho = mask.shape[:2]
+    filas = np.arange(0, alto, tamano_bloque)
+    columnas = np.arange(0, ancho, tamano_bloque)
+    maximos = np.maximum.reduceat(np.maximum.reduceat(mask, filas, axis=0), columnas, axis=1)
+    minimos = np.minimum.reduceat(np.minimum.reduceat(mask, filas, axis=0), columnas, axis=1)
+    mixtos = (maximos != minimos).astype(np.uint8)
+    # La banda de un borde puede asomar al bloque vecino
+    candidatos = cv2.dilate(mixtos, np.ones((3, 3), np.uint8)) if banda else mixtos
+
+    cajas = []
+    for fila, columna in zip(*np.nonzero(candidatos)):
+        y0, x0 = int(filas[fila]), int(columnas[columna])
+        y1, x1 = min(y0 + tamano_bloque, alto), min(x0 + tamano_bloque, ancho)
+        if not mixtos[fila, columna]:
+            zona = mask[max(0, y0 - banda):y1 + banda, max(0, x0 - banda):x1 + banda]
+            if zona.min() == zona.max():
+                continue
+        cajas.append((x0, y0, x1, y1))
+    return cajas
+
+
+def trimapa(mask, banda=BANDA_BORDE):
+    """Trimapa uint8 de la máscara: 0 fondo, 128 banda incierta y 255 primer plano"""
+    _, binaria = cv2.threshold(mask, 127, 255, cv2.THRESH_BINARY)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * banda + 1, 2 * banda + 1))
+    fuera = cv2.dilate(binaria, kernel)
+    dentro = cv2.erode(binaria, kernel)
+    return cv2.max(cv2.bitwise_and(fuera, 128), dentro)
+
+
+def filtro_guiado_color(rgb, p, radio=RADIO_BORDE, eps=EPS_BORDE):
+    """Filtro guiado con guía RGB (He et al., 2013): alfa de p ajustado a los bordes de color.
+
+    rgb es un array uint8 (alto, ancho, 3) y p la máscara en [0, 1]. En cada
+    ventana se ajusta un modelo lineal alfa = a·I + b resolviendo el sistema
+    3x3 de las covarianzas de color, como en el matting de forma cerrada pero
+    localmente, sin resolver el sistema global.
+    """
+    guia = [canal.astype(np.float32) / 255.0 for canal in cv2.split(rgb)]
+    media_p = _media(p, radio)
+    medias = [_media(canal, radio) for canal in guia]
+    cov_p = [_media(canal * p, radio) - media * media_p for canal, media in zip(guia, medias)]
+
+    # Covarianzas del color (simétricas) más la regularización en la diagonal
+    var = {}
+    for i in range(3):
+        for j in range(i, 3):
+            var[i, j] = _media(guia[i] * guia[j], radio) - medias[i] * medias[j] + (eps if i == j else 0)
+    rr, rg, rb, gg, gb, bb = var[0, 0], var[0, 1], var[0, 2], var[1, 1], var[1, 2], var[2, 2]
+
+    # Inversa por adjuntos, sin construir matrices por píxel
+    inv_rr = gg * bb - gb * gb
+    inv_rg = gb * rb - rg * bb
+    inv_rb = rg * gb - gg * rb
+    inv_gg = rr * bb - rb * rb
+    inv_gb = rb * rg - rr * gb
+    inv_bb = rr * gg - rg * rg
+    det = rr * inv_rr + rg * inv_rg + rb * inv_rb
+
+    a_r = (inv_rr * cov_p[0] + inv_rg * cov_p[1] + inv_rb * cov_p[2]) / det
+    a_g = (inv_rg * cov_p[0] + inv_gg * cov_p[1] + inv_gb * cov_p[2]) / det
+    a_b = (inv_rb * cov_p[0] + inv_gb * cov_p[1] + inv_bb * cov_p[2]) / det
+    b = media_p - a_r * medias[0] - a_g * medias[1] - a_b * medias[2]
+
+    q = (_media(a_r, radio) * guia[0] + _media(a_g, radio) * guia[1]
+         + _media(a_b, radio) * guia[2] + _media(b, radio))
+    return np.clip(q, 0.0, 1.0)
+
+
+def refinar_borde(mask, image, banda=BANDA_BORDE, radio=RADIO_BORDE, eps=EPS_BORDE,
+                  tamano_bloque=BLOQUE_BORDE):
+    """Refinar el alfa solo en la banda estrecha alrededor del contorno de la máscara.
+
+    De la máscara gruesa se saca un trimapa: lo que queda a más de banda
+    píxeles del contorno se da por fondo o primer plano y la banda incierta
+    recibe el alfa del filtro guiado en color sobre la imagen. El filtro solo
+    se ejecuta en los bloques que tocan la banda (con el margen que necesitan
+    la banda y el radio), así que el coste sigue a la longitud del borde y no
+    al área. image es la imagen PIL del tamaño de la máscara; devuelve una
+    máscara uint8 nueva.
+    """
+    alto, ancho = mask.shape[:2]
+    margen = banda + radio
+    resultado = mask.copy()
+    for x0, y0, x1, y1 in bloques_borde(mask, banda, tamano_bloque):
+        zona = (max(0, x0 - margen), max(0, y0 - margen), min(ancho, x1 + margen), min(alto, y1 + margen))
+        # Solo se decodifica a array el trozo de imagen del bloque
+        rgb = np.asarray(image.crop(zona).convert('RGB'))
+        mask_zona = mask[zona[1]:zona[3], zona[0]:zona[2]]
+        interior = (slice(y0 - zona[1], y1 - zona[1]), slice(x0 - zona[0], x1 - zona[0]))
+        incierto = trimapa(mask_zona, banda)[interior] == 128
+        if not incierto.any():
+            continue
+        alfa = filtro_guiado_color(rgb, mask_zona.astype(np.float32) / 255.0, radio, eps)[interior]
+        bloque = resultado[y0:y1, x0:x1]
+        bloque[incierto] = (alfa[incierto] * 255.0 + 0.5).astype(np.uint8)
+    return resultado
@@ -1,34 +1,267 @@
-from PyQt6.QtWidgets import QFileDialog, QMessageBox
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
 from PIL import Image
-from rembg import remove
+from codificacion import FORMATO_PNG, FORMATOS, METODO_WEBP, NIVEL_PNG
+from sesiones import (MODELO_POR_DEFECTO, MODOS_EJECUCION, NIVELES_OPTIMIZACION, AjustesOnnx,
+                      obtener_registro)
+
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
+
+
+def ruta_temporal(ruta_destino):
+    """Temporal oculto junto al destino, para escribir y renombrar después"""
+    destino = Path(ruta_destino)
+    # Un temporal por proceso e hilo: dos trabajos con el mismo destino no se pisan
+    return destino.with_name(f".{destino.stem}.{os.getpid()}.{threading.get_ident()}.tmp{destino.suffix}")
+
+
+def guardar_atomico(image, ruta_destino, **opciones):
+    """Guardar en un archivo temporal y renombrar para no dejar salidas a medias"""
+    destino = Path(ruta_destino)
+    temporal = ruta_temporal(destino)
+    try:
+        image.save(temporal, **opciones)
+        os.replace(temporal, destino)
+    finally:
+        try:
+            temporal.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def clave_mascara(cache, image, modelo, politica, lado_inferencia):
+    """Clave de la máscara de image en la caché de resultados (la comparten todos los caminos)"""
+    from motores import obtener_selector
+
+    # La variante INT8 da máscaras algo distintas: no comparte entradas con la FP32
+    variante = obtener_registro().ajustes.nombre_variante(modelo)
+    return cache.clave(image, motor=politica, modelo=variante, lado_inferencia=lado_inferencia,
+                       ajustes_motores=obtener_selector().parametros_mascara(politica))
+
+
+def procesar_imagen(ruta_origen, ruta_destino, modelo=MODELO_POR_DEFECTO, calidad=95,
+                    progreso=None, lado_inferencia=None, presupuesto_memoria=None,
+                    usar_cache=True, mascara_previa=None, politica=None,
+                    cronometro=None, perfil=None, solo_mascara=False, nivel_png=None,
+                    metodo_webp=None, codificador=None, fondo=None, descontaminar=False,
+                    recortar=False, margen=None, lado_salida=None):
+    """Eliminar el fondo de un archivo y guardar el resultado sin interfaz gráfica.
+
+    Con lado_inferencia, el motor segmenta una copia reducida (lado mayor en
+    píxeles) y la máscara se refina a resolución completa con la imagen original.
+    Con presupuesto_memoria (MiB), las imágenes que no quepan se procesan y
+    escriben por franjas (solo salida PNG). Con usar_cache, la máscara se busca
+    primero en la caché de resultados y se guarda en ella tras segmentar.
+    mascara_previa es una tupla (máscara de baja resolución, motor) ya calculada
+    en la vista previa: si no hay acierto en caché se refina en lugar de segmentar.
+    politica elige el motor (ver motores.SelectorMotores); por defecto, la cadena
+    clásica rembg → MediaPipe → OpenCV.
+    cronometro (instrumentacion.Cronometro) recibe los tiempos de cada etapa;
+    si no se pasa se crea uno. perfil activa el perfilado del trabajo (ver
+    instrumentacion.perfilar).
+    El formato sale de la extensión de destino: en PNG cuenta nivel_png (zlib,
+    sin optimize), en WebP se guarda sin pérdida con metodo_webp y calidad solo
+    afecta a JPEG. solo_mascara guarda la máscara alfa en lugar de la
+    composición RGBA. Con codificador (codificacion.CodificadorEnSegundoPlano)
+    la escritura se encola y el resultado lleva "codificacion": "pendiente"; los
+    bytes y el tiempo de codificación llegan después por el codificador.
+    fondo (ver composicion.componer) compone el recorte sobre un color, una
+    imagen o la original desenfocada; JPEG usa blanco si no se indica.
+    descontaminar limpia el halo del fondo original en los bordes. La máscara
+    se busca en caché sin tener en cuenta el fondo, así que cambiarlo no
+    repite la inferencia.
+    Con recortar, la salida se limita a la caja del sujeto más margen (px) y la
+    posición en el lienzo original queda en los metadatos (texto en PNG,
+    cabecera en RLE) y en resultado["recorte"]. Un destino .rle guarda
+    solo la máscara en el formato RLE de codificacion.
+    La imagen se decodifica con decodificacion.decodificar: orientación EXIF
+    aplicada, alfa de origen conservado (se combina con la máscara) y, con
+    lado_salida, el resultado limitado a ese lado mayor y los JPEG decodificados
+    ya reducidos. El resultado informa del tiempo y los bytes de la
+    decodificación.
+    """
+    from composicion import MARGEN_RECORTE
+    from instrumentacion import Cronometro, obtener_historial, perfilar
+
+    cronometro = cronometro or Cronometro(historial=obtener_historial(), variante=politica)
+    with perfilar(perfil):
+        resultado = _procesar_imagen(ruta_origen, ruta_destino, modelo, calidad, progreso,
+                                     lado_inferencia, presupuesto_memoria, usar_cache,
+                                     mascara_previa, politica, cronometro, solo_mascara,
+                                     NIVEL_PNG if nivel_png is None else nivel_png,
+                                     METODO_WEBP if metodo_webp is None else metodo_webp,
+                                     codificador, fondo, descontaminar, recortar,
+                                     MARGEN_RECORTE if margen is None else margen, lado_salida)
+    registro = cronometro.terminar(origen=str(ruta_origen), motor=resultado["motor"])
+    resultado["etapas"] = registro["etapas"]
+    return resultado
+
+
+def _procesar_imagen(ruta_origen, ruta_destino, modelo, calidad, progreso, lado_inferencia,
+                     presupuesto_memoria, usar_cache, mascara_previa, politica, cronometro,
+                     solo_mascara, nivel_png, metodo_webp, codificador, fondo, descontaminar,
+                     recortar, margen, lado_salida):
+    from codificacion import anotar_codificacion, codificar, opciones_guardado
+    from composicion import caja_recorte, componer, fondo_para_destino
+    from decodificacion import alfa_de_origen, combinar_alfa, decodificar
+    from motores import POLITICA_SECUENCIAL, envolver_mascara, obtener_selector, segmentar_auto
+    from refinado import escalar_mascara_guiada, reducir_para_inferencia, refinar_borde
+
+    avisar = progreso or (lambda mensaje: None)
+    politica = politica or POLITICA_SECUENCIAL
+    inicio = time.perf_counter()
+
+    avisar("Cargando imagen")
+    image = Image.open(ruta_origen)
+    cronometro.megapixeles = image.width * image.height / 1e6
+    fondo = fondo_para_destino(ruta_destino, fondo)
+    solo_mascara = solo_mascara or Path(ruta_destino).suffix.lower() == ".rle"
+
+    # Por franjas solo se componen colores sólidos; el resto necesita vecinos o la imagen entera
+    if (Path(ruta_destino).suffix.lower() == ".png" and not solo_mascara and not descontaminar
+            and not recortar and not lado_salida
+            and (fondo is None or isinstance(fondo, tuple))):
+        from mosaico import necesita_franjas, procesar_por_franjas
+
+        if necesita_franjas(image, presupuesto_memoria):
+            return procesar_por_franjas(ruta_origen, ruta_destino, presupuesto_memoria,
+                                        modelo, lado_inferencia, progreso, politica, cronometro,
+                                        nivel_png, fondo, usar_cache, mascara_previa)
+
+    with cronometro.etapa("decodificacion"):
+        image, decodificado = decodificar(image, lado_salida)
+        alfa_origen = alfa_de_origen(image)
+    cronometro.megapixeles = image.width * image.height / 1e6
+
+    guardado = None
+    if usar_cache:
+        from cache_resultados import obtener_cache
+
+        with cronometro.etapa("cache"):
+            cache = obtener_cache()
+            clave = clave_mascara(cache, image, modelo, politica, lado_inferencia)
+            guardado = cache.obtener(clave)
+
+    if guardado is not None:
+        avisar("Usando resultado en caché")
+        mask, motor = guardado
+        # El camino por franjas guarda la máscara a la resolución de inferencia
+        if mask.shape[:2] != (image.height, image.width):
+            with cronometro.etapa("refinado"):
+                mask = escalar_mascara_guiada(mask, image)
+    elif mascara_previa is not None and misma_proporcion(mascara_previa[0], image):
+        avisar("Refinando la máscara de la vista previa")
+        with cronometro.etapa("refinado"):
+            mask, motor = escalar_mascara_guiada(mascara_previa[0], image), mascara_previa[1]
+    else:
+        avisar("Procesando imagen (esto puede tardar)")
+        informe = {}
+        with cronometro.etapa("inferencia"):
+            reducida = reducir_para_inferencia(image, lado_inferencia)
+            mask, motor = segmentar_auto(reducida, modelo, progreso, politica, informe)
+        if reducida is not image:
+            avisar("Refinando bordes a resolución completa")
+            with cronometro.etapa("refinado"):
+                mask = escalar_mascara_guiada(mask, image)
+        # La máscara de un motor de respaldo no se guarda: la clave es la de la política y,
+        # cuando el motor preferido vuelva a funcionar, daría el resultado degradado
+        if usar_cache and not informe.get("respaldo"):
+            with cronometro.etapa("cache"):
+                cache.guardar(clave, mask, motor)
+
+    # Después de la caché: se guarda la máscara del motor y cambiar este ajuste no la invalida
+    if obtener_selector().refina_borde(motor):
+        avisar("Ajustando el contorno")
+        with cronometro.etapa("borde"):
+            mask = refinar_borde(mask, image)
+
+    recorte = None
+    with cronometro.etapa("composicion"):
+        # La transparencia del origen se mantiene: la máscara en caché no la incluye
+        mask = combinar_alfa(mask, alfa_origen)
+        if recortar:
+            recorte = caja_recorte(mask, margen)
+        if recorte:
+            # Recortar antes de componer: menos píxeles que mezclar, comprimir y escribir
+            caja = (recorte["x"], recorte["y"], recorte["x"] + recorte["ancho"], recorte["y"] + recorte["alto"])
+            image = image.crop(caja)
+            mask = mask[caja[1]:caja[3], caja[0]:caja[2]]
+        # La máscara sola evita componer y escribe 1 byte por píxel en lugar de 4
+        output = envolver_mascara(mask) if solo_mascara else componer(image, mask, fondo, descontaminar)
+
+    resultado = {
+        "origen": str(ruta_origen),
+        "destino": str(ruta_destino),
+        "motor": motor,
+        "cache": guardado is not None,
+        "segundos_decodificacion": decodificado["segundos"],
+        "bytes_decodificacion": decodificado["bytes"],
+    }
+    if decodificado["orientacion"] != 1:
+        resultado["orientacion_exif"] = decodificado["orientacion"]
+    if decodificado["reduccion_draft"] > 1:
+        resultado["reduccion_draft"] = decodificado["reduccion_draft"]
+    if recorte:
+        resultado["recorte"] = recorte
+    opciones = opciones_guardado(ruta_destino, calidad, nivel_png, metodo_webp, recorte)
+    if codificador is not None:
+        avisar("Guardando imagen en segundo plano")
+        codificador.enviar(output, ruta_destino, opciones, dict(resultado))
+        resultado["codificacion"] = "pendiente"
+    else:
+        avisar("Guardando imagen")
+        with cronometro.etapa("codificacion"):
+            segundos, tamano = codificar(output, ruta_destino, opciones)
+        anotar_codificacion(resultado, segundos, tamano)
+    resultado["segundos"] = time.perf_counter() - inicio
+    return resultado
+
+
+def misma_proporcion(mask, image, tolerancia=0.02):
+    """Comprobar que una máscara reducida corresponde a la orientación de la imagen"""
+    alto, ancho = mask.shape[:2]
+    return abs(ancho / alto - image.width / image.height) <= tolerancia * image.width / image.height
+
 
 class BackgroundRemover:
     def __init__(self, app):
         self.app = app
 
     def select_image(self):
+        # PyQt6 se importa aquí para que el modo sin interfaz no lo necesite
+        from PyQt6.QtWidgets import QFileDialog
+
         file_path, _ = QFileDialog.getOpenFileName(
             self.app,
             "Selecciona la imagen de origen",
             "",
             "Archivos de imagen (*.jpg *.jpeg *.png)"
         )
-        
+
         if file_path:
             self.app.entry_origen.setText(file_path)
 
     def save_image(self):
+        from PyQt6.QtWidgets import QFileDialog
+
         file_path, _ = QFileDialog.getSaveFileName(
             self.app,
             "Guardar imagen sin fondo",
             "",
             "Imagen PNG (*.png)"
         )
-        
+
         if file_path:
             self.app.entry_destino.setText(file_path)
 
     def remove_background(self):
+        from PyQt6.QtWidgets import QMessageBox
+
         ruta_origen = self.app.entry_origen.text()
         ruta_destino = self.app.entry_destino.text()
 
@@ -45,4 +278,360 @@ class BackgroundRemover:
             QMessageBox.critical(self.app, "Error", f"Ha ocurrido un error: {e}")
 
     def remove_background_logic(self, image):
-        return remove(image)
\ No newline at end of file
+        return obtener_registro().inferir(image)
+
+
+def _tipo_fondo(texto):
+    from composicion import interpretar_fondo
+
+    try:
+        return interpretar_fondo(texto)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def _agregar_opciones_onnx(subparser):
+    """Ajustes de onnxruntime comunes a los subcomandos que cargan modelos"""
+    grupo = subparser.add_argument_group("onnxruntime")
+    grupo.add_argument("--hilos-onnx", type=int, default=0,
+                       help="Hilos intra-operación por sesión (0: OMP_NUM_THREADS si está definida; si no, "
+                            "todos los núcleos, o el reparto por proceso en lotes)")
+    grupo.add_argument("--hilos-onnx-inter", type=int, default=0,
+                       help="Hilos entre operaciones, solo en modo paralelo (0: automático)")
+    grupo.add_argument("--modo-onnx", choices=MODOS_EJECUCION, default="secuencial",
+                       help="Ejecutar los nodos del grafo en secuencia o en paralelo")
+    grupo.add_argument("--optimizacion-onnx", choices=NIVELES_OPTIMIZACION, default="todas",
+                       help="Nivel de optimización del grafo")
+    grupo.add_argument("--cache-onnx", action="store_true",
+                       help="Guardar el modelo optimizado y reutilizarlo en las siguientes cargas")
+    grupo.add_argument("--int8", action="store_true",
+                       help="Usar la variante cuantizada INT8 de los modelos U2-Net (requiere el paquete onnx)")
+
+
+def ajustes_onnx_de(args):
+    return AjustesOnnx(args.hilos_onnx, args.hilos_onnx_inter, args.modo_onnx,
+                       args.optimizacion_onnx, args.cache_onnx, args.int8)
+
+
+def construir_parser():
+    from motores import POLITICAS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m remover_fondo",
+        description="Eliminador de fondo sin interfaz gráfica"
+    )
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    lote = subparsers.add_parser("batch", help="Procesar todas las imágenes de una carpeta")
+    lote.add_argument("entrada", help="Carpeta con las imágenes de origen")
+    lote.add_argument("salida", help="Carpeta donde guardar los resultados")
+    lote.add_argument("--procesos", type=int, default=None,
+                      help="Número de procesos (por defecto, uno por núcleo)")
+    lote.add_argument("--en-vuelo", type=int, default=None,
+                      help="Máximo de imágenes pendientes a la vez (por defecto, 2 por proceso)")
+    lote.add_argument("--ordenado", action="store_true",
+                      help="Informar de los resultados en el orden de entrada")
+    lote.add_argument("--no-reanudar", action="store_true",
+                      help="Ignorar el diario y volver a procesar todo")
+    lote.add_argument("--modelo", default=MODELO_POR_DEFECTO, help="Modelo de rembg")
+    lote.add_argument("--calidad", type=int, default=95, help="Calidad de guardado")
+    lote.add_argument("--lado-inferencia", type=int, default=None,
+                      help="Segmentar con el lado mayor reducido a N píxeles y refinar a tamaño completo")
+    lote.add_argument("--memoria-max", type=int, default=None,
+                      help="Presupuesto de memoria por imagen en MiB; las mayores se procesan por franjas")
+    lote.add_argument("--lado-salida", type=int, default=None,
+                      help="Limitar los resultados a N píxeles de lado mayor (los JPEG se decodifican ya reducidos)")
+
+    lote.add_argument("--motor", default="secuencial",
+                      choices=POLITICAS,
+                      help="Política de selección de motor o motor fijo")
+    lote.add_argument("--limite-motor", type=float, default=None,
+                      help="Segundos máximos por motor antes de pasar al siguiente")
+    lote.add_argument("--grabcut-iteraciones", type=int, default=None,
+                      help="Iteraciones de GrabCut (por defecto 5)")
+    lote.add_argument("--grabcut-lado", type=int, default=None,
+                      help="Lado mayor para las iteraciones de GrabCut; 0 para resolución completa")
+    lote.add_argument("--sin-cache", action="store_true",
+                      help="No consultar ni guardar máscaras en la caché de resultados")
+    lote.add_argument("--formato", choices=FORMATOS, default=FORMATO_PNG,
+                      help="png (RGBA), webp (sin pérdida), jpeg (sobre fondo opaco), "
+                           "mascara (solo el alfa en PNG) o rle (solo el alfa, por tramos)")
+    lote.add_argument("--fondo", type=_tipo_fondo, default=None,
+                      help="transparente, blanco, negro, desenfoque, un color (#rrggbb) o una imagen")
+    lote.add_argument("--descontaminar", action="store_true",
+                      help="Limpiar el halo del fondo original en los bordes")
+    lote.add_argument("--recortar", action="store_true",
+                      help="Recortar cada resultado a la caja del sujeto (posición en los metadatos)")
+    lote.add_argument("--margen", type=int, default=None,
+                      help="Margen en píxeles alrededor del sujeto al recortar (16 por defecto)")
+    lote.add_argument("--nivel-png", type=int, choices=range(0, 10), default=None, metavar="0-9",
+                      help=f"Nivel de compresión zlib del PNG (por defecto {NIVEL_PNG}; 1 es el más rápido)")
+    lote.add_argument("--metodo-webp", type=int, choices=range(0, 7), default=None, metavar="0-6",
+                      help=f"Esfuerzo de WebP sin pérdida (por defecto {METODO_WEBP})")
+    lote.add_argument("--sin-canalizar", action="store_true",
+                      help="Codificar en el mismo hilo que la inferencia en lugar de solaparlas")
+    lote.add_argument("--registro-tiempos", default=None,
+                      help="Añadir los tiempos por etapa de cada imagen a este archivo JSON lines")
+
+    unica = subparsers.add_parser("procesar", help="Procesar una sola imagen mostrando sus tiempos por etapa")
+    unica.add_argument("entrada", help="Imagen de origen")
+    unica.add_argument("salida", help="Imagen de destino")
+    unica.add_argument("--modelo", default=MODELO_POR_DEFECTO, help="Modelo de rembg")
+    unica.add_argument("--calidad", type=int, default=95, help="Calidad de guardado")
+    unica.add_argument("--lado-inferencia", type=int, default=None,
+                       help="Segmentar con el lado mayor reducido a N píxeles y refinar a tamaño completo")
+    unica.add_argument("--memoria-max", type=int, default=None,
+                       help="Presupuesto de memoria en MiB; si no cabe se procesa por franjas")
+    unica.add_argument("--lado-salida", type=int, default=None,
+                       help="Limitar el resultado a N píxeles de lado mayor (los JPEG se decodifican ya reducidos)")
+    unica.add_argument("--motor", default="secuencial",
+                       choices=POLITICAS,
+                       help="Política de selección de motor o motor fijo")
+    unica.add_argument("--sin-cache", action="store_true",
+                       help="No consultar ni guardar máscaras en la caché de resultados")
+    unica.add_argument("--fondo", type=_tipo_fondo, default=None,
+                       help="transparente, blanco, negro, desenfoque, un color (#rrggbb) o una imagen")
+    unica.add_argument("--descontaminar", action="store_true",
+                       help="Limpiar el halo del fondo original en los bordes")
+    unica.add_argument("--recortar", action="store_true",
+                       help="Recortar a la caja del sujeto (posición en los metadatos)")
+    unica.add_argument("--margen", type=int, default=None,
+                       help="Margen en píxeles alrededor del sujeto al recortar (16 por defecto)")
+    unica.add_argument("--solo-mascara", action="store_true",
+                       help="Guardar solo la máscara alfa (PNG de un canal)")
+    unica.add_argument("--nivel-png", type=int, choices=range(0, 10), default=None, metavar="0-9",
+                       help=f"Nivel de compresión zlib del PNG (por defecto {NIVEL_PNG})")
+    unica.add_argument("--metodo-webp", type=int, choices=range(0, 7), default=None, metavar="0-6",
+                       help=f"Esfuerzo de WebP sin pérdida (por defecto {METODO_WEBP})")
+    unica.add_argument("--perfil", default=None,
+                       help="Perfilar el trabajo con cProfile y guardar las estadísticas en este archivo")
+    unica.add_argument("--registro-tiempos", default=None,
+                       help="Añadir los tiempos por etapa a este archivo JSON lines")
+
+    secuencia = subparsers.add_parser("secuencia",
+                                      help="Procesar un vídeo o una carpeta de fotogramas reutilizando máscaras")
+    secuencia.add_argument("entrada", help="Vídeo (mp4, mov, avi...) o carpeta con los fotogramas en orden")
+    secuencia.add_argument("salida", help="Carpeta para la secuencia PNG o vídeo con alfa .mov/.webm (requiere ffmpeg)")
+    secuencia.add_argument("--modelo", default=MODELO_POR_DEFECTO, help="Modelo de rembg")
+    secuencia.add_argument("--motor", default="secuencial",
+                           choices=POLITICAS,
+                           help="Política de selección de motor o motor fijo")
+    secuencia.add_argument("--lado-inferencia", type=int, default=None,
+                           help="Segmentar a este lado mayor y refinar a tamaño completo")
+    secuencia.add_argument("--intervalo-clave", type=int, default=12,
+                           help="Fotogramas como máximo entre dos inferencias completas")
+    secuencia.add_argument("--umbral", type=float, default=0.04,
+                           help="Cambio medio (0-1) respecto al último fotograma inferido a partir del cual se infiere")
+    secuencia.add_argument("--nivel-png", type=int, choices=range(0, 10), default=None, metavar="0-9",
+                           help=f"Nivel de compresión zlib de la secuencia PNG (por defecto {NIVEL_PNG})")
+
+    vigilar = subparsers.add_parser("vigilar",
+                                    help="Procesar las imágenes nuevas o modificadas que lleguen a una carpeta")
+    vigilar.add_argument("entrada", help="Carpeta vigilada (incluye subcarpetas)")
+    vigilar.add_argument("salida", help="Carpeta de resultados; guarda también el índice de lo procesado")
+    vigilar.add_argument("--modelo", default=MODELO_POR_DEFECTO, help="Modelo de rembg")
+    vigilar.add_argument("--motor", default="secuencial",
+                         choices=POLITICAS,
+                         help="Política de selección de motor o motor fijo")
+    vigilar.add_argument("--calidad", type=int, default=95, help="Calidad de guardado")
+    vigilar.add_argument("--lado-inferencia", type=int, default=None,
+                         help="Segmentar con el lado mayor reducido a N píxeles y refinar a tamaño completo")
+    vigilar.add_argument("--memoria-max", type=int, default=None,
+                         help="Presupuesto de memoria por imagen en MiB; las mayores se procesan por franjas")
+    vigilar.add_argument("--lado-salida", type=int, default=None,
+                         help="Limitar los resultados a N píxeles de lado mayor")
+    vigilar.add_argument("--formato", choices=FORMATOS, default=FORMATO_PNG,
+                         help="png, webp, jpeg, mascara o rle (como en batch)")
+    vigilar.add_argument("--fondo", type=_tipo_fondo, default=None,
+                         help="transparente, blanco, negro, desenfoque, un color (#rrggbb) o una imagen")
+    vigilar.add_argument("--descontaminar", action="store_true",
+                         help="Limpiar el halo del fondo original en los bordes")
+    vigilar.add_argument("--recortar", action="store_true", help="Recortar cada resultado a la caja del sujeto")
+    vigilar.add_argument("--margen", type=int, default=None,
+                         help="Margen en píxeles alrededor del sujeto al recortar (16 por defecto)")
+    vigilar.add_argument("--nivel-png", type=int, choices=range(0, 10), default=None, metavar="0-9",
+                         help=f"Nivel de compresión zlib del PNG (por defecto {NIVEL_PNG})")
+    vigilar.add_argument("--intervalo", type=float, default=2.0, help="Segundos entre dos recorridos de la carpeta")
+    vigilar.add_argument("--espera", type=float, default=2.0,
+                         help="Segundos sin cambios antes de procesar un archivo (evita los que aún se copian)")
+    vigilar.add_argument("--una-vez", action="store_true",
+                         help="Procesar lo pendiente y salir en lugar de seguir vigilando")
+
+    servidor = subparsers.add_parser("servir", help="Servicio HTTP local con sesiones calientes")
+    servidor.add_argument("--host", default="127.0.0.1", help="Dirección de escucha (solo local)")
+    servidor.add_argument("--puerto", type=int, default=8765)
+    servidor.add_argument("--socket", default=None, help="Escuchar en este socket Unix en lugar de TCP")
+    servidor.add_argument("--modelo", default=MODELO_POR_DEFECTO, help="Modelo de rembg por defecto")
+    servidor.add_argument("--motor", default="secuencial",
+                          choices=POLITICAS,
+                          help="Política de selección de motor por defecto")
+    servidor.add_argument("--max-cola", type=int, default=32,
+                          help="Peticiones admitidas a la vez (en cola o en curso) antes de responder 503")
+    servidor.add_argument("--max-lote", type=int, default=4,
+                          help="Imágenes por ejecución de ONNX en los modelos que lo admiten")
+    servidor.add_argument("--espera-lote", type=float, default=0.01,
+                          help="Segundos que se espera a completar un lote")
+
+    for subparser in (lote, unica, secuencia, vigilar, servidor):
+        _agregar_opciones_onnx(subparser)
+    for subparser in (lote, unica, vigilar, servidor):
+        subparser.add_argument("--refinar-borde", nargs="+", default=None, metavar="MOTOR",
+                               choices=["rembg", "mediapipe", "opencv", "ninguno"],
+                               help="Motores cuya máscara se refina en la banda del contorno "
+                                    "(por defecto mediapipe y opencv; ninguno para desactivarlo)")
+
+    cache = subparsers.add_parser("cache", help="Inspeccionar o podar la caché de resultados")
+    cache.add_argument("accion", choices=["info", "prune", "clear"])
+    cache.add_argument("--max-mb", type=int, default=None,
+                       help="Tamaño máximo tras podar (por defecto, el configurado)")
+
+    return parser
+
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+
+    if getattr(args, "registro_tiempos", None):
+        # Por entorno para que lo hereden los procesos del lote
+        os.environ["REMOVER_FONDO_TIEMPOS"] = os.path.abspath(args.registro_tiempos)
+    if hasattr(args, "int8"):
+        obtener_registro().configurar(ajustes_onnx_de(args))
+    if getattr(args, "refinar_borde", None) is not None:
+        from motores import obtener_selector
+
+        obtener_selector().configurar_bordes(args.refinar_borde)
+
+    if args.comando == "procesar":
+        try:
+            resultado = procesar_imagen(args.entrada, args.salida, args.modelo, args.calidad,
+                                        progreso=print, lado_inferencia=args.lado_inferencia,
+                                        presupuesto_memoria=args.memoria_max,
+                                        usar_cache=not args.sin_cache, politica=args.motor,
+                                        perfil=args.perfil, solo_mascara=args.solo_mascara,
+                                        nivel_png=args.nivel_png, metodo_webp=args.metodo_webp,
+                                        fondo=args.fondo, descontaminar=args.descontaminar,
+                                        recortar=args.recortar, margen=args.margen,
+                                        lado_salida=args.lado_salida)
+        except MemoryError as e:
+            print(f"Error: {e}")
+            return 1
+        print(f"Guardado en {resultado['destino']} con {resultado['motor']} "
+              f"en {resultado['segundos']:.2f} s ({resultado.get('bytes', 0) / 1024:.0f} KiB)")
+        recorte = resultado.get("recorte")
+        if recorte:
+            print(f"Recortado a {recorte['ancho']}x{recorte['alto']} en ({recorte['x']}, {recorte['y']}) "
+                  f"de {recorte['ancho_original']}x{recorte['alto_original']}: "
+                  f"≈{resultado['bytes_ahorrados'] / 1024:.0f} KiB ahorrados")
+        if "segundos_decodificacion" in resultado:
+            giro = (f", orientación EXIF {resultado['orientacion_exif']} aplicada"
+                    if "orientacion_exif" in resultado else "")
+            draft = f", JPEG reducido 1/{resultado['reduccion_draft']} al decodificar" if "reduccion_draft" in resultado else ""
+            print(f"Decodificada en {resultado['segundos_decodificacion']:.3f} s, "
+                  f"{resultado['bytes_decodificacion'] / 2**20:.1f} MiB de píxeles{giro}{draft}")
+        for etapa, segundos in resultado["etapas"].items():
+            print(f"  {etapa:<15} {segundos:8.3f} s")
+        if args.perfil:
+            print(f"Perfil guardado en {args.perfil}")
+        return 0
+
+    if args.comando == "batch":
+        from lote import procesar_lote
+        from motores import ITERACIONES_GRABCUT, LADO_GRABCUT
+
+        grabcut = None
+        if args.grabcut_iteraciones is not None or args.grabcut_lado is not None:
+            grabcut = (
+                args.grabcut_iteraciones or ITERACIONES_GRABCUT,
+                LADO_GRABCUT if args.grabcut_lado is None else (args.grabcut_lado or None),
+            )
+
+        resumen = procesar_lote(
+            args.entrada, args.salida,
+            procesos=args.procesos,
+            max_en_vuelo=args.en_vuelo,
+            ordenado=args.ordenado,
+            reanudar=not args.no_reanudar,
+            modelo=args.modelo,
+            calidad=args.calidad,
+            lado_inferencia=args.lado_inferencia,
+            presupuesto_memoria=args.memoria_max,
+            usar_cache=not args.sin_cache,
+            politica=args.motor,
+            limite_motor=args.limite_motor,
+            grabcut=grabcut,
+            formato=args.formato,
+            fondo=args.fondo,
+            descontaminar=args.descontaminar,
+            recortar=args.recortar,
+            margen=args.margen,
+            lado_salida=args.lado_salida,
+            nivel_png=args.nivel_png,
+            metodo_webp=args.metodo_webp,
+            canalizar=not args.sin_canalizar,
+            ajustes_onnx=ajustes_onnx_de(args),
+            refinar_borde=args.refinar_borde,
+        )
+        return 1 if resumen["errores"] else 0
+
+    if args.comando == "secuencia":
+        from secuencias import procesar_secuencia
+
+        try:
+            resumen = procesar_secuencia(args.entrada, args.salida, args.modelo, args.motor,
+                                         args.lado_inferencia, args.intervalo_clave, args.umbral,
+                                         args.nivel_png, progreso=print)
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}")
+            return 1
+        print("Motores usados: " + ", ".join(f"{motor} {n}" for motor, n in resumen["motores"].items()))
+        print("Tiempo por etapa: " + ", ".join(f"{etapa} {segundos:.1f} s"
+                                               for etapa, segundos in resumen["etapas"].items()))
+        return 1 if resumen["errores"] else 0
+
+    if args.comando == "vigilar":
+        from vigilancia import vigilar
+
+        resumen = vigilar(args.entrada, args.salida, args.modelo, args.motor, args.formato, args.calidad,
+                          args.lado_inferencia, args.fondo, args.descontaminar, args.recortar, args.margen,
+                          args.nivel_png, args.memoria_max, args.lado_salida, args.intervalo, args.espera, args.una_vez)
+        print(f"{resumen['procesadas']} procesadas, {resumen['saltadas']} ya en el índice, "
+              f"{resumen['sin_cambios']} sin cambios de contenido y {resumen['errores']} con error "
+              f"en {resumen['segundos']:.1f} s")
+        return 1 if resumen["errores"] else 0
+
+    if args.comando == "servir":
+        from servicio import servir
+
+        if args.host not in ("127.0.0.1", "localhost", "::1"):
+            print("Aviso: el servicio no tiene autenticación; escuchando fuera de localhost")
+        metricas = servir(args.modelo, args.motor, args.host, args.puerto, args.socket,
+                          args.max_cola, args.max_lote, args.espera_lote)
+        print(json.dumps({clave: valor for clave, valor in metricas.items() if clave != "sesiones"},
+                         indent=2, ensure_ascii=False))
+        return 0
+
+    if args.comando == "cache":
+        from cache_resultados import obtener_cache
+
+        cache = obtener_cache()
+        if args.accion == "prune":
+            limite = args.max_mb * 2**20 if args.max_mb is not None else None
+            borradas, liberados = cache.podar(limite)
+            print(f"Borradas {borradas} entradas ({liberados / 2**20:.1f} MiB)")
+        elif args.accion == "clear":
+            borradas, liberados = cache.vaciar()
+            print(f"Borradas {borradas} entradas ({liberados / 2**20:.1f} MiB)")
+        info = cache.info()
+        print(
+            f"Caché en {info['directorio']}: {info['entradas']} entradas, "
+            f"{info['bytes'] / 2**20:.1f} de {info['max_bytes'] / 2**20:.0f} MiB | "
+            f"aciertos {info['aciertos']}, fallos {info['fallos']} "
+            f"({info['tasa_aciertos']:.0%})"
+        )
+        return 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+"""Modo secuencia: vídeos y carpetas de fotogramas con reutilización temporal de la máscara.
+
+Los fotogramas se leen de uno en uno (cv2.VideoCapture o una carpeta ordenada)
+y solo algunos pasan por el motor de segmentación. Si un fotograma apenas
+difiere del último inferido, su máscara se obtiene propagando la del
+fotograma anterior según el movimiento del sujeto, estimado con flujo óptico
+sobre miniaturas en gris, que cuesta milisegundos frente a la inferencia completa. Cada intervalo_clave
+fotogramas se vuelve a inferir para que la deriva no se acumule.
+
+La salida es una secuencia PNG RGBA (una carpeta) o un vídeo con alfa
+(.mov con QuickTime RLE o .webm con VP9), que necesita el ejecutable ffmpeg
+porque cv2.VideoWriter no escribe canal alfa.
+"""
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from decodificacion import alfa_de_origen, combinar_alfa, decodificar
+from remover_fondo import EXTENSIONES_IMAGEN
+from sesiones import MODELO_POR_DEFECTO
+
+EXTENSIONES_VIDEO = (".mp4", ".mov", ".avi", ".mkv", ".webm", ".m4v")
+# Códec y formato de píxel de ffmpeg para cada contenedor de salida con alfa
+CODECS_CON_ALFA = {
+    ".mov": ["-c:v", "qtrle", "-pix_fmt", "argb"],
+    ".webm": ["-c:v", "libvpx-vp9", "-pix_fmt", "yuva420p", "-lossless", "1"],
+}
+# Fotogramas como máximo entre dos inferencias completas
+INTERVALO_CLAVE = 12
+# Diferencia media (0-1) con el último fotograma inferido por debajo de la cual se reutiliza
+UMBRAL_CAMBIO = 0.04
+# Lado mayor de las miniaturas en gris usadas para medir el cambio y el flujo óptico
+LADO_MOVIMIENTO = 256
+# Separación (px de la miniatura) entre los vectores de flujo del sujeto usados en el ajuste
+PASO_MUESTRAS = 4
+FPS_SECUENCIA = 25.0
+
+
+def es_video(ruta):
+    return Path(ruta).suffix.lower() in EXTENSIONES_VIDEO
+
+
+def orden_natural(ruta):
+    """Clave de ordenación con los números como números: frame_2 va antes que frame_10"""
+    return [int(parte) if parte.isdigit() else parte for parte in re.split(r"(\d+)", ruta.name.lower())]
+
+
+def leer_fotogramas(origen):
+    """Generar (nombre, fotograma RGB uint8, alfa de origen o None) de un vídeo o de una carpeta"""
+    origen = Path(origen)
+    if origen.is_dir():
+        rutas = sorted((p for p in origen.iterdir() if p.suffix.lower() in EXTENSIONES_IMAGEN), key=orden_natural)
+        for ruta in rutas:
+            image, _ = decodificar(ruta)
+            alfa = alfa_de_origen(image)
+            yield ruta.stem, np.asarray(image if image.mode == 'RGB' else image.convert('RGB')), alfa
+        return
+
+    captura = cv2.VideoCapture(str(origen))
+    if not captura.isOpened():
+        raise ValueError(f"No se pudo abrir el vídeo {origen}")
+    try:
+        indice = 0
+        while True:
+            leido, bgr = captura.read()
+            if not leido:
+                return
+            yield f"{indice:06d}", cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), None
+            indice += 1
+    finally:
+        captura.release()
+
+
+def fps_de(origen):
+    """Fotogramas por segundo del vídeo de origen (o FPS_SECUENCIA para carpetas)"""
+    if not es_video(origen):
+        return FPS_SECUENCIA
+    captura = cv2.VideoCapture(str(origen))
+    fps = captura.get(cv2.CAP_PROP_FPS)
+    captura.release()
+    return fps if fps and fps > 0 else FPS_SECUENCIA
+
+
+class PropagadorMascara:
+    """Estima la máscara de un fotograma a partir de la del anterior.
+
+    El flujo óptico (Farnebäck) se calcula sobre miniaturas en gris y solo se
+    usa dentro del sujeto: de esos vectores se ajusta con RANSAC una
+    transformación de semejanza (traslación, giro y escala) que mueve la
+    máscara a resolución completa. Remuestrear la máscara con el flujo denso
+    dejaría rastro en el borde de atrás, porque el fondo que se destapa está
+    quieto y apunta a donde antes había sujeto.
+    """
+
+    def __init__(self, lado=LADO_MOVIMIENTO, paso=PASO_MUESTRAS):
+        self.lado = lado
+        self.paso = paso
+
+    def miniatura(self, rgb):
+        alto, ancho = rgb.shape[:2]
+        escala = min(1.0, self.lado / max(alto, ancho))
+        tamano = (max(1, round(ancho * escala)), max(1, round(alto * escala)))
+        return cv2.resize(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY), tamano, interpolation=cv2.INTER_AREA)
+
+    @staticmethod
+    def diferencia(miniatura, referencia):
+        """Diferencia absoluta media entre dos miniaturas, de 0 a 1"""
+        return cv2.norm(miniatura, referencia, cv2.NORM_L1) / (miniatura.size * 255.0)
+
+    def propagar(self, mask, miniatura_anterior, miniatura):
+        alto, ancho = mask.shape[:2]
+        alto_mini, ancho_mini = miniatura.shape
+        flujo = cv2.calcOpticalFlowFarneback(miniatura_anterior, miniatura, None,
+                                             0.5, 3, 15, 3, 5, 1.2, 0)
+        mask_mini = cv2.resize(mask, (ancho_mini, alto_mini), interpolation=cv2.INTER_AREA)
+        ys, xs = np.nonzero(mask_mini[::self.paso, ::self.paso] > 127)
+        ys, xs = ys * self.paso, xs * self.paso
+        if len(xs) < 6:
+            return mask
+        origen = np.stack([xs, ys], axis=1).astype(np.float32)
+        matriz, _ = cv2.estimateAffinePartial2D(origen, origen + flujo[ys, xs], method=cv2.RANSAC,
+                                                ransacReprojThreshold=1.0)
+        if matriz is None:
+            return mask
+        # Giro y escala no dependen de la resolución; la traslación sí
+        matriz[:, 2] *= ancho / ancho_mini
+        return cv2.warpAffine(mask, matriz, (ancho, alto), flags=cv2.INTER_LINEAR,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+
+class SalidaVideo:
+    """Vídeo con alfa escrito por ffmpeg a partir de fotogramas RGBA en bruto por una tubería"""
+
+    def __init__(self, ruta, ancho, alto, fps):
+        extension = Path(ruta).suffix.lower()
+        if extension not in CODECS_CON_ALFA:
+            raise ValueError(f"Formato de vídeo sin alfa: {extension} (usa .mov, .webm o una carpeta)")
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("Para escribir vídeo con alfa hace falta ffmpeg; "
+                               "usa una carpeta de salida para obtener una secuencia PNG")
+        self.tamano = (ancho, alto)
+        self._proceso = subprocess.Popen(
+            [ffmpeg, "-loglevel", "error", "-y", "-f", "rawvideo", "-pix_fmt", "rgba",
+             "-s", f"{ancho}x{alto}", "-r", f"{fps:g}", "-i", "-"] + CODECS_CON_ALFA[extension] + [str(ruta)],
+            stdin=subprocess.PIPE)
+
+    def escribir(self, rgba):
+        if (rgba.shape[1], rgba.shape[0]) != self.tamano:
+            raise ValueError("Todos los fotogramas de un vídeo deben tener el mismo tamaño")
+        self._proceso.stdin.write(np.ascontiguousarray(rgba).data)
+
+    def cerrar(self):
+        self._proceso.stdin.close()
+        if self._proceso.wait():
+            raise RuntimeError(f"ffmpeg terminó con código {self._proceso.returncode}")
+
+
+def procesar_secuencia(origen, destino, modelo=MODELO_POR_DEFECTO, politica=None,
+                       lado_inferencia=None, intervalo_clave=INTERVALO_CLAVE,
+                       umbral=UMBRAL_CAMBIO, nivel_png=None, progreso=None):
+    """Eliminar el fondo de un vídeo o carpeta de fotogramas y devolver un resumen.
+
+    destino es una carpeta (secuencia PNG RGBA, un archivo por fotograma) o un
+    vídeo .mov/.webm. Se infiere el primer fotograma, cada intervalo_clave
+    fotogramas y cuando la diferencia con el último inferido supera umbral; el
+    resto propaga la máscara anterior. El resumen indica cuántos fotogramas se
+    infirieron y cuántos reutilizaron la máscara.
+    """
+    from codificacion import CodificadorEnSegundoPlano, opciones_guardado
+    from instrumentacion import Cronometro
+    from motores import POLITICA_SECUENCIAL, aplicar_mascara, segmentar_auto
+    from refinado import escalar_mascara_guiada, reducir_para_inferencia
+
+    avisar = progreso or (lambda mensaje: None)
+    politica = politica or POLITICA_SECUENCIAL
+    destino = Path(destino)
+    a_video = destino.suffix.lower() in CODECS_CON_ALFA
+    if a_video and shutil.which("ffmpeg") is None:
+        # Fallar antes de inferir nada
+        raise RuntimeError("Para escribir vídeo con alfa hace falta ffmpeg; "
+                           "usa una carpeta de salida para obtener una secuencia PNG")
+    if not a_video:
+        destino.mkdir(parents=True, exist_ok=True)
+
+    resumen = {"fotogramas": 0, "inferidos": 0, "reutilizados": 0, "bytes": 0, "motores": {}}
+    escritos = []
+    codificador = None if a_video else CodificadorEnSegundoPlano(escritos.append)
+    cronometro = Cronometro(variante=politica)
+    propagador = PropagadorMascara()
+    salida_video = None
+    referencia = anterior = mask = None
+    desde_clave = 0
+    inicio = time.perf_counter()
+
+    try:
+        for nombre, rgb, alfa in leer_fotogramas(origen):
+            with cronometro.etapa("propagacion"):
+                miniatura = propagador.miniatura(rgb)
+                inferir = (
+                    referencia is None
+                    or miniatura.shape != referencia.shape
+                    or desde_clave >= intervalo_clave
+                    or propagador.diferencia(miniatura, referencia) > umbral
+                )
+                if not inferir:
+                    mask = propagador.propagar(mask, anterior, miniatura)
+                    desde_clave += 1
+                    resumen["reutilizados"] += 1
+
+            image = Image.fromarray(rgb)
+            if inferir:
+                with cronometro.etapa("inferencia"):
+                    reducida = reducir_para_inferencia(image, lado_inferencia)
+                    mask, motor = segmentar_auto(reducida, modelo, progreso, politica)
+                if reducida is not image:
+                    with cronometro.etapa("refinado"):
+                        mask = escalar_mascara_guiada(mask, image)
+                referencia, desde_clave = miniatura, 0
+                resumen["inferidos"] += 1
+                resumen["motores"][motor] = resumen["motores"].get(motor, 0) + 1
+            anterior = miniatura
+
+            with cronometro.etapa("composicion"):
+                # La máscara propagada no incluye la transparencia del origen: se combina en cada fotograma
+                output = aplicar_mascara(image, combinar_alfa(mask, alfa))
+            with cronometro.etapa("codificacion"):
+                if a_video:
+                    if salida_video is None:
+                        salida_video = SalidaVideo(destino, image.width, image.height, fps_de(origen))
+                    salida_video.escribir(np.asarray(output))
+                else:
+                    ruta = destino / f"{nombre}.png"
+                    codificador.enviar(output, ruta, opciones_guardado(ruta, nivel_png=nivel_png), {})
+
+            resumen["fotogramas"] += 1
+            if resumen["fotogramas"] % 25 == 0:
+                avisar(f"{resumen['fotogramas']} fotogramas ({resumen['inferidos']} inferidos)")
+    finally:
+        if codificador is not None:
+            codificador.cerrar()
+        if salida_video is not None:
+            salida_video.cerrar()
+
+    if a_video and destino.exists():
+        resumen["bytes"] = destino.stat().st_size
+    resumen["bytes"] += sum(datos.get("bytes", 0) for datos in escritos)
+    resumen["errores"] = sum(1 for datos in escritos if datos.get("estado") == "error")
+    resumen["segundos"] = time.perf_counter() - inicio
+    resumen["fotogramas_por_segundo"] = resumen["fotogramas"] / resumen["segundos"] if resumen["segundos"] else 0.0
+    resumen["etapas"] = dict(cronometro.tiempos)
+    avisar(f"Secuencia terminada: {resumen['fotogramas']} fotogramas, {resumen['inferidos']} inferidos y "
+           f"{resumen['reutilizados']} con la máscara propagada en {resumen['segundos']:.1f} s "
+           f"({resumen['fotogramas_por_segundo']:.2f} fps)")
+    return resumen
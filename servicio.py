@@ -0,0 +1,414 @@
+"""Servicio HTTP local de eliminación de fondo con cola acotada y micro-lotes.
+
+Permite usar el eliminador desde otras herramientas sin abrir la ventana. El
+servidor escucha solo en localhost (o en un socket Unix), mantiene las sesiones
+calientes y encola las imágenes recibidas. Un hilo de inferencia toma de la cola
+hasta max_lote peticiones del mismo modelo y, si el modelo lo admite, las
+segmenta en una sola ejecución de ONNX. Cuando la cola está llena el servidor
+responde 503 con Retry-After en lugar de acumular trabajo.
+
+Rutas:
+    POST /eliminar-fondo   cuerpo = bytes de la imagen; responde PNG
+                           parámetros: modelo, motor, lado, salida=imagen|mascara
+                           (png es sinónimo de imagen)
+    GET  /metricas         JSON con profundidad de cola, latencias y rendimiento
+    GET  /salud            JSON con el estado del motor
+"""
+import http.client
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from decodificacion import alfa_de_origen, combinar_alfa, decodificar
+from sesiones import MODELO_POR_DEFECTO, obtener_registro
+
+HOST_POR_DEFECTO = "127.0.0.1"
+PUERTO_POR_DEFECTO = 8765
+MAX_COLA = 32
+MAX_LOTE = 4
+# Tiempo máximo que la primera petición espera a que lleguen otras para formar lote
+ESPERA_LOTE = 0.01
+MAX_BYTES_PETICION = 64 * 2**20
+MUESTRAS_LATENCIA = 1000
+# Políticas que empiezan por rembg y pueden aprovechar la inferencia por lotes
+POLITICAS_CON_LOTES = ("secuencial", "rembg")
+
+
+class ColaLlena(Exception):
+    """La cola de peticiones está llena: el cliente debe reintentar más tarde"""
+
+
+def leer_parametros(consulta):
+    """Validar los parámetros de una petición; devuelve (modelo, politica, lado, salida) o lanza ValueError"""
+    from cargador import obtener_cargador
+    from motores import POLITICAS
+
+    parametros = {clave: valores[-1] for clave, valores in parse_qs(consulta).items()}
+    politica = parametros.get("motor") or None
+    if politica is not None and politica not in POLITICAS:
+        raise ValueError(f"motor debe ser uno de: {', '.join(POLITICAS)}")
+    modelo = parametros.get("modelo") or None
+    if modelo is not None and obtener_cargador().disponible("rembg"):
+        from sesiones import modelos_rembg
+
+        if modelo not in modelos_rembg():
+            raise ValueError(f"Modelo de rembg desconocido: {modelo}")
+    lado = parametros.get("lado") or None
+    if lado is not None:
+        try:
+            lado = int(lado)
+        except ValueError:
+            raise ValueError("lado debe ser un número entero de píxeles") from None
+        if lado < 1:
+            raise ValueError("lado debe ser mayor que 0")
+    salida = parametros.get("salida") or "imagen"
+    # "png" era el nombre documentado al principio: se acepta como sinónimo
+    salida = "imagen" if salida == "png" else salida
+    if salida not in ("imagen", "mascara"):
+        raise ValueError("salida debe ser imagen (o png) o mascara")
+    return modelo, politica, lado, salida
+
+
+class Peticion:
+    def __init__(self, image, modelo, politica, lado):
+        self.image = image
+        self.modelo = modelo
+        self.politica = politica
+        self.lado = lado
+        self.futuro = Future()
+        self.llegada = time.perf_counter()
+
+    @property
+    def clave_lote(self):
+        return (self.modelo, self.politica)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+class ServicioInferencia:
+    """Cola acotada de peticiones y un hilo que las segmenta en micro-lotes"""
+
+    def __init__(self, modelo=MODELO_POR_DEFECTO, politica="secuencial", max_cola=MAX_COLA,
+                 max_lote=MAX_LOTE, espera_lote=ESPERA_LOTE):
+        self.modelo = modelo
+        self.politica = politica
+        self.max_lote = max(1, max_lote)
+        self.espera_lote = espera_lote
+        self._cola = queue.Queue(maxsize=max_cola)
+        # Peticiones admitidas (desde antes de leer el cuerpo hasta responder): acota la
+        # memoria de las subidas y decodificaciones en curso, no solo la cola de inferencia
+        self._plazas = threading.BoundedSemaphore(max_cola)
+        # Petición sacada de la cola que no encajaba en el lote anterior
+        self._aplazada = None
+        self._candado = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._latencias = deque(maxlen=MUESTRAS_LATENCIA)
+        self._esperas = deque(maxlen=MUESTRAS_LATENCIA)
+        self._metricas = {"peticiones": 0, "completadas": 0, "rechazadas": 0, "errores": 0,
+                          "lotes": 0, "imagenes_en_lotes": 0}
+        self._hilo = threading.Thread(target=self._bucle, name="servicio-inferencia", daemon=True)
+        self._hilo.start()
+
+    def precalentar(self):
+        obtener_registro().precalentar(self.modelo, en_segundo_plano=False)
+
+    def reservar(self):
+        """Reservar plaza para una petición sin esperar; False si el servicio está lleno"""
+        if self._plazas.acquire(blocking=False):
+            return True
+        with self._candado:
+            self._metricas["rechazadas"] += 1
+        return False
+
+    def liberar(self):
+        self._plazas.release()
+
+    def enviar(self, image, modelo=None, politica=None, lado=None):
+        """Encolar una imagen; devuelve un Future con la máscara uint8 o lanza ColaLlena"""
+        peticion = Peticion(image, modelo or self.modelo, politica or self.politica, lado)
+        try:
+            self._cola.put_nowait(peticion)
+        except queue.Full:
+            with self._candado:
+                self._metricas["rechazadas"] += 1
+            raise ColaLlena(f"Cola llena ({self._cola.maxsize} peticiones)")
+        with self._candado:
+            self._metricas["peticiones"] += 1
+        return peticion.futuro
+
+    def _siguiente_lote(self):
+        """Bloquear hasta tener una petición y añadir las del mismo modelo que lleguen enseguida"""
+        primera, self._aplazada = self._aplazada, None
+        if primera is None:
+            primera = self._cola.get()
+        lote = [primera]
+        limite = time.perf_counter() + self.espera_lote
+        while len(lote) < self.max_lote and primera.politica in POLITICAS_CON_LOTES:
+            restante = limite - time.perf_counter()
+            try:
+                siguiente = self._cola.get(timeout=max(restante, 0)) if restante > 0 else self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if siguiente.clave_lote != primera.clave_lote:
+                self._aplazada = siguiente
+                break
+            lote.append(siguiente)
+        return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._siguiente_lote()
+            inicio = time.perf_counter()
+            for peticion in lote:
+                self._esperas.append(inicio - peticion.llegada)
+            try:
+                masks = self._segmentar(lote)
+            except Exception as e:
+                for peticion in lote:
+                    peticion.futuro.set_exception(e)
+                with self._candado:
+                    self._metricas["errores"] += len(lote)
+                continue
+            fin = time.perf_counter()
+            errores = sum(isinstance(resultado, Exception) for resultado in masks)
+            with self._candado:
+                self._metricas["lotes"] += 1
+                self._metricas["imagenes_en_lotes"] += len(lote)
+                self._metricas["completadas"] += len(lote) - errores
+                self._metricas["errores"] += errores
+                for peticion in lote:
+                    self._latencias.append(fin - peticion.llegada)
+            for peticion, resultado in zip(lote, masks):
+                if isinstance(resultado, Exception):
+                    peticion.futuro.set_exception(resultado)
+                else:
+                    peticion.futuro.set_result(resultado)
+
+    def _segmentar(self, lote):
+        """Devolver (máscara, motor) o la excepción de cada petición; el lote va a ONNX de una vez si se puede"""
+        from motores import obtener_selector, segmentar_auto
+        from refinado import escalar_mascara_guiada, reducir_para_inferencia
+
+        reducidas = [reducir_para_inferencia(p.image, p.lado) for p in lote]
+        masks = None
+        selector = obtener_selector()
+        interruptor = selector.interruptores["rembg"]
+        if len(lote) > 1 and selector.motores["rembg"].disponible() and interruptor.permite():
+            try:
+                masks = obtener_registro().inferir_lote(reducidas, lote[0].modelo)
+                motores = ["rembg"] * len(lote)
+                interruptor.exito()
+            except Exception as e:
+                # Si falla el lote, cada imagen sigue la cadena de motores por separado
+                print(f"Error en el lote de rembg: {e}")
+                interruptor.fallo()
+        if masks is None:
+            masks, motores = [], []
+            for peticion, reducida in zip(lote, reducidas):
+                try:
+                    mask, motor = segmentar_auto(reducida, peticion.modelo, None, peticion.politica)
+                except Exception as e:
+                    mask, motor = e, None
+                masks.append(mask)
+                motores.append(motor)
+        resultados = []
+        for peticion, reducida, mask, motor in zip(lote, reducidas, masks, motores):
+            if isinstance(mask, Exception):
+                resultados.append(mask)
+            elif reducida is not peticion.image:
+                resultados.append((escalar_mascara_guiada(mask, peticion.image), motor))
+            else:
+                resultados.append((mask, motor))
+        return resultados
+
+    def metricas(self):
+        with self._candado:
+            datos = dict(self._metricas)
+            latencias = list(self._latencias)
+            esperas = list(self._esperas)
+        segundos = time.perf_counter() - self._inicio
+        datos.update({
+            "profundidad_cola": self._cola.qsize(),
+            "max_cola": self._cola.maxsize,
+            "lote_medio": datos["imagenes_en_lotes"] / datos["lotes"] if datos["lotes"] else 0.0,
+            "latencia_p50": percentil(latencias, 0.5),
+            "latencia_p95": percentil(latencias, 0.95),
+            "espera_cola_media": sum(esperas) / len(esperas) if esperas else 0.0,
+            "imagenes_por_segundo": datos["completadas"] / segundos if segundos else 0.0,
+            "segundos_activo": segundos,
+            "sesiones": obtener_registro().metricas(),
+        })
+        return datos
+
+
+class ManejadorHTTP(BaseHTTPRequestHandler):
+    servicio = None
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # En un socket Unix client_address es una cadena vacía
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, codigo, cuerpo, tipo="application/json", cabeceras=None):
+        if isinstance(cuerpo, (dict, list)):
+            cuerpo = json.dumps(cuerpo, ensure_ascii=False).encode()
+        self.send_response(codigo)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        ruta = urlparse(self.path).path
+        if ruta == "/metricas":
+            self._responder(200, self.servicio.metricas())
+        elif ruta == "/salud":
+            from cargador import obtener_cargador
+
+            self._responder(200, {"estado": "ok", "rembg": obtener_cargador().estado("rembg")})
+        else:
+            self._responder(404, {"error": "Ruta desconocida"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/eliminar-fondo":
+            self._responder(404, {"error": "Ruta desconocida"})
+            return
+        try:
+            longitud = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            longitud = -1
+        if not 0 < longitud <= MAX_BYTES_PETICION:
+            self._rechazar(413 if longitud > 0 else 400, "Tamaño de imagen no válido")
+            return
+        try:
+            modelo, politica, lado, formato = leer_parametros(url.query)
+        except ValueError as e:
+            self._rechazar(400, str(e))
+            return
+        # Sin plaza se responde antes de leer el cuerpo: la carga no ocupa memoria
+        if not self.servicio.reservar():
+            self._rechazar(503, "Servicio ocupado, reintenta más tarde", {"Retry-After": "1"})
+            return
+        try:
+            self._procesar(longitud, modelo, politica, lado, formato)
+        finally:
+            self.servicio.liberar()
+
+    def _rechazar(self, codigo, error, cabeceras=None):
+        """Responder sin leer el cuerpo; la conexión se cierra porque el cuerpo queda sin consumir"""
+        self.close_connection = True
+        self._responder(codigo, {"error": error}, cabeceras={"Connection": "close", **(cabeceras or {})})
+
+    def _procesar(self, longitud, modelo, politica, lado, formato):
+        try:
+            # Orientación EXIF aplicada y modo RGB o RGBA (el alfa de origen se conserva)
+            image, _ = decodificar(io.BytesIO(self.rfile.read(longitud)))
+        except Exception as e:
+            self._responder(400, {"error": f"No se pudo leer la imagen: {e}"})
+            return
+
+        try:
+            mask, motor = self.servicio.enviar(image, modelo, politica, lado).result()
+        except ColaLlena as e:
+            self._responder(503, {"error": str(e)}, cabeceras={"Retry-After": "1"})
+            return
+        except Exception as e:
+            self._responder(500, {"error": str(e)})
+            return
+
+        from motores import aplicar_mascara, envolver_mascara, obtener_selector
+        from refinado import refinar_borde
+
+        if obtener_selector().refina_borde(motor):
+            mask = refinar_borde(mask, image)
+        mask = combinar_alfa(mask, alfa_de_origen(image))
+        salida = envolver_mascara(mask) if formato == "mascara" else aplicar_mascara(image, mask)
+        buffer = io.BytesIO()
+        salida.save(buffer, format="PNG")
+        self._responder(200, buffer.getvalue(), "image/png", {"X-Motor": motor})
+
+
+class ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        # Atributos que BaseHTTPRequestHandler espera de un servidor TCP
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def crear_servidor(servicio, host=HOST_POR_DEFECTO, puerto=PUERTO_POR_DEFECTO, ruta_socket=None):
+    """Servidor HTTP en localhost o, con ruta_socket, en un socket Unix"""
+    manejador = type("Manejador", (ManejadorHTTP,), {"servicio": servicio})
+    if ruta_socket:
+        return ServidorUnix(ruta_socket, manejador)
+    return ThreadingHTTPServer((host, puerto), manejador)
+
+
+def servir(modelo=MODELO_POR_DEFECTO, politica="secuencial", host=HOST_POR_DEFECTO,
+           puerto=PUERTO_POR_DEFECTO, ruta_socket=None, max_cola=MAX_COLA, max_lote=MAX_LOTE,
+           espera_lote=ESPERA_LOTE):
+    """Arrancar el servicio y atender peticiones hasta Ctrl+C"""
+    servicio = ServicioInferencia(modelo, politica, max_cola, max_lote, espera_lote)
+    print(f"Precalentando {modelo}...")
+    servicio.precalentar()
+    servidor = crear_servidor(servicio, host, puerto, ruta_socket)
+    print(f"Escuchando en {ruta_socket or f'http://{host}:{servidor.server_port}'}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        if ruta_socket and os.path.exists(ruta_socket):
+            os.unlink(ruta_socket)
+    return servicio.metricas()
+
+
+class ConexionUnix(http.client.HTTPConnection):
+    def __init__(self, ruta_socket, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.ruta_socket = ruta_socket
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.ruta_socket)
+
+
+def conectar(host=HOST_POR_DEFECTO, puerto=PUERTO_POR_DEFECTO, ruta_socket=None, timeout=300):
+    if ruta_socket:
+        return ConexionUnix(ruta_socket, timeout)
+    return http.client.HTTPConnection(host, puerto, timeout=timeout)
+
+
+def eliminar_fondo_remoto(datos, conexion, **parametros):
+    """Cliente mínimo: enviar los bytes de una imagen y devolver (estado, cuerpo, cabeceras)"""
+    consulta = "&".join(f"{clave}={valor}" for clave, valor in parametros.items() if valor is not None)
+    conexion.request("POST", "/eliminar-fondo" + (f"?{consulta}" if consulta else ""), body=datos,
+                     headers={"Content-Type": "application/octet-stream"})
+    respuesta = conexion.getresponse()
+    return respuesta.status, respuesta.read(), dict(respuesta.getheaders())
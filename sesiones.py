@@ -0,0 +1,381 @@
+"""Registro de sesiones de inferencia de rembg reutilizables durante todo el proceso.
+
+Crear una sesión de rembg implica cargar el modelo ONNX y construir la sesión de
+onnxruntime, algo que suele costar más que la propia inferencia. Este módulo
+mantiene las sesiones vivas, indexadas por modelo y opciones de proveedor, y
+las desaloja por LRU cuando hay demasiados modelos cargados a la vez.
+
+Las sesiones se crean con los AjustesOnnx del registro: hilos, modo de
+ejecución, nivel de optimización del grafo, caché del modelo ya optimizado y
+variante INT8 de los modelos U2-Net.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+MODELO_POR_DEFECTO = "u2net"
+MAX_SESIONES_POR_DEFECTO = 2
+# Sesiones de rembg con el preprocesado de U2-Net, que admiten inferencia por lotes
+SESIONES_CON_LOTES = ("U2netSession", "U2netpSession", "U2netHumanSegSession", "SiluetaSession",
+                      "U2netCustomSession")
+MEDIA_U2NET = (0.485, 0.456, 0.406)
+DESVIACION_U2NET = (0.229, 0.224, 0.225)
+# Modelos de rembg con el pre y posprocesado de U2-Net: se pueden cargar desde otro
+# archivo (cuantizado u optimizado) con la sesión u2net_custom
+MODELOS_U2NET = ("u2net", "u2netp", "u2net_human_seg", "silueta")
+MODOS_EJECUCION = ("secuencial", "paralelo")
+NIVELES_OPTIMIZACION = ("ninguna", "basica", "extendida", "todas")
+
+
+def directorio_modelos():
+    """Modelos cuantizados y optimizados, junto a la caché de resultados"""
+    from cache_resultados import directorio_por_defecto
+
+    return directorio_por_defecto() / "onnx"
+
+
+def ruta_modelo_original(model_name):
+    """Archivo ONNX de rembg para el modelo (lo descarga si aún no está)"""
+    from cargador import obtener_cargador
+
+    sesiones = obtener_cargador().modulo("rembg").sessions.sessions_class
+    for clase in sesiones:
+        if clase.name() == model_name:
+            return Path(clase.download_models())
+    raise ValueError(f"Modelo de rembg desconocido: {model_name}")
+
+
+def modelos_rembg():
+    """Modelos que rembg sabe cargar por su nombre (los *_custom necesitan una ruta)"""
+    from cargador import obtener_cargador
+
+    sesiones = obtener_cargador().modulo("rembg").sessions.sessions_class
+    return [clase.name() for clase in sesiones if not clase.name().endswith("_custom")]
+
+
+def cuantizar_modelo(origen, destino):
+    """Generar la variante INT8 (cuantización dinámica de los pesos) de un modelo ONNX"""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise RuntimeError("La variante INT8 necesita el paquete onnx (pip install onnx)") from e
+
+    destino = Path(destino)
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    temporal = destino.with_name(f".{destino.stem}.{os.getpid()}.tmp.onnx")
+    try:
+        quantize_dynamic(str(origen), str(temporal), weight_type=QuantType.QUInt8)
+        os.replace(temporal, destino)
+    finally:
+        if temporal.exists():
+            temporal.unlink()
+    return destino
+
+
+class AjustesOnnx:
+    """Opciones de onnxruntime con las que el registro crea las sesiones.
+
+    hilos_intra y hilos_inter a 0 toman OMP_NUM_THREADS si está definida (rembg
+    la copia en las opciones de la sesión) y, si no, el valor por defecto de
+    onnxruntime: todos los núcleos físicos. Los valores explícitos tienen
+    prioridad sobre OMP_NUM_THREADS. Con varios procesos, con_hilos() fija el
+    reparto de cada uno. modo es "secuencial" o
+    "paralelo" (los nodos independientes del grafo en varios hilos inter) y
+    optimizacion uno de NIVELES_OPTIMIZACION. Con cache_optimizado, el grafo
+    optimizado se guarda la primera vez y las siguientes sesiones lo cargan
+    sin volver a optimizar. int8 usa la variante cuantizada de los modelos
+    U2-Net, que se genera la primera vez (necesita el paquete onnx).
+    """
+
+    def __init__(self, hilos_intra=0, hilos_inter=0, modo="secuencial", optimizacion="todas",
+                 cache_optimizado=False, int8=False):
+        if modo not in MODOS_EJECUCION:
+            raise ValueError(f"Modo de ejecución desconocido: {modo}")
+        if optimizacion not in NIVELES_OPTIMIZACION:
+            raise ValueError(f"Nivel de optimización desconocido: {optimizacion}")
+        self.hilos_intra = max(0, int(hilos_intra))
+        self.hilos_inter = max(0, int(hilos_inter))
+        self.modo = modo
+        self.optimizacion = optimizacion
+        self.cache_optimizado = cache_optimizado
+        self.int8 = int8
+
+    def __repr__(self):
+        return (f"AjustesOnnx(hilos_intra={self.hilos_intra}, hilos_inter={self.hilos_inter}, "
+                f"modo={self.modo!r}, optimizacion={self.optimizacion!r}, "
+                f"cache_optimizado={self.cache_optimizado}, int8={self.int8})")
+
+    def __eq__(self, otro):
+        return isinstance(otro, AjustesOnnx) and vars(self) == vars(otro)
+
+    def con_hilos(self, hilos):
+        """Estos ajustes con hilos intra-operación por proceso si estaban a 0 (automático)"""
+        if self.hilos_intra:
+            return self
+        return AjustesOnnx(hilos, self.hilos_inter or 1, self.modo, self.optimizacion,
+                           self.cache_optimizado, self.int8)
+
+    def opciones_sesion(self):
+        """onnxruntime.SessionOptions con estos ajustes"""
+        import onnxruntime as ort
+
+        opciones = ort.SessionOptions()
+        opciones.intra_op_num_threads = self.hilos_intra
+        opciones.inter_op_num_threads = self.hilos_inter
+        opciones.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if self.modo == "paralelo"
+                                   else ort.ExecutionMode.ORT_SEQUENTIAL)
+        opciones.graph_optimization_level = {
+            "ninguna": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basica": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extendida": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "todas": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }[self.optimizacion]
+        return opciones
+
+    def nombre_variante(self, model_name):
+        """Nombre del modelo que distingue la variante INT8 (p. ej. en la caché de resultados)"""
+        if self.int8 and model_name in MODELOS_U2NET:
+            return f"{model_name}.int8"
+        return model_name
+
+    def ruta_modelo(self, model_name):
+        """Archivo a cargar para un modelo U2-Net: el original o su variante INT8"""
+        original = ruta_modelo_original(model_name)
+        if not self.int8:
+            return original
+        cuantizado = directorio_modelos() / f"{model_name}.int8.onnx"
+        if not cuantizado.exists():
+            cuantizar_modelo(original, cuantizado)
+        return cuantizado
+
+    def ruta_optimizado(self, ruta_modelo):
+        """Grafo optimizado en caché: depende del nivel, de la versión y de la máquina"""
+        import onnxruntime as ort
+
+        return directorio_modelos() / f"{Path(ruta_modelo).stem}.{self.optimizacion}.ort{ort.__version__}.onnx"
+
+
+class RegistroSesiones:
+    """Caché LRU de sesiones de rembg con métricas de carga e inferencia"""
+
+    def __init__(self, max_sesiones=MAX_SESIONES_POR_DEFECTO, ajustes=None):
+        self.max_sesiones = max(1, int(max_sesiones))
+        self.ajustes = ajustes or AjustesOnnx()
+        self._sesiones = OrderedDict()
+        self._candado = threading.Lock()
+        # Un candado por clave para que dos hilos no carguen el mismo modelo a la vez
+        self._candados_carga = {}
+        self._metricas = {
+            "cargas": 0,
+            "tiempo_carga": 0.0,
+            "inferencias": 0,
+            "tiempo_inferencia": 0.0,
+            "aciertos": 0,
+            "fallos": 0,
+            "desalojos": 0,
+        }
+
+    def configurar(self, ajustes):
+        """Cambiar los ajustes de onnxruntime; las sesiones cargadas se descartan si cambian"""
+        with self._candado:
+            if ajustes == self.ajustes:
+                return
+            self.ajustes = ajustes
+            self._sesiones.clear()
+
+    def _crear(self, new_session, model_name, providers, opciones):
+        """Crear una sesión con los ajustes actuales (tiempo de carga incluido)"""
+        ajustes = self.ajustes
+        argumentos = dict(opciones)
+        if providers:
+            argumentos["providers"] = list(providers)
+        sess_opts = ajustes.opciones_sesion()
+        if model_name not in MODELOS_U2NET or not (ajustes.int8 or ajustes.cache_optimizado):
+            return new_session(model_name, sess_opts=sess_opts, **argumentos)
+
+        ruta = ajustes.ruta_modelo(model_name)
+        temporal = optimizado = None
+        if ajustes.cache_optimizado:
+            optimizado = ajustes.ruta_optimizado(ruta)
+            if optimizado.exists():
+                import onnxruntime as ort
+
+                ruta = optimizado
+                sess_opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            else:
+                optimizado.parent.mkdir(parents=True, exist_ok=True)
+                temporal = optimizado.with_name(f".{optimizado.stem}.{os.getpid()}.tmp.onnx")
+                sess_opts.optimized_model_filepath = str(temporal)
+        try:
+            # u2net_custom aplica el mismo pre y posprocesado que toda la familia U2-Net
+            sesion = new_session("u2net_custom", sess_opts=sess_opts, model_path=str(ruta), **argumentos)
+            if temporal is not None and temporal.exists():
+                os.replace(temporal, optimizado)
+        finally:
+            if temporal is not None and temporal.exists():
+                temporal.unlink()
+        return sesion
+
+    @staticmethod
+    def _clave(model_name, providers, opciones):
+        proveedores = tuple(providers) if providers else ()
+        extras = tuple(sorted((k, repr(v)) for k, v in opciones.items()))
+        return (model_name, proveedores, extras)
+
+    def obtener(self, model_name=MODELO_POR_DEFECTO, providers=None, **opciones):
+        """Devolver la sesión para el modelo indicado, cargándola si hace falta"""
+        clave = self._clave(model_name, providers, opciones)
+
+        with self._candado:
+            sesion = self._sesiones.get(clave)
+            if sesion is not None:
+                self._sesiones.move_to_end(clave)
+                self._metricas["aciertos"] += 1
+                return sesion
+            candado_carga = self._candados_carga.setdefault(clave, threading.Lock())
+
+        with candado_carga:
+            # Otro hilo pudo haber terminado la carga mientras esperábamos
+            with self._candado:
+                sesion = self._sesiones.get(clave)
+                if sesion is not None:
+                    self._sesiones.move_to_end(clave)
+                    self._metricas["aciertos"] += 1
+                    return sesion
+
+            from cargador import obtener_cargador
+
+            new_session = obtener_cargador().modulo("rembg").new_session
+            inicio = time.perf_counter()
+            sesion = self._crear(new_session, model_name, providers, opciones)
+            duracion = time.perf_counter() - inicio
+
+            with self._candado:
+                self._sesiones[clave] = sesion
+                self._metricas["cargas"] += 1
+                self._metricas["fallos"] += 1
+                self._metricas["tiempo_carga"] += duracion
+                while len(self._sesiones) > self.max_sesiones:
+                    self._sesiones.popitem(last=False)
+                    self._metricas["desalojos"] += 1
+                self._candados_carga.pop(clave, None)
+
+            return sesion
+
+    def inferir(self, image, model_name=MODELO_POR_DEFECTO, providers=None, **kwargs):
+        """Ejecutar rembg.remove con una sesión reutilizada y medir la inferencia"""
+        from cargador import obtener_cargador
+
+        remove = obtener_cargador().modulo("rembg").remove
+        sesion = self.obtener(model_name, providers)
+        inicio = time.perf_counter()
+        resultado = remove(image, session=sesion, **kwargs)
+        self.registrar_inferencia(time.perf_counter() - inicio)
+        return resultado
+
+    @staticmethod
+    def admite_lotes(sesion):
+        """Indicar si la sesión puede ejecutar varias imágenes en una sola llamada a ONNX.
+
+        Solo la familia U2-Net comparte el preprocesado fijo a 320x320 y una
+        dimensión de lote dinámica; el resto de modelos se ejecuta imagen a imagen.
+        """
+        if type(sesion).__name__ not in SESIONES_CON_LOTES:
+            return False
+        dimension_lote = sesion.inner_session.get_inputs()[0].shape[0]
+        return not isinstance(dimension_lote, int)
+
+    def inferir_lote(self, images, model_name=MODELO_POR_DEFECTO, providers=None):
+        """Máscaras uint8 de varias imágenes con una sola ejecución de ONNX si el modelo lo admite"""
+        import numpy as np
+        from PIL import Image
+
+        sesion = self.obtener(model_name, providers)
+        if len(images) == 1 or not self.admite_lotes(sesion):
+            return [np.asarray(self.inferir(image, model_name, providers, only_mask=True)) for image in images]
+
+        inicio = time.perf_counter()
+        # Mismo preprocesado y posprocesado que U2netSession.predict, pero apilando el lote
+        entradas = [sesion.normalize(image, MEDIA_U2NET, DESVIACION_U2NET, (320, 320)) for image in images]
+        nombre = next(iter(entradas[0]))
+        salida = sesion.inner_session.run(None, {nombre: np.concatenate([e[nombre] for e in entradas])})[0]
+        masks = []
+        for image, pred in zip(images, salida[:, 0, :, :]):
+            pred = (pred - pred.min()) / max(pred.max() - pred.min(), 1e-6)
+            mask = Image.fromarray((pred.clip(0, 1) * 255).astype(np.uint8))
+            masks.append(np.asarray(mask.resize(image.size, Image.Resampling.LANCZOS)))
+        duracion = time.perf_counter() - inicio
+        with self._candado:
+            self._metricas["inferencias"] += len(images)
+            self._metricas["tiempo_inferencia"] += duracion
+        return masks
+
+    def registrar_inferencia(self, duracion):
+        """Acumular el tiempo de una inferencia hecha fuera de inferir()"""
+        with self._candado:
+            self._metricas["inferencias"] += 1
+            self._metricas["tiempo_inferencia"] += duracion
+
+    def precalentar(self, model_name=MODELO_POR_DEFECTO, providers=None, en_segundo_plano=True):
+        """Cargar el modelo y hacer una inferencia mínima para tenerlo listo"""
+
+        def _precalentar():
+            try:
+                from PIL import Image
+
+                sesion = self.obtener(model_name, providers)
+                # La primera ejecución reserva la memoria interna de onnxruntime
+                sesion.predict(Image.new("RGB", (64, 64)))
+            except Exception as e:
+                print(f"Error precalentando {model_name}: {e}")
+
+        if not en_segundo_plano:
+            _precalentar()
+            return None
+
+        hilo = threading.Thread(target=_precalentar, name=f"precalentar-{model_name}", daemon=True)
+        hilo.start()
+        return hilo
+
+    def cargado(self, model_name=MODELO_POR_DEFECTO, providers=None, **opciones):
+        """Indicar si el modelo ya está en memoria sin provocar su carga"""
+        with self._candado:
+            return self._clave(model_name, providers, opciones) in self._sesiones
+
+    def descargar(self):
+        """Liberar todas las sesiones cargadas"""
+        with self._candado:
+            self._sesiones.clear()
+
+    def metricas(self):
+        """Copia de los contadores con el número de sesiones cargadas"""
+        with self._candado:
+            datos = dict(self._metricas)
+            datos["sesiones_cargadas"] = [clave[0] for clave in self._sesiones]
+            datos["ajustes_onnx"] = repr(self.ajustes)
+        return datos
+
+    def resumen(self):
+        """Texto breve con el tiempo de carga frente al de inferencia"""
+        m = self.metricas()
+        media = m["tiempo_inferencia"] / m["inferencias"] if m["inferencias"] else 0.0
+        return (
+            f"Carga de modelos: {m['cargas']} ({m['tiempo_carga']:.2f} s) | "
+            f"Inferencias: {m['inferencias']} ({m['tiempo_inferencia']:.2f} s, {media:.2f} s/img) | "
+            f"Reutilizadas: {m['aciertos']} | Desalojadas: {m['desalojos']}"
+        )
+
+
+_registro = None
+_candado_registro = threading.Lock()
+
+
+def obtener_registro():
+    """Registro de sesiones compartido por todo el proceso"""
+    global _registro
+    with _candado_registro:
+        if _registro is None:
+            _registro = RegistroSesiones()
+        return _registro
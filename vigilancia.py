@@ -0,0 +1,238 @@
+"""Modo vigilancia: procesar las imágenes que llegan a una carpeta compartida.
+
+La carpeta de entrada se recorre cada pocos segundos con os.scandir (sin
+dependencias y válido también en carpetas de red, donde las notificaciones del
+sistema no siempre llegan). Un archivo nuevo o modificado solo se procesa
+cuando su tamaño y su fecha no han cambiado durante al menos espera segundos,
+para no leer fotos que aún se están copiando.
+
+Lo ya procesado se anota en un índice en la carpeta de salida (JSON lines con
+ruta, tamaño, mtime, hash del contenido y huella de los parámetros). Al
+reiniciar, los archivos cuyo tamaño y mtime coinciden con el índice se saltan
+sin leerlos; si solo cambia la fecha, el hash evita reprocesar una copia
+idéntica. Cambiar los parámetros (formato, fondo, motor...) invalida las
+entradas anteriores.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from codificacion import FORMATO_PNG, FORMATOS_MASCARA
+from lote import ruta_salida_para
+from remover_fondo import EXTENSIONES_IMAGEN, procesar_imagen
+from motores import POLITICA_SECUENCIAL, obtener_selector
+from sesiones import MODELO_POR_DEFECTO, obtener_registro
+
+NOMBRE_INDICE = ".remover_fondo_indice.jsonl"
+# Segundos entre dos recorridos de la carpeta
+INTERVALO_VIGILANCIA = 2.0
+# Segundos que un archivo debe quedarse igual (tamaño y fecha) antes de procesarlo
+ESPERA_ESTABLE = 2.0
+BLOQUE_HASH = 1 << 20
+
+
+def hash_archivo(ruta):
+    """Hash del contenido del archivo, leído por bloques"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(ruta, "rb") as f:
+        while bloque := f.read(BLOQUE_HASH):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def huella_parametros(parametros):
+    """Resumen corto de los parámetros de procesado para guardarlo en cada entrada"""
+    datos = json.dumps(parametros, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(datos, digest_size=8).hexdigest()
+
+
+class IndiceProcesados:
+    """Índice en disco de los archivos ya procesados.
+
+    Se guarda como JSON lines en modo añadir: cada cambio es una línea y la
+    última entrada de cada ruta es la vigente. Al abrirlo, si las líneas
+    obsoletas superan a las vigentes, se reescribe compactado.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.entradas = {}
+        lineas = 0
+        if self.ruta.exists():
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        # Última línea truncada por una caída: se ignora
+                        continue
+                    lineas += 1
+                    if entrada.get("borrado"):
+                        self.entradas.pop(entrada["ruta"], None)
+                    else:
+                        self.entradas[entrada["ruta"]] = entrada
+        if lineas > 2 * len(self.entradas) + 100:
+            self.compactar()
+        self._archivo = open(self.ruta, "a", encoding="utf-8")
+
+    def _escribir(self, entrada):
+        self._archivo.write(json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._archivo.flush()
+
+    def vigente(self, ruta, tamano, mtime_ns, parametros):
+        """Indicar si la entrada coincide en tamaño, fecha y parámetros (sin leer el archivo)"""
+        entrada = self.entradas.get(ruta)
+        return (entrada is not None and entrada["tamano"] == tamano
+                and entrada["mtime"] == mtime_ns and entrada["parametros"] == parametros)
+
+    def mismo_contenido(self, ruta, hash_contenido, parametros):
+        entrada = self.entradas.get(ruta)
+        return (entrada is not None and entrada["hash"] == hash_contenido
+                and entrada["parametros"] == parametros)
+
+    def registrar(self, ruta, tamano, mtime_ns, hash_contenido, parametros, estado="ok", destino=None):
+        entrada = {"ruta": ruta, "tamano": tamano, "mtime": mtime_ns, "hash": hash_contenido,
+                   "parametros": parametros, "estado": estado}
+        if destino:
+            entrada["destino"] = destino
+        self.entradas[ruta] = entrada
+        self._escribir(entrada)
+
+    def olvidar(self, ruta):
+        if self.entradas.pop(ruta, None) is not None:
+            self._escribir({"ruta": ruta, "borrado": True})
+
+    def compactar(self):
+        """Reescribir el índice solo con las entradas vigentes, de forma atómica"""
+        temporal = self.ruta.with_name(f".{self.ruta.name}.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            for entrada in self.entradas.values():
+                f.write(json.dumps(entrada, ensure_ascii=False, separators=(",", ":")) + "\n")
+        os.replace(temporal, self.ruta)
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+def recorrer(directorio, excluir=None):
+    """Generar (ruta, stat) de las imágenes de la carpeta y sus subcarpetas.
+
+    Se saltan los archivos y carpetas ocultos (los temporales de guardar_atomico
+    y de muchas herramientas de copia empiezan por punto) y la carpeta excluir.
+    """
+    pendientes = [Path(directorio)]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with os.scandir(actual) as entradas:
+                for entrada in entradas:
+                    if entrada.name.startswith("."):
+                        continue
+                    if entrada.is_dir(follow_symlinks=False):
+                        if excluir is None or Path(entrada.path).resolve() != excluir:
+                            pendientes.append(Path(entrada.path))
+                    elif Path(entrada.name).suffix.lower() in EXTENSIONES_IMAGEN:
+                        try:
+                            yield Path(entrada.path), entrada.stat()
+                        except FileNotFoundError:
+                            continue
+        except (FileNotFoundError, PermissionError):
+            continue
+
+
+def vigilar(dir_entrada, dir_salida, modelo=MODELO_POR_DEFECTO, politica=None, formato=FORMATO_PNG,
+            calidad=95, lado_inferencia=None, fondo=None, descontaminar=False, recortar=False,
+            margen=None, nivel_png=None, presupuesto_memoria=None, lado_salida=None, intervalo=INTERVALO_VIGILANCIA, espera=ESPERA_ESTABLE,
+            una_vez=False, progreso=print):
+    """Procesar las imágenes nuevas o modificadas de dir_entrada en dir_salida.
+
+    Sigue vigilando hasta Ctrl+C; con una_vez sale en cuanto no queda nada
+    pendiente. Cada imagen pasa por procesar_imagen, el mismo camino que usan
+    la interfaz y el modo por lotes, con la estructura de carpetas y los
+    sufijos del lote. Devuelve un resumen con procesadas, saltadas (ya en el
+    índice), sin_cambios (fecha nueva, mismo contenido), errores y segundos.
+    """
+    dir_entrada = Path(dir_entrada).resolve()
+    dir_salida = Path(dir_salida).resolve()
+    dir_salida.mkdir(parents=True, exist_ok=True)
+    parametros = huella_parametros({
+        "modelo": obtener_registro().ajustes.nombre_variante(modelo), "politica": politica,
+        "formato": formato, "calidad": calidad, "lado_inferencia": lado_inferencia, "fondo": fondo,
+        "descontaminar": descontaminar, "recortar": recortar, "margen": margen, "nivel_png": nivel_png,
+        "lado_salida": lado_salida, "refinar_borde": obtener_selector().motores_con_borde(),
+        "ajustes_motores": obtener_selector().parametros_mascara(politica or POLITICA_SECUENCIAL),
+    })
+    indice = IndiceProcesados(dir_salida / NOMBRE_INDICE)
+    resumen = {"procesadas": 0, "saltadas": 0, "sin_cambios": 0, "errores": 0, "segundos": 0.0}
+    # Archivos vistos con cambios: ruta -> (tamaño, mtime, instante en que se vieron así)
+    candidatos = {}
+    primer_recorrido = True
+    inicio = time.perf_counter()
+    progreso(f"Vigilando {dir_entrada} → {dir_salida} ({len(indice.entradas)} ya en el índice)")
+
+    try:
+        while True:
+            ahora = time.time()
+            vistos = set()
+            listos = []
+            for ruta, stat in recorrer(dir_entrada, excluir=dir_salida):
+                relativa = ruta.relative_to(dir_entrada).as_posix()
+                vistos.add(relativa)
+                firma = (stat.st_size, stat.st_mtime_ns)
+                if indice.vigente(relativa, *firma, parametros):
+                    candidatos.pop(relativa, None)
+                    resumen["saltadas"] += primer_recorrido
+                    continue
+                previo = candidatos.get(relativa)
+                if previo is None or previo[:2] != firma:
+                    candidatos[relativa] = firma + (ahora,)
+                elif ahora - previo[2] >= espera and ahora - stat.st_mtime_ns / 1e9 >= espera:
+                    listos.append((ruta, relativa, firma))
+
+            primer_recorrido = False
+            # Los borrados de la carpeta de entrada salen del índice
+            for relativa in set(indice.entradas) - vistos:
+                indice.olvidar(relativa)
+
+            for ruta, relativa, (tamano, mtime_ns) in listos:
+                del candidatos[relativa]
+                destino = ruta_salida_para(ruta, dir_entrada, dir_salida, formato)
+                try:
+                    contenido = hash_archivo(ruta)
+                except OSError as e:
+                    progreso(f"No se pudo leer {relativa}: {e}")
+                    continue
+                if indice.mismo_contenido(relativa, contenido, parametros) and destino.exists():
+                    # Misma imagen con otra fecha (copiada de nuevo o tocada): no se repite
+                    indice.registrar(relativa, tamano, mtime_ns, contenido, parametros, destino=str(destino))
+                    resumen["sin_cambios"] += 1
+                    continue
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    resultado = procesar_imagen(ruta, destino, modelo, calidad, lado_inferencia=lado_inferencia,
+                                                presupuesto_memoria=presupuesto_memoria, lado_salida=lado_salida,
+                                                politica=politica, solo_mascara=formato in FORMATOS_MASCARA,
+                                                nivel_png=nivel_png, fondo=fondo, descontaminar=descontaminar,
+                                                recortar=recortar, margen=margen)
+                except Exception as e:
+                    # Se anota para no reintentar en bucle; se volverá a probar si el archivo cambia
+                    indice.registrar(relativa, tamano, mtime_ns, contenido, parametros, estado="error")
+                    resumen["errores"] += 1
+                    progreso(f"❌ {relativa}: {e}")
+                    continue
+                indice.registrar(relativa, tamano, mtime_ns, contenido, parametros, destino=str(destino))
+                resumen["procesadas"] += 1
+                progreso(f"✅ {relativa} → {destino.name} ({resultado['motor']}, {resultado['segundos']:.1f} s)")
+
+            if una_vez and not candidatos:
+                break
+            time.sleep(min(intervalo, espera) if candidatos else intervalo)
+    except KeyboardInterrupt:
+        progreso("Vigilancia detenida")
+    finally:
+        indice.cerrar()
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    return resumen
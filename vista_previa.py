@@ -0,0 +1,157 @@
+"""Decodificación de vistas previas fuera del hilo de la interfaz.
+
+Las imágenes se decodifican directamente a tamaño de vista previa (escalado DCT
+de JPEG con draft y reducción entera con thumbnail), así nunca se generan los
+píxeles a resolución completa. Las miniaturas recientes se guardan en un LRU en
+memoria para que volver a seleccionar un archivo sea instantáneo.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+from PyQt6.QtCore import QThread, pyqtSignal
+from PyQt6.QtGui import QImage
+
+# Dimensiones máximas seguras (un poco menos que el contenedor de 850x250)
+MAX_ANCHO_PREVIEW = 820
+MAX_ALTO_PREVIEW = 230
+MAX_MINIATURAS = 32
+
+
+def decodificar_miniatura(ruta, max_ancho=MAX_ANCHO_PREVIEW, max_alto=MAX_ALTO_PREVIEW):
+    """Abrir la imagen produciendo solo los píxeles necesarios para la vista previa"""
+    with Image.open(ruta) as img:
+        # En JPEG, draft elige la mayor reducción DCT (1/2, 1/4, 1/8) que no baje del tamaño pedido
+        img.draft('RGB', (max_ancho, max_alto))
+        # Respetar la orientación EXIF para que las fotos del móvil no salgan giradas
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_ancho, max_alto), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return img.convert('RGBA')
+
+
+def a_qimage(img):
+    """QImage independiente del buffer de PIL (se puede pasar entre hilos)"""
+    data = img.tobytes("raw", "RGBA")
+    return QImage(data, img.width, img.height, 4 * img.width, QImage.Format.Format_RGBA8888).copy()
+
+
+class CacheMiniaturas:
+    """LRU en memoria de vistas previas ya decodificadas"""
+
+    def __init__(self, capacidad=MAX_MINIATURAS):
+        self.capacidad = capacidad
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    @staticmethod
+    def clave(ruta, max_ancho=MAX_ANCHO_PREVIEW, max_alto=MAX_ALTO_PREVIEW):
+        """La fecha y el tamaño del archivo invalidan la entrada si el archivo cambia"""
+        estado = os.stat(ruta)
+        return (os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size, max_ancho, max_alto)
+
+    def obtener(self, clave):
+        with self._candado:
+            q_image = self._entradas.get(clave)
+            if q_image is not None:
+                self._entradas.move_to_end(clave)
+            return q_image
+
+    def guardar(self, clave, q_image):
+        with self._candado:
+            self._entradas[clave] = q_image
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+
+class CargaVistaPreviaWorker(QThread):
+    """Decodifica la miniatura en segundo plano y la deja en la caché"""
+    lista = pyqtSignal(str, QImage)
+    error = pyqtSignal(str, str)
+
+    def __init__(self, ruta, cache, max_ancho=MAX_ANCHO_PREVIEW, max_alto=MAX_ALTO_PREVIEW):
+        super().__init__()
+        self.ruta = ruta
+        self.cache = cache
+        self.max_ancho = max_ancho
+        self.max_alto = max_alto
+
+    def run(self):
+        try:
+            clave = CacheMiniaturas.clave(self.ruta, self.max_ancho, self.max_alto)
+            q_image = a_qimage(decodificar_miniatura(self.ruta, self.max_ancho, self.max_alto))
+            self.cache.guardar(clave, q_image)
+            self.lista.emit(self.ruta, q_image)
+        except Exception as e:
+            self.error.emit(self.ruta, str(e))
+
+
+# Lado mayor de la imagen con la que se calcula la vista previa del resultado.
+# rembg trabaja internamente a 320 px, así que la máscara sirve después para el guardado final.
+LADO_PREVIEW_RESULTADO = 512
+TAMANO_CUADRO = 10
+
+
+def componer_sobre_cuadricula(img, mask, tamano_cuadro=TAMANO_CUADRO):
+    """Componer la imagen recortada sobre un fondo de cuadros grises y blancos"""
+    import numpy as np
+
+    rgb = np.asarray(img.convert('RGB'), dtype=np.float32)
+    alto, ancho = mask.shape
+    filas = (np.arange(alto) // tamano_cuadro)[:, None]
+    columnas = (np.arange(ancho) // tamano_cuadro)[None, :]
+    cuadros = np.where((filas + columnas) % 2 == 0, 255, 204).astype(np.float32)[:, :, None]
+    alpha = mask.astype(np.float32)[:, :, None] / 255.0
+    compuesta = rgb * alpha + cuadros * (1.0 - alpha)
+    return Image.fromarray(compuesta.astype(np.uint8)).convert('RGBA')
+
+
+class PreviewResultadoWorker(QThread):
+    """Segmenta una copia pequeña de la imagen para previsualizar el resultado.
+
+    Se puede cancelar: entre etapas se comprueba la bandera y, si el usuario ya
+    pidió otra vista previa, el trabajo termina sin emitir nada.
+    """
+    lista = pyqtSignal(int, QImage, object, str)
+    error = pyqtSignal(int, str)
+
+    def __init__(self, trabajo, ruta, modelo=None, politica=None, lado=LADO_PREVIEW_RESULTADO,
+                 max_ancho=MAX_ANCHO_PREVIEW, max_alto=MAX_ALTO_PREVIEW):
+        super().__init__()
+        self.trabajo = trabajo
+        self.ruta = ruta
+        self.modelo = modelo
+        self.politica = politica
+        self.lado = lado
+        self.max_ancho = max_ancho
+        self.max_alto = max_alto
+        self.cancelado = False
+
+    def cancelar(self):
+        self.cancelado = True
+
+    def run(self):
+        try:
+            from motores import POLITICA_SECUENCIAL, segmentar_auto
+            from sesiones import MODELO_POR_DEFECTO
+
+            from decodificacion import alfa_de_origen, combinar_alfa, decodificar
+
+            # La misma decodificación que el procesado completo (orientación EXIF incluida),
+            # para que la máscara que se reutiliza después coincida con la imagen final
+            img, _ = decodificar(self.ruta, self.lado)
+            if self.cancelado:
+                return
+
+            mask, motor = segmentar_auto(img, self.modelo or MODELO_POR_DEFECTO, None,
+                                         self.politica or POLITICA_SECUENCIAL)
+            if self.cancelado:
+                return
+
+            compuesta = componer_sobre_cuadricula(img, combinar_alfa(mask, alfa_de_origen(img)))
+            compuesta.thumbnail((self.max_ancho, self.max_alto), Image.Resampling.LANCZOS)
+            self.lista.emit(self.trabajo, a_qimage(compuesta), mask, motor)
+        except Exception as e:
+            if not self.cancelado:
+                self.error.emit(self.trabajo, str(e))